@@ -3,14 +3,50 @@ from __future__ import annotations
 
 import logging
 from .python_eq3bt.eq3bt.eq3btsmart import Thermostat
+from .python_eq3bt.eq3bt.retrypolicy import RetryPolicy
+from .python_eq3bt.eq3bt.scheduler import ConnectionScheduler
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.event import async_track_time_interval
 
 from . import config_flow
 from .python_eq3bt import eq3bt as eq3  # pylint: disable=import-error
-from .const import DOMAIN
+from .const import (
+    CONF_COOLDOWN,
+    CONF_EVENT_INTERVAL,
+    CONF_FAILURE_THRESHOLD,
+    CONF_IDLE_TIMEOUT,
+    CONF_POLL_CEILING,
+    CONF_POLL_FLOOR,
+    CONF_PUSH_MODE,
+    CONF_REQUEST_DEADLINE,
+    CONF_RETRIES,
+    CONF_STARTUP_WINDOW,
+    DATA_COORDINATOR,
+    DATA_SCHEDULER,
+    DATA_STARTUP,
+    DATA_STORAGE,
+    DEVICE_ID_MAX_AGE,
+    DEFAULT_COOLDOWN,
+    DEFAULT_EVENT_INTERVAL,
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_IDLE_TIMEOUT,
+    DEFAULT_POLL_CEILING,
+    DEFAULT_POLL_FLOOR,
+    DEFAULT_PUSH_MODE,
+    DEFAULT_REQUEST_DEADLINE,
+    DEFAULT_RETRIES,
+    DEFAULT_STARTUP_WINDOW,
+    DOMAIN,
+    SCHEDULE_MAX_AGE,
+    SCHEDULE_REFRESH_INTERVAL,
+)
+from .coordinator import ThermostatCoordinator
+from .startup import StartupPlanner
+from .storage import ThermostatStorage
 
 PLATFORMS = [
     Platform.CLIMATE,
@@ -29,17 +65,129 @@ _LOGGER = logging.getLogger(__name__)
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Hello World from a config entry."""
 
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    # all thermostats share the connection slots of the adapters and proxies
+    scheduler = domain_data.setdefault(DATA_SCHEDULER, ConnectionScheduler())
+
     # Store an instance of the "connecting" class that does the work of speaking
     # with your actual devices.
-    thermostat = Thermostat(entry.data["mac"], entry.data["name"], hass)
-    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = thermostat
+    thermostat = Thermostat(
+        entry.data["mac"],
+        entry.data["name"],
+        hass,
+        idle_timeout=entry.options.get(CONF_IDLE_TIMEOUT, DEFAULT_IDLE_TIMEOUT),
+        push_mode=entry.options.get(CONF_PUSH_MODE, DEFAULT_PUSH_MODE),
+        retry_policy=RetryPolicy(
+            deadline=entry.options.get(CONF_REQUEST_DEADLINE, DEFAULT_REQUEST_DEADLINE),
+            max_attempts=entry.options.get(CONF_RETRIES, DEFAULT_RETRIES),
+            failure_threshold=entry.options.get(
+                CONF_FAILURE_THRESHOLD, DEFAULT_FAILURE_THRESHOLD
+            ),
+            cooldown=entry.options.get(CONF_COOLDOWN, DEFAULT_COOLDOWN),
+        ),
+        scheduler=scheduler,
+        min_event_interval=entry.options.get(
+            CONF_EVENT_INTERVAL, DEFAULT_EVENT_INTERVAL
+        ),
+    )
+    domain_data[entry.entry_id] = thermostat
+    coordinator = ThermostatCoordinator(
+        hass,
+        thermostat,
+        poll_floor=entry.options.get(CONF_POLL_FLOOR, DEFAULT_POLL_FLOOR),
+        poll_ceiling=entry.options.get(CONF_POLL_CEILING, DEFAULT_POLL_CEILING),
+    )
+    domain_data.setdefault(DATA_COORDINATOR, {})[entry.entry_id] = coordinator
+    storage = ThermostatStorage(hass, thermostat, coordinator)
+    await storage.async_load()
+    domain_data.setdefault(DATA_STORAGE, {})[entry.entry_id] = storage
+
+    async def refresh_schedule(now=None):
+        """Query the day programs that are missing or too old."""
+        try:
+            days = await thermostat.async_refresh_schedule(
+                SCHEDULE_MAX_AGE.total_seconds()
+            )
+        except Exception as ex:
+            _LOGGER.warning("[%s] Schedule refresh failed: %s", thermostat.name, ex)
+        else:
+            _LOGGER.debug("[%s] Refreshed schedule of days %s", thermostat.name, days)
+
+    def show_device_id():
+        """Show the firmware version on the device, if it is registered."""
+        device_registry = dr.async_get(hass)
+        device = device_registry.async_get_device(
+            identifiers={(DOMAIN, thermostat.mac)},
+        )
+        if device:
+            device_registry.async_update_device(
+                device_id=device.id, sw_version=thermostat.firmware_version
+            )
+
+    async def query_device_id():
+        """Query the firmware version and serial and show them on the device."""
+        try:
+            await thermostat.async_query_id()
+        except Exception as ex:
+            _LOGGER.warning(
+                "[%s] Querying the device id failed: %s", thermostat.name, ex
+            )
+            return
+        show_device_id()
+        _LOGGER.debug(
+            "[%s] firmware: %s serial: %s",
+            thermostat.name,
+            thermostat.firmware_version,
+            thermostat.device_serial,
+        )
+
+    async def query_missing(now=None):
+        """Query what isn't known or is too old, in the background."""
+        await refresh_schedule()
+        age = thermostat.device_id_age
+        if age is None or age > DEVICE_ID_MAX_AGE.total_seconds():
+            await query_device_id()
+
+    async def first_contact():
+        """Poll the status, and start polling from there."""
+        await coordinator.async_refresh()
+        coordinator.async_start(coordinator.next_poll_delay())
+
+    async def after_first_contact():
+        """Query the rest, likely over the connection still open."""
+        if coordinator.available:
+            await query_missing()
 
     # This creates each HA object for each platform your device requires.
     # It's done by calling the `async_setup_entry` function in each platform module.
-    hass.config_entries.async_setup_platforms(entry, PLATFORMS)
+    # The entities subscribe to the thermostat there, before it is contacted.
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    if thermostat.firmware_version is not None:
+        show_device_id()  # the stored one, also if the climate entity is disabled
+
+    # connecting to all thermostats at once after start makes them starve each
+    # other, the planner spreads the first contacts
+    planner = domain_data.setdefault(DATA_STARTUP, StartupPlanner(hass))
+    planner.async_add(
+        entry.entry_id,
+        coordinator,
+        first_contact,
+        entry.options.get(CONF_STARTUP_WINDOW, DEFAULT_STARTUP_WINDOW),
+        storage.link,
+        after_first_contact,
+    )
+    entry.async_on_unload(
+        async_track_time_interval(hass, query_missing, SCHEDULE_REFRESH_INTERVAL)
+    )
+    entry.async_on_unload(entry.add_update_listener(update_listener))
     return True
 
 
+async def update_listener(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the entry when its options change."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     # This is called when an entry/configured device is to be removed. The class
@@ -47,6 +195,9 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     # details
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
+        hass.data[DOMAIN][DATA_STARTUP].async_remove(entry.entry_id)
+        hass.data[DOMAIN][DATA_COORDINATOR].pop(entry.entry_id).shutdown()
         thermostat = hass.data[DOMAIN].pop(entry.entry_id)
         thermostat.shutdown()
+        await hass.data[DOMAIN][DATA_STORAGE].pop(entry.entry_id).async_unload()
     return unload_ok
@@ -1,9 +1,12 @@
-from .const import DOMAIN
+from .const import DATA_COORDINATOR, DOMAIN
 import json
 import logging
 
 from homeassistant.helpers.device_registry import format_mac
+from .coordinator import CoordinatedEntity, ThermostatCoordinator
+from .python_eq3bt.eq3bt.bleakconnection import FIELD_BUSY, FIELD_CONNECTED
 from .python_eq3bt.eq3bt.eq3btsmart import Thermostat
+from .python_eq3bt.eq3bt.state import FIELD_MODE
 from homeassistant.helpers.entity import DeviceInfo, EntityCategory
 from homeassistant.components.binary_sensor import BinarySensorEntity
 from datetime import time
@@ -21,14 +24,15 @@ async def async_setup_entry(
 ) -> None:
     """Add sensors for passed config_entry in HA."""
     eq3 = hass.data[DOMAIN][config_entry.entry_id]
+    coordinator = hass.data[DOMAIN][DATA_COORDINATOR][config_entry.entry_id]
 
     new_devices = [
-        BatterySensor(eq3),
-        WindowOpenSensor(eq3),
+        BatterySensor(eq3, coordinator),
+        WindowOpenSensor(eq3, coordinator),
         BusySensor(eq3),
         ConnectedSensor(eq3),
-        DSTSensor(eq3),
-        UnknownSensor(eq3),
+        DSTSensor(eq3, coordinator),
+        UnknownSensor(eq3, coordinator),
     ]
     async_add_entities(new_devices)
 
@@ -53,7 +57,9 @@ class Base(BinarySensorEntity):
 class BusySensor(Base):
     def __init__(self, _thermostat: Thermostat):
         super().__init__(_thermostat)
-        _thermostat._conn.register_connection_callback(self.schedule_update_ha_state)
+        _thermostat._conn.register_connection_callback(
+            self.schedule_update_ha_state, FIELD_BUSY
+        )
         self._attr_entity_category = EntityCategory.DIAGNOSTIC
         self._attr_name = "Busy"
 
@@ -65,7 +71,9 @@ class BusySensor(Base):
 class ConnectedSensor(Base):
     def __init__(self, _thermostat: Thermostat):
         super().__init__(_thermostat)
-        _thermostat._conn.register_connection_callback(self.schedule_update_ha_state)
+        _thermostat._conn.register_connection_callback(
+            self.schedule_update_ha_state, FIELD_CONNECTED
+        )
         self._attr_entity_category = EntityCategory.DIAGNOSTIC
         self._attr_name = "Connected"
         self._attr_device_class = "connectivity"
@@ -77,10 +85,11 @@ class ConnectedSensor(Base):
         return self._thermostat._conn._conn.is_connected
 
 
-class BatterySensor(Base):
-    def __init__(self, _thermostat: Thermostat):
+class BatterySensor(CoordinatedEntity, Base):
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
         super().__init__(_thermostat)
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+        self._coordinator = _coordinator
+        _thermostat.register_update_callback(self.schedule_update_ha_state, FIELD_MODE)
         self._attr_name = "Battery"
         self._attr_device_class = "battery"
         self._attr_entity_category = EntityCategory.DIAGNOSTIC
@@ -90,10 +99,11 @@ class BatterySensor(Base):
         return self._thermostat.low_battery
 
 
-class WindowOpenSensor(Base):
-    def __init__(self, _thermostat: Thermostat):
+class WindowOpenSensor(CoordinatedEntity, Base):
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
         super().__init__(_thermostat)
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+        self._coordinator = _coordinator
+        _thermostat.register_update_callback(self.schedule_update_ha_state, FIELD_MODE)
         self._attr_name = "Window Open"
         self._attr_device_class = "window"
 
@@ -102,10 +112,11 @@ class WindowOpenSensor(Base):
         return self._thermostat.window_open
 
 
-class DSTSensor(Base):
-    def __init__(self, _thermostat: Thermostat):
+class DSTSensor(CoordinatedEntity, Base):
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
         super().__init__(_thermostat)
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+        self._coordinator = _coordinator
+        _thermostat.register_update_callback(self.schedule_update_ha_state, FIELD_MODE)
         self._attr_name = "dSt"
         self._attr_entity_category = EntityCategory.DIAGNOSTIC
 
@@ -114,10 +125,11 @@ class DSTSensor(Base):
         return self._thermostat.dst
 
 
-class UnknownSensor(Base):
-    def __init__(self, _thermostat: Thermostat):
+class UnknownSensor(CoordinatedEntity, Base):
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
         super().__init__(_thermostat)
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+        self._coordinator = _coordinator
+        _thermostat.register_update_callback(self.schedule_update_ha_state, FIELD_MODE)
         self._attr_name = "Unknown"
         self._attr_entity_category = EntityCategory.DIAGNOSTIC
 
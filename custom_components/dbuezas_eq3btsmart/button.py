@@ -1,9 +1,8 @@
 import datetime
 
-from .python_eq3bt.eq3bt.structures import (
-    HOUR_24_PLACEHOLDER,
-)
-from .const import DOMAIN
+from .python_eq3bt.eq3bt.structures import NAME_TO_DAY
+from .python_eq3bt.eq3bt.weekschedule import DAY_END
+from .const import DOMAIN, SCHEDULE_MAX_AGE
 import logging
 
 import voluptuous as vol
@@ -11,6 +10,7 @@ from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers import device_registry as dr
 from homeassistant.helpers.device_registry import format_mac
 from .python_eq3bt.eq3bt.eq3btsmart import EQ3BT_MAX_TEMP, EQ3BT_MIN_TEMP, Thermostat
+from .python_eq3bt.eq3bt.state import FIELD_SCHEDULE
 from homeassistant.helpers.entity import DeviceInfo, EntityCategory
 from homeassistant.components.button import ButtonEntity
 from homeassistant.helpers import entity_platform
@@ -73,6 +73,20 @@ SET_SCHEDULE_SCHEMA = vol.All(
 )
 
 
+def schedule_hours(data) -> list:
+    """(temperature, end minute) periods of a day program for
+    Thermostat.async_set_schedule from service data validated with
+    SCHEDULE_SCHEMA. A missing or 00:00 change ends the day."""
+    periods = []
+    for i in range(7):
+        until = data.get(f"next_change_at_{i}")
+        if until is None or until == datetime.time(0, 0):
+            periods.append((data[f"target_temp_{i}"], DAY_END))
+            break
+        periods.append((data[f"target_temp_{i}"], until.hour * 60 + until.minute))
+    return periods
+
+
 async def async_setup_entry(
     hass: HomeAssistant,
     config_entry: ConfigEntry,
@@ -118,15 +132,16 @@ class Base(ButtonEntity):
 class FetchScheduleButton(Base):
     def __init__(self, _thermostat: Thermostat):
         super().__init__(_thermostat)
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+        _thermostat.register_update_callback(
+            self.schedule_update_ha_state, FIELD_SCHEDULE
+        )
         self._attr_name = "Fetch Schedule"
 
     async def async_press(self) -> None:
         await self.fetch_schedule()
 
     async def fetch_schedule(self):
-        for x in range(0, 7):
-            await self._thermostat.async_query_schedule(x)
+        await self._thermostat.async_query_full_schedule()
         _LOGGER.debug(
             "[%s] schedule (day %s): %s",
             self._thermostat.name,
@@ -135,33 +150,34 @@ class FetchScheduleButton(Base):
 
     async def set_schedule(self, **kwargs) -> None:
         _LOGGER.debug("[%s] set_schedule (day %s)", self._thermostat.name, kwargs)
-        for day in kwargs["days"]:
-            times = [
-                kwargs.get(f"next_change_at_{i}", datetime.time(0, 0)) for i in range(6)
-            ]
-            times[times.index(datetime.time(0, 0))] = HOUR_24_PLACEHOLDER
-            temps = [kwargs.get(f"target_temp_{i}", 0) for i in range(7)]
-            hours = []
-            for i in range(0, 6):
-                hours.append(
-                    {
-                        "target_temp": temps[i],
-                        "next_change_at": times[i],
-                    }
-                )
-            await self._thermostat.async_set_schedule(day=day, hours=hours)
+        result = await self._thermostat.async_set_schedule_days(
+            kwargs["days"],
+            schedule_hours(kwargs),
+            max_age=SCHEDULE_MAX_AGE.total_seconds(),
+        )
+        _LOGGER.info(
+            "[%s] set_schedule wrote %s, skipped %s (unchanged)",
+            self._thermostat.name,
+            result["written"],
+            result["skipped"],
+        )
 
     @property
     def extra_state_attributes(self):
         schedule = {}
-        for day in self._thermostat.schedule:
-            day_raw = self._thermostat.schedule[day]
+        week = self._thermostat.week_schedule
+        for day, number in NAME_TO_DAY.items():
+            program = week.program(number)
+            if program is None:
+                continue
             day_nice = {"day": day}
-            for i, entry in enumerate(day_raw.hours):
-                day_nice[f"target_temp_{i}"] = entry.target_temp
-                if entry.next_change_at == HOUR_24_PLACEHOLDER:
+            for i, (temperature, end) in enumerate(program):
+                day_nice[f"target_temp_{i}"] = temperature
+                if end == DAY_END:
                     break
-                day_nice[f"next_change_at_{i}"] = entry.next_change_at.isoformat()
+                day_nice[f"next_change_at_{i}"] = datetime.time(
+                    *divmod(end, 60)
+                ).isoformat()
             schedule[day] = day_nice
 
         return schedule
@@ -2,15 +2,17 @@
 
 from __future__ import annotations
 import logging
-import asyncio
 
 from .const import (
+    DATA_COORDINATOR,
     EQ_TO_HA_HVAC,
     HA_TO_EQ_HVAC,
     Preset,
     DOMAIN,
 )
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers import entity_platform
+from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers.device_registry import format_mac, CONNECTION_BLUETOOTH
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.entity import DeviceInfo
@@ -32,17 +34,31 @@ from homeassistant.components.climate import ClimateEntity
 import voluptuous as vol
 
 from datetime import datetime, timedelta
+from .coordinator import CoordinatedEntity, ThermostatCoordinator
+from .button import (
+    EQ3_TEMPERATURE,
+    SCHEDULE_SCHEMA,
+    schedule_hours,
+    times_and_temps_schema,
+)
 from .python_eq3bt.eq3bt.eq3btsmart import (
+    EQ3BT_MAX_OFFSET,
     EQ3BT_MAX_TEMP,
+    EQ3BT_MIN_OFFSET,
     EQ3BT_OFF_TEMP,
     EQ3BT_ON_TEMP,
     Mode,
     Thermostat,
 )
+from .python_eq3bt.eq3bt.state import (
+    FIELD_MODE,
+    FIELD_PRESETS,
+    FIELD_SCHEDULE,
+    FIELD_TARGET_TEMPERATURE,
+)
 from homeassistant.config_entries import ConfigEntry
 
 
-SCAN_INTERVAL = timedelta(minutes=5)
 # PARALLEL_UPDATES = 0
 
 _LOGGER = logging.getLogger(__name__)
@@ -52,6 +68,24 @@ DEVICE_SCHEMA = vol.Schema({vol.Required(CONF_MAC): cv.string})
 
 SUPPORT_FLAGS = SUPPORT_TARGET_TEMPERATURE | SUPPORT_PRESET_MODE
 
+APPLY_PROFILE_SCHEMA = cv.make_entity_service_schema(
+    {
+        vol.Optional("comfort_temperature"): EQ3_TEMPERATURE,
+        vol.Optional("eco_temperature"): EQ3_TEMPERATURE,
+        vol.Optional("window_open_temperature"): EQ3_TEMPERATURE,
+        vol.Optional("window_open_timeout"): vol.All(
+            vol.Coerce(int), vol.Range(min=0, max=60)
+        ),
+        vol.Optional("temperature_offset"): vol.All(
+            vol.Coerce(float), vol.Range(min=EQ3BT_MIN_OFFSET, max=EQ3BT_MAX_OFFSET)
+        ),
+        vol.Optional("schedule"): [
+            vol.All(vol.Schema(SCHEDULE_SCHEMA), times_and_temps_schema)
+        ],
+        vol.Optional(ATTR_HVAC_MODE): vol.In(list(HA_TO_EQ_HVAC)),
+    }
+)
+
 
 async def async_setup_entry(
     hass: HomeAssistant,
@@ -60,31 +94,46 @@ async def async_setup_entry(
 ) -> None:
     """Add cover for passed entry in HA."""
     eq3 = hass.data[DOMAIN][config_entry.entry_id]
+    coordinator = hass.data[DOMAIN][DATA_COORDINATOR][config_entry.entry_id]
 
-    new_entities = [EQ3BTSmartThermostat(eq3, hass)]
+    new_entities = [EQ3BTSmartThermostat(eq3, coordinator, hass)]
 
     async_add_entities(
         new_entities,
         update_before_add=False,
     )
 
+    platform = entity_platform.async_get_current_platform()
+
+    platform.async_register_entity_service(
+        "apply_profile",
+        APPLY_PROFILE_SCHEMA,  # type: ignore
+        "apply_profile",
+    )
+
 
-class EQ3BTSmartThermostat(ClimateEntity):
+class EQ3BTSmartThermostat(CoordinatedEntity, ClimateEntity):
     """Representation of an eQ-3 Bluetooth Smart thermostat."""
 
-    def __init__(self, _thermostat: Thermostat, _hass: HomeAssistant):
+    _attr_should_poll = False  # the coordinator polls
+
+    def __init__(
+        self,
+        _thermostat: Thermostat,
+        _coordinator: ThermostatCoordinator,
+        _hass: HomeAssistant,
+    ):
         """Initialize the thermostat."""
         self.hass = _hass
-        self._current_temperature = None
-        # TODO: refactor the is_setting_temperature mess.
-        self._is_setting_temperature = False
         self._thermostat = _thermostat
-        self._thermostat.register_update_callback(self._on_updated)
-        # HA forces an update after any prop is set (temp, mode, etc)
-        # But each time anything is set, the thermostat responds with the most current data
-        # This means after setting a prop, we can skip the next scheduled update.
-        self._skip_next_update = False
-        self._is_available = False
+        self._coordinator = _coordinator
+        self._thermostat.register_update_callback(
+            self._on_updated,
+            FIELD_TARGET_TEMPERATURE,
+            FIELD_MODE,
+            FIELD_PRESETS,
+            FIELD_SCHEDULE,
+        )
 
         # We are the main entity of the device and should use the device name.
         # See https://developers.home-assistant.io/docs/core/entity#has_entity_name-true-mandatory-for-new-integrations
@@ -93,19 +142,10 @@ class EQ3BTSmartThermostat(ClimateEntity):
 
     async def async_added_to_hass(self) -> None:
         _LOGGER.debug("[%s] adding", self._thermostat.name)
-        asyncio.get_event_loop().create_task(self.async_update())
-
-    async def async_will_remove_from_hass(self) -> None:
-        _LOGGER.debug("[%s] removing", self._thermostat.name)
+        await super().async_added_to_hass()
 
     @callback
     def _on_updated(self):
-        self._is_available = True
-        if self._current_temperature == self.target_temperature:
-            self._is_setting_temperature = False
-        if not self._is_setting_temperature:
-            # temperature may have been updated from the thermostat
-            self._current_temperature = self.target_temperature
         if self.entity_id is None:
             _LOGGER.warn(
                 "[%s] Updated but the entity is not loaded", self._thermostat.name
@@ -118,11 +158,6 @@ class EQ3BTSmartThermostat(ClimateEntity):
         """Return the list of supported features."""
         return SUPPORT_FLAGS
 
-    @property
-    def available(self) -> bool:
-        """Return if thermostat is available."""
-        return self._is_available
-
     @property
     def temperature_unit(self):
         """Return the unit of measurement that is used."""
@@ -135,8 +170,10 @@ class EQ3BTSmartThermostat(ClimateEntity):
 
     @property
     def current_temperature(self):
-        """Can not report temperature, so return target_temperature."""
-        return self._current_temperature
+        """Can not report temperature, so return the target temperature, or the
+        one being set."""
+        pending = self._coordinator.pending_temperature
+        return self.target_temperature if pending is None else pending
 
     @property
     def target_temperature(self):
@@ -166,16 +203,8 @@ class EQ3BTSmartThermostat(ClimateEntity):
         temperature = round(temperature * 2) / 2  # increments of 0.5
         temperature = min(temperature, self.max_temp)
         temperature = max(temperature, self.min_temp)
-        self._is_setting_temperature = True
-        self._current_temperature = temperature
-        # show current temp now
-        self.async_schedule_update_ha_state(force_refresh=False)
-        await self.async_set_temperature_now()
-
-    async def async_set_temperature_now(self):
-        await self._thermostat.async_set_target_temperature(self._current_temperature)
-        self._is_setting_temperature = False
-        self._skip_next_update = True
+        # shown right away, and set again after the next poll if this fails
+        await self._coordinator.async_set_target_temperature(temperature)
 
     @property
     def hvac_mode(self):
@@ -192,16 +221,42 @@ class EQ3BTSmartThermostat(ClimateEntity):
 
     async def async_set_hvac_mode(self, hvac_mode):
         """Set operation mode."""
-        if hvac_mode == HVACMode.OFF:
-            self._current_temperature = EQ3BT_OFF_TEMP
-            self._is_setting_temperature = True
-        else:  # auto or manual/heat
-            self._current_temperature = self.target_temperature
-            self._is_setting_temperature = False
-        self.async_schedule_update_ha_state(force_refresh=False)
-
+        self._coordinator.discard_pending_temperature()
         await self._thermostat.async_set_mode(HA_TO_EQ_HVAC[hvac_mode])
-        self._skip_next_update = True
+
+    async def apply_profile(self, **kwargs):
+        """Apply the settings of a room profile back to back over one connection."""
+        batch = self._thermostat.batch()
+        if "comfort_temperature" in kwargs or "eco_temperature" in kwargs:
+            batch.set_temperature_presets(
+                comfort=kwargs.get("comfort_temperature"),
+                eco=kwargs.get("eco_temperature"),
+            )
+        if "window_open_temperature" in kwargs or "window_open_timeout" in kwargs:
+            timeout = kwargs.get("window_open_timeout")
+            batch.set_window_open_config(
+                temperature=kwargs.get("window_open_temperature"),
+                duration=None if timeout is None else timedelta(minutes=timeout),
+            )
+        if "temperature_offset" in kwargs:
+            batch.set_temperature_offset(kwargs["temperature_offset"])
+        for program in kwargs.get("schedule", []):
+            hours = schedule_hours(program)
+            for day in program["days"]:
+                batch.set_schedule(day, hours)
+        if ATTR_HVAC_MODE in kwargs:
+            batch.set_mode(HA_TO_EQ_HVAC[kwargs[ATTR_HVAC_MODE]])
+        if not len(batch):
+            return
+
+        results = await batch.async_execute()
+        failed = [result for result in results if isinstance(result, Exception)]
+        self._coordinator.discard_pending_temperature()
+        if failed:
+            raise HomeAssistantError(
+                f"[{self._thermostat.name}] {len(failed)} of {len(results)} "
+                f"profile commands failed: {failed[0]}"
+            )
 
     @property
     def min_temp(self):
@@ -258,9 +313,7 @@ class EQ3BTSmartThermostat(ClimateEntity):
                     await self._thermostat.async_activate_comfort()
 
         # by now, the target temperature should have been (maybe set) and fetched
-        self._current_temperature = self.target_temperature
-        self._is_setting_temperature = False
-        self._skip_next_update = True
+        self._coordinator.discard_pending_temperature()
 
     @property
     def preset_modes(self):
@@ -269,6 +322,20 @@ class EQ3BTSmartThermostat(ClimateEntity):
         """
         return list(Preset)
 
+    @property
+    def extra_state_attributes(self):
+        next_change = self._thermostat.next_schedule_change
+        attributes = {
+            "scheduled_temperature": self._thermostat.scheduled_temperature,
+            "next_schedule_change": next_change and next_change[0].isoformat(),
+            "next_scheduled_temperature": next_change and next_change[1],
+        }
+        if self._coordinator.restored:
+            # stored before the restart, shown until the thermostat answers
+            attributes["restored"] = True
+            attributes["restored_status_age"] = round(self._thermostat.status_age)
+        return attributes
+
     @property
     def unique_id(self) -> str:
         """Return the MAC address of the thermostat."""
@@ -286,20 +353,6 @@ class EQ3BTSmartThermostat(ClimateEntity):
         )
 
     async def async_update(self):
-        """Update the data from the thermostat."""
-        if self._skip_next_update:
-            self._skip_next_update = False
-            _LOGGER.debug("[%s] skipped update", self._thermostat.name)
-        else:
-            try:
-                await self._thermostat.async_update()
-                if self._is_setting_temperature:
-                    await self.async_set_temperature_now()
-            except Exception as ex:
-                # otherwise, if this happens during the first update, the entity will be dropped and never update
-                self._is_available = False
-                _LOGGER.error(
-                    "[%s] Error updating, will retry later: %s",
-                    self._thermostat.name,
-                    ex,
-                )
+        """Update the data from the thermostat, e.g. for the update_entity
+        service."""
+        await self._coordinator.async_refresh()
@@ -6,11 +6,34 @@ https://github.com/herikw/home-assistant-custom-components
 import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.const import CONF_MAC, CONF_NAME
+from homeassistant.core import callback
 from homeassistant.helpers.device_registry import format_mac
 from homeassistant.components.bluetooth import BluetoothServiceInfoBleak
 
 from .climate import EQ3BTSmartThermostat
-from .const import DOMAIN
+from .const import (
+    CONF_COOLDOWN,
+    CONF_EVENT_INTERVAL,
+    CONF_FAILURE_THRESHOLD,
+    CONF_IDLE_TIMEOUT,
+    CONF_POLL_CEILING,
+    CONF_POLL_FLOOR,
+    CONF_PUSH_MODE,
+    CONF_REQUEST_DEADLINE,
+    CONF_RETRIES,
+    CONF_STARTUP_WINDOW,
+    DEFAULT_COOLDOWN,
+    DEFAULT_EVENT_INTERVAL,
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_IDLE_TIMEOUT,
+    DEFAULT_POLL_CEILING,
+    DEFAULT_POLL_FLOOR,
+    DEFAULT_PUSH_MODE,
+    DEFAULT_REQUEST_DEADLINE,
+    DEFAULT_RETRIES,
+    DEFAULT_STARTUP_WINDOW,
+    DOMAIN,
+)
 import logging
 
 _LOGGER = logging.getLogger(__name__)
@@ -25,6 +48,12 @@ class EQ3ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         """Initialize the EQ3One flow."""
         self.discovery_info = None
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Get the options flow for this handler."""
+        return EQ3OptionsFlowHandler(config_entry)
+
     async def async_step_user(self, user_input=None):
         """Handle a flow initialized by the user."""
         _LOGGER.debug("async_step_user: %s", user_input)
@@ -98,3 +127,79 @@ class EQ3ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             title=user_input[CONF_NAME],
             data={"name": user_input["name"], "mac": self.discovery_info.address},
         )
+
+
+class EQ3OptionsFlowHandler(config_entries.OptionsFlow):
+    """Options for a configured thermostat"""
+
+    def __init__(self, config_entry: config_entries.ConfigEntry):
+        """Initialize the options flow."""
+        self.config_entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        """Manage the connection options."""
+        errors = {}
+        if user_input is not None:
+            if user_input[CONF_POLL_FLOOR] > user_input[CONF_POLL_CEILING]:
+                errors[CONF_POLL_CEILING] = "poll_ceiling_below_floor"
+            else:
+                return self.async_create_entry(title="", data=user_input)
+
+        # refused input is shown again to be corrected
+        options = user_input or self.config_entry.options
+        return self.async_show_form(
+            step_id="init",
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(
+                        CONF_IDLE_TIMEOUT,
+                        default=options.get(CONF_IDLE_TIMEOUT, DEFAULT_IDLE_TIMEOUT),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0, max=3600)),
+                    vol.Optional(
+                        CONF_PUSH_MODE,
+                        default=options.get(CONF_PUSH_MODE, DEFAULT_PUSH_MODE),
+                    ): bool,
+                    vol.Optional(
+                        CONF_REQUEST_DEADLINE,
+                        default=options.get(
+                            CONF_REQUEST_DEADLINE, DEFAULT_REQUEST_DEADLINE
+                        ),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=5, max=3600)),
+                    vol.Optional(
+                        CONF_RETRIES,
+                        default=options.get(CONF_RETRIES, DEFAULT_RETRIES),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=1, max=100)),
+                    vol.Optional(
+                        CONF_FAILURE_THRESHOLD,
+                        default=options.get(
+                            CONF_FAILURE_THRESHOLD, DEFAULT_FAILURE_THRESHOLD
+                        ),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=0, max=100)),
+                    vol.Optional(
+                        CONF_COOLDOWN,
+                        default=options.get(CONF_COOLDOWN, DEFAULT_COOLDOWN),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0, max=86400)),
+                    vol.Optional(
+                        CONF_EVENT_INTERVAL,
+                        default=options.get(
+                            CONF_EVENT_INTERVAL, DEFAULT_EVENT_INTERVAL
+                        ),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0, max=3600)),
+                    vol.Optional(
+                        CONF_POLL_FLOOR,
+                        default=options.get(CONF_POLL_FLOOR, DEFAULT_POLL_FLOOR),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=10, max=86400)),
+                    vol.Optional(
+                        CONF_POLL_CEILING,
+                        default=options.get(CONF_POLL_CEILING, DEFAULT_POLL_CEILING),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=10, max=86400)),
+                    vol.Optional(
+                        CONF_STARTUP_WINDOW,
+                        default=options.get(
+                            CONF_STARTUP_WINDOW, DEFAULT_STARTUP_WINDOW
+                        ),
+                    ): vol.All(vol.Coerce(float), vol.Range(min=0, max=3600)),
+                }
+            ),
+            errors=errors,
+        )
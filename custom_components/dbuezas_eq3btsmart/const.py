@@ -1,9 +1,45 @@
 """Constants for EQ3 Bluetooth Smart Radiator Valves."""
 from .python_eq3bt.eq3bt.eq3btsmart import Mode
 from homeassistant.components.climate import HVACMode
+from datetime import timedelta
 from enum import Enum
 
 DOMAIN = "dbuezas_eq3btsmart"
+# hass.data[DOMAIN] holds the thermostat of each entry and these shared objects
+DATA_SCHEDULER = "scheduler"
+DATA_STORAGE = "storage"  # ThermostatStorage of each entry
+DATA_COORDINATOR = "coordinator"  # ThermostatCoordinator of each entry
+DATA_STARTUP = "startup"
+
+# thermostats contacted at once for the first time after start
+STARTUP_CONNECTIONS = 2
+
+# stored day programs older than this are queried again, in the background
+SCHEDULE_MAX_AGE = timedelta(days=7)
+SCHEDULE_REFRESH_INTERVAL = timedelta(hours=6)
+# the stored firmware version and serial are queried again after a week
+DEVICE_ID_MAX_AGE = timedelta(days=7)
+
+CONF_IDLE_TIMEOUT = "idle_timeout"
+DEFAULT_IDLE_TIMEOUT = 30
+CONF_PUSH_MODE = "push_mode"
+DEFAULT_PUSH_MODE = False
+CONF_REQUEST_DEADLINE = "request_deadline"
+DEFAULT_REQUEST_DEADLINE = 90
+CONF_RETRIES = "retries"
+DEFAULT_RETRIES = 14
+CONF_FAILURE_THRESHOLD = "failure_threshold"
+DEFAULT_FAILURE_THRESHOLD = 3
+CONF_COOLDOWN = "cooldown"
+DEFAULT_COOLDOWN = 300
+CONF_EVENT_INTERVAL = "event_interval"
+DEFAULT_EVENT_INTERVAL = 0
+CONF_POLL_FLOOR = "poll_floor"
+DEFAULT_POLL_FLOOR = 60
+CONF_POLL_CEILING = "poll_ceiling"
+DEFAULT_POLL_CEILING = 900
+CONF_STARTUP_WINDOW = "startup_window"
+DEFAULT_STARTUP_WINDOW = 60
 from homeassistant.components.climate.const import (
     PRESET_AWAY,
     PRESET_BOOST,
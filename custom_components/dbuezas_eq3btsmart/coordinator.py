@@ -0,0 +1,222 @@
+"""Polling and availability of a thermostat, shared by all its entities."""
+from __future__ import annotations
+
+import logging
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_call_later
+
+from .const import DEFAULT_POLL_CEILING, DEFAULT_POLL_FLOOR
+from .python_eq3bt.eq3bt.eq3btsmart import Thermostat
+
+SUCCESS_RATE_WEIGHT = 0.1  # of the latest poll, about the last 10 count
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ThermostatCoordinator:
+    """Polls one thermostat and tracks whether it can be reached.
+
+    There is one per config entry, so the status is polled once however many
+    entities show it, and also while they are disabled. Entities get the data
+    from the thermostat update callbacks and their availability from here.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        thermostat: Thermostat,
+        poll_floor: float = DEFAULT_POLL_FLOOR,
+        poll_ceiling: float = DEFAULT_POLL_CEILING,
+    ):
+        self.hass = hass
+        self.thermostat = thermostat
+        # seconds between polls, see Thermostat.poll_delay
+        self.poll_floor = poll_floor
+        self.poll_ceiling = poll_ceiling
+        self.available = False
+        # the status shown is the one stored before the restart, see
+        # Thermostat.restore_status
+        self.restored = False
+        self.failures = 0  # polls failed in a row
+        # of the polls, smoothed and kept across restarts, None if never polled
+        self.success_rate: float | None = None
+        # target temperature set by the user that the thermostat didn't take yet
+        self.pending_temperature: float | None = None
+        self._listeners: list[CALLBACK_TYPE] = []
+        self._poll_handle: CALLBACK_TYPE | None = None
+        self._stopped = False
+        thermostat.register_update_callback(self._on_updated)
+
+    @callback
+    def async_add_listener(self, on_change: CALLBACK_TYPE) -> CALLBACK_TYPE:
+        """Call on_change when the availability, the pending temperature or
+        whether the status is restored changed.
+
+        :return: function removing the listener
+        """
+        self._listeners.append(on_change)
+
+        @callback
+        def remove():
+            self._listeners.remove(on_change)
+
+        return remove
+
+    @callback
+    def _notify(self):
+        for on_change in list(self._listeners):
+            on_change()
+
+    @callback
+    def _set_available(self, available: bool):
+        if available != self.available:
+            self.available = available
+            self._notify()
+
+    @callback
+    def _on_updated(self):
+        # called first, before the entities read the new state
+        if self.pending_temperature == self.thermostat.target_temperature:
+            self.pending_temperature = None
+        restored = self.thermostat.status_restored
+        if not self.available or restored != self.restored:
+            self.available = True
+            self.restored = restored
+            self._notify()
+
+    @callback
+    def async_start(self, delay: float = 0):
+        """Plan the first poll."""
+        self._plan_poll(delay)
+
+    @callback
+    def shutdown(self):
+        self._stopped = True
+        if self._poll_handle is not None:
+            self._poll_handle()
+            self._poll_handle = None
+
+    @callback
+    def _plan_poll(self, delay: float):
+        if self._poll_handle is not None:
+            self._poll_handle()
+        _LOGGER.debug("[%s] next poll in %ss", self.thermostat.name, round(delay))
+        self._poll_handle = async_call_later(self.hass, delay, self._async_poll)
+
+    async def _async_poll(self, now=None):
+        self._poll_handle = None
+        await self.async_refresh()
+        if not self._stopped:
+            self._plan_poll(self.next_poll_delay())
+
+    def next_poll_delay(self) -> float:
+        """Seconds until the next poll, backing off while polls fail."""
+        if self.failures:
+            delay = self.poll_floor * 2 ** (self.failures - 1)
+            return min(delay, self.poll_ceiling)
+        return self.thermostat.poll_delay(self.poll_floor, self.poll_ceiling)
+
+    async def async_refresh(self):
+        """Poll the status unless it is fresh anyway, then retry setting the
+        pending target temperature.
+
+        Concurrent polls of the thermostat are collapsed into one, see
+        Thermostat.async_update.
+        """
+        thermostat = self.thermostat
+        status_age = thermostat.status_age
+        # commands are answered with the status, and while pushed the status is
+        # sent on every change, no need to ask while it is fresh. A push mode
+        # connection closed for another thermostat is polled like the others.
+        fresh_for = self.poll_ceiling if thermostat.pushing else self.poll_floor
+        if (
+            status_age is not None
+            and status_age < fresh_for
+            and not thermostat.status_restored
+        ):
+            _LOGGER.debug(
+                "[%s] skipped update, status is %ss old",
+                thermostat.name,
+                round(status_age),
+            )
+        else:
+            try:
+                await thermostat.async_update()
+            except Exception as ex:
+                self._count_poll(False)
+                self.failures += 1
+                self._set_available(False)
+                _LOGGER.error(
+                    "[%s] Error updating, will retry later: %s", thermostat.name, ex
+                )
+                return
+            self._count_poll(True)
+        self.failures = 0
+        # callbacks only run on changes, an identical status is news too
+        self._set_available(True)
+        if self.pending_temperature is not None:
+            try:
+                await self.async_set_target_temperature(self.pending_temperature)
+            except Exception as ex:
+                _LOGGER.warning(
+                    "[%s] Setting the target temperature failed again: %s",
+                    thermostat.name,
+                    ex,
+                )
+
+    def _count_poll(self, success: bool):
+        sample = 1.0 if success else 0.0
+        if self.success_rate is None:
+            self.success_rate = sample
+        else:
+            self.success_rate += SUCCESS_RATE_WEIGHT * (sample - self.success_rate)
+
+    async def async_set_target_temperature(self, temperature: float):
+        """Set the target temperature, it is shown right away and set again
+        after the next successful poll if this fails.
+
+        :raises: the error of the failed command
+        """
+        self.pending_temperature = temperature
+        self._notify()
+        await self.thermostat.async_set_target_temperature(temperature)
+        self.discard_pending_temperature()
+
+    @callback
+    def discard_pending_temperature(self):
+        """Stop retrying the pending target temperature, e.g. because another
+        command changed the target temperature since."""
+        if self.pending_temperature is not None:
+            self.pending_temperature = None
+            self._notify()
+
+    @property
+    def diagnostics(self) -> dict:
+        """Polling state, used by the integration diagnostics."""
+        return {
+            "available": self.available,
+            "restored": self.restored,
+            "failures": self.failures,
+            "success_rate": self.success_rate,
+            "pending_temperature": self.pending_temperature,
+            "next_poll_delay": self.next_poll_delay(),
+        }
+
+
+class CoordinatedEntity(Entity):
+    """Entity showing what the thermostat reported, available while the
+    coordinator can reach it. Mixed in before the platform entity class."""
+
+    _coordinator: ThermostatCoordinator
+
+    @property
+    def available(self) -> bool:
+        return self._coordinator.available
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            self._coordinator.async_add_listener(self.async_write_ha_state)
+        )
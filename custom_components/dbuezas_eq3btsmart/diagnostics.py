@@ -0,0 +1,25 @@
+"""Diagnostics support for EQ3 Bluetooth Smart thermostats."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DATA_COORDINATOR, DATA_SCHEDULER, DATA_STARTUP, DOMAIN
+from .python_eq3bt.eq3bt.eq3btsmart import Thermostat
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    thermostat: Thermostat = hass.data[DOMAIN][entry.entry_id]
+
+    return {
+        "entry": {"data": dict(entry.data), "options": dict(entry.options)},
+        "thermostat": thermostat.diagnostics,
+        "coordinator": hass.data[DOMAIN][DATA_COORDINATOR][entry.entry_id].diagnostics,
+        "scheduler": hass.data[DOMAIN][DATA_SCHEDULER].diagnostics,
+        "startup": hass.data[DOMAIN][DATA_STARTUP].diagnostics(entry.entry_id),
+    }
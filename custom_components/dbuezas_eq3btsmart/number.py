@@ -1,8 +1,9 @@
 from datetime import timedelta
-from .const import DOMAIN
+from .const import DATA_COORDINATOR, DOMAIN
 import logging
 
 from homeassistant.helpers.device_registry import format_mac
+from .coordinator import CoordinatedEntity, ThermostatCoordinator
 from .python_eq3bt.eq3bt.eq3btsmart import (
     EQ3BT_MAX_OFFSET,
     EQ3BT_MAX_TEMP,
@@ -10,6 +11,7 @@ from .python_eq3bt.eq3bt.eq3btsmart import (
     EQ3BT_MIN_TEMP,
     Thermostat,
 )
+from .python_eq3bt.eq3bt.state import FIELD_PRESETS
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.components.number import NumberEntity, NumberMode, RestoreNumber
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
@@ -26,23 +28,27 @@ async def async_setup_entry(
 ) -> None:
     """Add sensors for passed config_entry in HA."""
     eq3 = hass.data[DOMAIN][config_entry.entry_id]
+    coordinator = hass.data[DOMAIN][DATA_COORDINATOR][config_entry.entry_id]
 
     new_devices = [
-        ComfortTemperature(eq3),
-        EcoTemperature(eq3),
-        OffsetTemperature(eq3),
-        WindowOpenTemperature(eq3),
-        WindowOpenTimeout(eq3),
+        ComfortTemperature(eq3, coordinator),
+        EcoTemperature(eq3, coordinator),
+        OffsetTemperature(eq3, coordinator),
+        WindowOpenTemperature(eq3, coordinator),
+        WindowOpenTimeout(eq3, coordinator),
         AwayForDays(eq3),
-        AwayTemperature(eq3),
+        AwayTemperature(eq3, coordinator),
     ]
     async_add_entities(new_devices)
 
 
-class Base(NumberEntity):
-    def __init__(self, _thermostat: Thermostat):
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+class Base(CoordinatedEntity, NumberEntity):
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
+        _thermostat.register_update_callback(
+            self.schedule_update_ha_state, FIELD_PRESETS
+        )
         self._thermostat = _thermostat
+        self._coordinator = _coordinator
         self._attr_has_entity_name = True
         self._attr_device_class = "temperature"
         self._attr_native_unit_of_measurement = "°C"
@@ -65,8 +71,8 @@ class Base(NumberEntity):
 
 
 class ComfortTemperature(Base):
-    def __init__(self, _thermostat: Thermostat):
-        super().__init__(_thermostat)
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
+        super().__init__(_thermostat, _coordinator)
         self._attr_name = "Comfort"
 
     @property
@@ -74,14 +80,13 @@ class ComfortTemperature(Base):
         return self._thermostat.comfort_temperature
 
     async def async_set_native_value(self, value: float) -> None:
-        await self._thermostat.async_update()  # to ensure the other temp is up to date
-        other = self._thermostat.eco_temperature
-        await self._thermostat.async_temperature_presets(comfort=value, eco=other)
+        # eco=None keeps the current (or concurrently set) eco temperature
+        await self._thermostat.async_temperature_presets(comfort=value, eco=None)
 
 
 class EcoTemperature(Base):
-    def __init__(self, _thermostat: Thermostat):
-        super().__init__(_thermostat)
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
+        super().__init__(_thermostat, _coordinator)
         self._attr_name = "Eco"
 
     @property
@@ -89,14 +94,13 @@ class EcoTemperature(Base):
         return self._thermostat.eco_temperature
 
     async def async_set_native_value(self, value: float) -> None:
-        await self._thermostat.async_update()  # to ensure the other temp is up to date
-        other = self._thermostat.comfort_temperature
-        await self._thermostat.async_temperature_presets(comfort=other, eco=value)
+        # comfort=None keeps the current (or concurrently set) comfort temperature
+        await self._thermostat.async_temperature_presets(comfort=None, eco=value)
 
 
 class OffsetTemperature(Base):
-    def __init__(self, _thermostat: Thermostat):
-        super().__init__(_thermostat)
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
+        super().__init__(_thermostat, _coordinator)
         self._attr_name = "Offset"
         self._attr_native_min_value = EQ3BT_MIN_OFFSET
         self._attr_native_max_value = EQ3BT_MAX_OFFSET
@@ -110,8 +114,8 @@ class OffsetTemperature(Base):
 
 
 class WindowOpenTemperature(Base):
-    def __init__(self, _thermostat: Thermostat):
-        super().__init__(_thermostat)
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
+        super().__init__(_thermostat, _coordinator)
         self._attr_name = "Window Open"
 
     @property
@@ -119,16 +123,18 @@ class WindowOpenTemperature(Base):
         return self._thermostat.window_open_temperature
 
     async def async_set_native_value(self, value: float) -> None:
-        await self._thermostat.async_update()  # to ensure the other value is up to date
         await self._thermostat.async_window_open_config(
-            temperature=value, duration=self._thermostat.window_open_time
+            temperature=value, duration=None  # keeps the current timeout
         )
 
 
-class WindowOpenTimeout(NumberEntity):
-    def __init__(self, _thermostat: Thermostat):
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+class WindowOpenTimeout(CoordinatedEntity, NumberEntity):
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
+        _thermostat.register_update_callback(
+            self.schedule_update_ha_state, FIELD_PRESETS
+        )
         self._thermostat = _thermostat
+        self._coordinator = _coordinator
         self._attr_has_entity_name = True
         self._attr_mode = NumberMode.BOX
         self._attr_name = "Window Open Timeout"
@@ -155,9 +161,8 @@ class WindowOpenTimeout(NumberEntity):
         return self._thermostat.window_open_time.total_seconds() / 60
 
     async def async_set_native_value(self, value: float) -> None:
-        await self._thermostat.async_update()  # to ensure the other value is up to date
         await self._thermostat.async_window_open_config(
-            temperature=self._thermostat.window_open_temperature,
+            temperature=None,  # keeps the current temperature
             duration=timedelta(minutes=value),
         )
 
@@ -200,10 +205,14 @@ class AwayForDays(RestoreNumber):
 
 
 class AwayTemperature(Base, RestoreNumber):
-    def __init__(self, _thermostat: Thermostat):
-        super().__init__(_thermostat)
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
+        super().__init__(_thermostat, _coordinator)
         self._attr_name = "Away"
 
+    @property
+    def available(self) -> bool:
+        return True  # kept here until away mode is set, not on the thermostat
+
     @property
     def unique_id(self) -> str:
         assert self.name
@@ -0,0 +1,254 @@
+"""
+Latency and throughput benchmark of the request path, against the simulator.
+
+Measures the latency percentiles of single commands on one thermostat and the
+time a whole fleet takes to be polled, with configurable link conditions.
+Results are written as JSON so runs of different revisions can be compared:
+
+    python -m eq3bt.benchmark --latency 0.02 --loss 0.05 --output before.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import sys
+import timeit
+from datetime import datetime
+from time import monotonic, perf_counter
+
+from .decoder import decode_device_id, decode_schedule, decode_status
+from .retrypolicy import RetryPolicy
+from .scheduler import CONNECTION_SLOTS, ConnectionScheduler
+from .simulator import SimulatedDevice, simulated_thermostat
+from .stats import percentile
+from .structures import DeviceId, Schedule, Status
+from .weekschedule import DAY_END
+
+FLEET_SIZES = (1, 10, 50, 200)
+SAMPLES = 50
+DECODER_ITERATIONS = 20000
+SCHEDULE = [(17.0, 6 * 60), (21.0, 22 * 60), (17.0, DAY_END)]
+
+
+def summarize(samples: list[float], failures: int = 0) -> dict:
+    """Latency percentiles in milliseconds."""
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "count": len(samples),
+        "failures": failures,
+        "mean": ms(sum(samples) / len(samples) if samples else None),
+        "p50": ms(percentile(samples, 0.5)),
+        "p95": ms(percentile(samples, 0.95)),
+        "p99": ms(percentile(samples, 0.99)),
+        "max": ms(max(samples, default=None)),
+    }
+
+
+def decoder_benchmark(iterations: int) -> dict:
+    """Microseconds per frame of the fast decoders and the construct parsers."""
+    device = SimulatedDevice()
+    device.away_end = datetime(2030, 1, 1, 12, 30)
+    frames = {
+        "status": (device.status_frame(), decode_status, Status.parse),
+        "schedule": (device.schedule_frame(2), decode_schedule, Schedule.parse),
+        "device_id": (device.id_frame(), decode_device_id, DeviceId.parse),
+    }
+    results = {}
+    for name, (frame, fast, construct_parse) in frames.items():
+        fast_us = timeit.timeit(lambda: fast(frame), number=iterations)
+        construct_us = timeit.timeit(lambda: construct_parse(frame), number=iterations)
+        results[name] = {
+            "fast_us": round(fast_us / iterations * 1e6, 3),
+            "construct_us": round(construct_us / iterations * 1e6, 3),
+            "speedup": round(construct_us / fast_us, 1),
+        }
+    return results
+
+
+class Benchmark:
+    """Runs the scenarios with one set of link conditions."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+
+    def make_device(self, index: int) -> SimulatedDevice:
+        args = self.args
+        return SimulatedDevice(
+            mac="00:1A:22:%02X:%02X:%02X"
+            % (index >> 16 & 0xFF, index >> 8 & 0xFF, index & 0xFF),
+            latency=args.latency,
+            jitter=args.jitter,
+            loss=args.loss,
+            disconnect_rate=args.disconnect_rate,
+            connect_time=args.connect_time,
+            pairing_time=args.pairing_time,
+            source="adapter%s" % (index % args.adapters),
+            seed=None if args.seed is None else args.seed + index,
+        )
+
+    def make_thermostat(self, device, scheduler=None):
+        args = self.args
+        return simulated_thermostat(
+            device,
+            name=device.mac,
+            idle_timeout=args.idle_timeout,
+            retry_policy=RetryPolicy(
+                request_timeout=args.request_timeout, back_off=args.back_off
+            ),
+            scheduler=scheduler,
+        )
+
+    async def async_measure(self, command, samples: int) -> dict:
+        """Latency of a command run samples times in a row."""
+        latencies = []
+        failures = 0
+        for i in range(samples):
+            started = perf_counter()
+            try:
+                await command(i)
+            except Exception:
+                failures += 1
+                continue
+            latencies.append(perf_counter() - started)
+        return summarize(latencies, failures)
+
+    async def async_latency(self) -> dict:
+        device = self.make_device(0)
+        thermostat = self.make_thermostat(device, ConnectionScheduler(self.args.slots))
+        samples = self.args.samples
+        await thermostat.async_update()  # the first one includes pairing
+
+        try:
+            return {
+                "status_poll": await self.async_measure(
+                    lambda i: thermostat.async_update(), samples
+                ),
+                "target_temperature_write": await self.async_measure(
+                    lambda i: thermostat.async_set_target_temperature(18 + i % 8),
+                    samples,
+                ),
+                "schedule_fetch_7_days": await self.async_measure(
+                    lambda i: thermostat.async_query_full_schedule(), samples
+                ),
+                "set_schedule": await self.async_measure(
+                    lambda i: thermostat.async_set_schedule(i % 7, SCHEDULE), samples
+                ),
+                "link": device.as_dict(),
+            }
+        finally:
+            thermostat.shutdown()
+
+    async def async_throughput(self, size: int) -> dict:
+        """Polls of a whole fleet at once, repeated for each round."""
+        scheduler = ConnectionScheduler(self.args.slots)
+        devices = [self.make_device(i) for i in range(size)]
+        thermostats = [self.make_thermostat(device, scheduler) for device in devices]
+        latencies: list[float] = []
+        failures = 0
+
+        async def poll(thermostat):
+            nonlocal failures
+            started = perf_counter()
+            try:
+                await thermostat.async_update()
+            except Exception:
+                failures += 1
+                return
+            latencies.append(perf_counter() - started)
+
+        started = monotonic()
+        for _ in range(self.args.rounds):
+            await asyncio.gather(*(poll(thermostat) for thermostat in thermostats))
+        seconds = monotonic() - started
+        for thermostat in thermostats:
+            thermostat.shutdown()
+        await asyncio.sleep(0)  # let the disconnects run
+        polls = size * self.args.rounds - failures
+        return {
+            "thermostats": size,
+            "rounds": self.args.rounds,
+            "seconds": round(seconds, 3),
+            "polls_per_second": round(polls / seconds, 3) if seconds else None,
+            "latency": summarize(latencies, failures),
+            "connects": sum(device.connects for device in devices),
+            "lost_frames": sum(device.lost_frames for device in devices),
+            "disconnects": sum(device.disconnects for device in devices),
+        }
+
+    async def async_run(self) -> dict:
+        args = self.args
+        return {
+            "label": args.label,
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "config": {
+                name: getattr(args, name)
+                for name in (
+                    "latency",
+                    "jitter",
+                    "loss",
+                    "disconnect_rate",
+                    "connect_time",
+                    "pairing_time",
+                    "request_timeout",
+                    "back_off",
+                    "idle_timeout",
+                    "adapters",
+                    "slots",
+                    "samples",
+                    "rounds",
+                    "seed",
+                )
+            },
+            "decoder": decoder_benchmark(args.decoder_iterations),
+            "latency": await self.async_latency(),
+            "throughput": [await self.async_throughput(size) for size in args.fleet],
+        }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m eq3bt.benchmark", description=__doc__.strip().split("\n\n")[0]
+    )
+    link = parser.add_argument_group("link conditions")
+    link.add_argument("--latency", type=float, default=0.02, help="seconds per frame")
+    link.add_argument("--jitter", type=float, default=0.01, help="extra seconds, max")
+    link.add_argument("--loss", type=float, default=0, help="frame loss probability")
+    link.add_argument("--disconnect-rate", type=float, default=0)
+    link.add_argument("--connect-time", type=float, default=0.5, help="seconds")
+    link.add_argument("--pairing-time", type=float, default=0.1, help="seconds")
+    parser.add_argument("--request-timeout", type=float, default=1)
+    parser.add_argument("--back-off", type=float, default=1, help="first retry")
+    parser.add_argument("--idle-timeout", type=float, default=30)
+    parser.add_argument("--adapters", type=int, default=1)
+    parser.add_argument("--slots", type=int, default=CONNECTION_SLOTS)
+    parser.add_argument("--samples", type=int, default=SAMPLES)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument(
+        "--fleet", type=int, nargs="+", default=list(FLEET_SIZES), help="sizes"
+    )
+    parser.add_argument("--decoder-iterations", type=int, default=DECODER_ITERATIONS)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--label", default=None, help="e.g. the git revision")
+    parser.add_argument("--output", default=None, help="JSON file, default stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+    results = asyncio.run(Benchmark(args).async_run())
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,8 @@ asyncio functions to synchronous architecture of python-eq3bt.
 """
 import asyncio
 import logging
-import asyncio
+from time import monotonic
+from typing import Callable
 
 from bleak import BleakClient
 from bleak.backends.characteristic import BleakGATTCharacteristic
@@ -14,10 +15,25 @@ from homeassistant.core import HomeAssistant
 from homeassistant.components import bluetooth
 
 from . import BackendException
+from .retrypolicy import CircuitBreaker, RetryPolicy
+from .scheduler import (
+    PRIORITY_INTERACTIVE,
+    PRIORITY_NAMES,
+    SOURCE_UNKNOWN,
+    ConnectionScheduler,
+    ConnectionSlot,
+    PriorityLock,
+)
+from .stats import TimingStats
+
+IDLE_TIMEOUT = 30  # seconds an idle connection is kept open for reuse
+PIPELINE_WINDOW = 3  # queries waiting for their response at once, see below
 
-REQUEST_TIMEOUT = 1
-RETRY_BACK_OFF = 1
-RETRIES = 14
+# connection state fields connection callbacks can subscribe to
+FIELD_CONNECTED = "connected"
+FIELD_BUSY = "busy"
+FIELD_RSSI = "rssi"
+FIELD_RETRIES = "retries"
 
 # Handles in linux and BTProxy are off by 1. Using UUIDs instead for consistency
 PROP_WRITE_UUID = "3fa4585a-ce4a-3bad-db4b-b8df8179ea09"
@@ -38,65 +54,271 @@ class BleakConnection:
         name: str,
         hass: HomeAssistant,
         callback,
+        idle_timeout: float = IDLE_TIMEOUT,
+        push_mode: bool = False,
+        retry_policy: RetryPolicy | None = None,
+        scheduler: ConnectionScheduler | None = None,
+        min_event_interval: float = 0,
     ):
-        """Initialize the connection."""
+        """Initialize the connection.
+
+        :param min_event_interval: Minimum seconds between two pushes of the
+            connection state to the connection callbacks.
+        """
         self._mac = mac
         self._name = name
         self._hass = hass
         self._callback = callback
-        self._notify_event = asyncio.Event()
+        # (matcher, future) of the responses requests are waiting for
+        self._pending_responses: list[
+            tuple[Callable[[bytes], bool], asyncio.Future]
+        ] = []
         self._terminate_event = asyncio.Event()
-        self.rssi = None
-        self._lock = asyncio.Lock()
+        self.rssi: int | None = None
+        self._lock = PriorityLock()
         self._conn: BleakClient | None = None
-        self._connection_callbacks = []
+        self._idle_timeout = idle_timeout
+        self._idle_handle: asyncio.TimerHandle | None = None
+        # in push mode the connection and the notification subscription are kept
+        # open, so frames the device sends on its own reach the callback too
+        self._push_mode = push_mode
+        self._notifying = False
+        # (callback, connection state fields it wants or None for any)
+        self._connection_callbacks: list[tuple] = []
         self.retries = 0
+        # connection events are pushed at most once per loop tick, see
+        # _on_connection_event
+        self._min_event_interval = min_event_interval
+        self._event_handle: asyncio.Handle | None = None
+        self._last_push = 0.0
+        self._pushed_state = self.connection_state
+        self.connection_events = 0
+        self.connection_pushes = 0
+        # push mode connections closed to give their slot to another device
+        self.push_reclaims = 0
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._circuit_breaker = CircuitBreaker(
+            self._retry_policy.failure_threshold, self._retry_policy.cooldown
+        )
+        # connection slot granted by the fleet wide scheduler while connected
+        self._scheduler = scheduler
+        self._slot: ConnectionSlot | None = None
+        # requests of this device waiting for a slot, the first one granted
+        # takes it for all of them
+        self._slot_requests: set[asyncio.Task] = set()
+        # time from asking to getting a response, per request priority
+        self.latency = {priority: TimingStats() for priority in PRIORITY_NAMES}
+
+    def register_connection_callback(self, callback, *fields: str) -> None:
+        """Call callback when any of the connection state fields changed, e.g.
+        FIELD_RSSI, or when anything changed if no fields are given."""
+        self._connection_callbacks.append((callback, frozenset(fields) or None))
 
-    def register_connection_callback(self, callback) -> None:
-        self._connection_callbacks.append(callback)
+    @property
+    def connection_state(self) -> dict:
+        return {
+            FIELD_CONNECTED: self._conn is not None and self._conn.is_connected,
+            FIELD_BUSY: self._lock.locked(),
+            FIELD_RSSI: self.rssi,
+            FIELD_RETRIES: self.retries,
+        }
 
     def _on_connection_event(self) -> None:
-        for callback in self._connection_callbacks:
-            callback()
+        """Schedule a push of the connection state.
+
+        Requests raise many events in a row (locking, connecting, each retry),
+        they are coalesced into one push on the next loop tick, or after the
+        minimum interval since the previous push.
+        """
+        self.connection_events += 1
+        if self._event_handle is not None:
+            return
+        loop = asyncio.get_event_loop()
+        delay = self._last_push + self._min_event_interval - monotonic()
+        if delay > 0:
+            self._event_handle = loop.call_later(delay, self._push_connection_state)
+        else:
+            self._event_handle = loop.call_soon(self._push_connection_state)
+
+    def _push_connection_state(self) -> None:
+        self._event_handle = None
+        if self._terminate_event.is_set():
+            return
+        state = self.connection_state
+        changed = {
+            name for name, value in state.items() if self._pushed_state[name] != value
+        }
+        if not changed:
+            return
+        self._pushed_state = state
+        self._last_push = monotonic()
+        self.connection_pushes += 1
+        for callback, fields in self._connection_callbacks:
+            if fields is None or fields & changed:
+                callback()
+
+    @property
+    def push_mode(self) -> bool:
+        return self._push_mode
+
+    @property
+    def pushing(self) -> bool:
+        """True while the status is pushed. A push mode connection is closed
+        when the scheduler needs its slot, it is pushed again once the next
+        request reconnects."""
+        return self._push_mode and self._notifying
+
+    @property
+    def diagnostics(self) -> dict:
+        return {
+            "retry_policy": self._retry_policy.as_dict(),
+            "circuit_breaker": self._circuit_breaker.as_dict(),
+            "connection_events": {
+                "raised": self.connection_events,
+                "pushed": self.connection_pushes,
+            },
+            "push_reclaims": self.push_reclaims,
+            "latency": {
+                name: self.latency[priority].as_dict()
+                for priority, name in PRIORITY_NAMES.items()
+            },
+        }
 
     def shutdown(self):
         self._terminate_event.set()
-        self._notify_event.set()
+        if self._event_handle is not None:
+            self._event_handle.cancel()
+            self._event_handle = None
+        for _, future in self._pending_responses:
+            if not future.done():
+                future.set_exception(Exception("Connection cancelled by shutdown"))
+        self._cancel_idle_timer()
+        if self._conn is not None or self._slot is not None:
+            asyncio.get_event_loop().create_task(self.async_disconnect())
 
     def throw_if_terminating(self):
         if self._terminate_event.is_set():
             raise Exception("Connection cancelled by shutdown")
 
-    async def async_get_connection(self):
-        ble_device = bluetooth.async_ble_device_from_address(
-            self._hass, self._mac, connectable=True
+    def _cancel_idle_timer(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+        if self._slot is not None:
+            self._scheduler.mark_busy(self._slot)
+
+    def _start_idle_timer(self):
+        """Close the connection once it has been idle for the idle window."""
+        self._cancel_idle_timer()
+        if self._conn is None:
+            return
+        if self._slot is not None:
+            # others waiting for a slot take precedence over keeping it open,
+            # also in push mode, see pushing
+            self._scheduler.mark_idle(self._slot, self._on_idle_timeout)
+        if self._push_mode:
+            return
+        if self._idle_timeout <= 0:
+            asyncio.get_event_loop().create_task(self.async_disconnect())
+            return
+        self._idle_handle = asyncio.get_event_loop().call_later(
+            self._idle_timeout, self._on_idle_timeout
         )
-        if ble_device:
-            self.rssi = ble_device.rssi
-            _LOGGER.debug(
-                "[%s] Connecting with ble_device, rssi: %s",
+
+    def _on_idle_timeout(self):
+        self._idle_handle = None
+        asyncio.get_event_loop().create_task(self._async_disconnect_idle())
+
+    async def _async_disconnect_idle(self):
+        if self._lock.locked():
+            return  # a request grabbed the connection meanwhile
+        if self._push_mode:
+            self.push_reclaims += 1
+            _LOGGER.info(
+                "[%s] Closing the push mode connection, its slot is needed."
+                " Polling until the next request reconnects",
                 self._name,
-                ble_device.rssi,
             )
-            self._on_connection_event()
-            self._conn = await establish_connection(
-                client_class=BleakClient,
-                device=ble_device,
-                name=self._name,
-                disconnected_callback=lambda client: self._on_connection_event(),
-                max_attempts=2,
-                # cached_services: BleakGATTServiceCollection | None = None,
-                # ble_device_callback:Callable[[], BLEDevice] | None = None,
-                use_services_cache=True,
-            )
-            self._on_connection_event()
+        _LOGGER.debug("[%s] Idle, disconnecting", self._name)
+        await self.async_disconnect()
 
-        else:
-            _LOGGER.debug(
-                "[%s]NO ble_device found",
-                self._name,
+    async def _async_acquire_slot(self, priority: int, timeout: float):
+        """Wait up to timeout seconds for a connection slot of the adapter or
+        proxy that reaches the device, unless the device holds one already.
+
+        Requests of the device wait in the fleet wide queue by their own
+        priority, once one of them is granted a slot the others stop waiting.
+        :raises BackendException: If no slot was free in time.
+        """
+        if self._scheduler is None or self._slot is not None:
+            return
+        acquire = asyncio.ensure_future(
+            self._scheduler.async_acquire(
+                self._connection_source(), self._name, priority
             )
-            raise Exception("Device not found")
+        )
+        self._slot_requests.add(acquire)
+        try:
+            await asyncio.wait([acquire], timeout=max(timeout, 0))
+        except asyncio.CancelledError:
+            if acquire.done() and not acquire.cancelled():
+                self._scheduler.release(acquire.result())
+            raise
+        finally:
+            self._slot_requests.discard(acquire)
+            if not acquire.done():
+                acquire.cancel()  # a slot granted meanwhile is given back
+        if not acquire.done():
+            raise BackendException("No connection slot free within the deadline")
+        if acquire.cancelled():
+            return  # another request of the device was granted one
+        self._slot = acquire.result()
+        for other in self._slot_requests:
+            other.cancel()
+
+    def _connection_source(self) -> str:
+        """The adapter or proxy that reaches the device."""
+        service_info = bluetooth.async_last_service_info(
+            self._hass, self._mac, connectable=True
+        )
+        return service_info.source if service_info else SOURCE_UNKNOWN
+
+    def _release_slot(self):
+        if self._slot is not None:
+            self._scheduler.release(self._slot)
+            self._slot = None
+
+    def _on_disconnected(self, client: BleakClient):
+        _LOGGER.debug("[%s] Disconnected", self._name)
+        if client is self._conn:
+            self._cancel_idle_timer()
+            self._conn = None
+            self._notifying = False
+            self._release_slot()
+        self._on_connection_event()
+
+    async def async_disconnect(self):
+        """Close the connection if one is open."""
+        self._cancel_idle_timer()
+        conn = self._conn
+        self._conn = None
+        self._notifying = False
+        if conn is None:
+            self._release_slot()
+            return
+        try:
+            await conn.disconnect()
+        except Exception as ex:
+            _LOGGER.debug("[%s] Failed disconnecting: %s", self._name, ex)
+        self._release_slot()
+        self._on_connection_event()
+
+    async def async_get_connection(self):
+        if self._conn is not None and self._conn.is_connected:
+            _LOGGER.debug("[%s] Reusing open connection", self._name)
+            return self._conn
+        self._conn = await self._async_connect()
+        self._on_connection_event()
 
         if self._conn.is_connected:
             _LOGGER.debug("[%s] Connected", self._name)
@@ -108,15 +330,71 @@ class BleakConnection:
                 _LOGGER.debug("[%s] Paired: %s ", self._name, paired)
             except Exception as ex:
                 _LOGGER.warn("[%s] Failed paring: %s ", self._name, ex)
+            if self._push_mode:
+                await self._async_start_notify(self._conn)
         else:
             raise BackendException("Can't connect")
         return self._conn
 
+    async def _async_connect(self) -> BleakClient:
+        """Establish a new connection to the device."""
+        ble_device = bluetooth.async_ble_device_from_address(
+            self._hass, self._mac, connectable=True
+        )
+        if not ble_device:
+            _LOGGER.debug(
+                "[%s]NO ble_device found",
+                self._name,
+            )
+            raise Exception("Device not found")
+        self.rssi = ble_device.rssi
+        _LOGGER.debug(
+            "[%s] Connecting with ble_device, rssi: %s",
+            self._name,
+            ble_device.rssi,
+        )
+        self._on_connection_event()
+        return await establish_connection(
+            client_class=BleakClient,
+            device=ble_device,
+            name=self._name,
+            disconnected_callback=self._on_disconnected,
+            max_attempts=2,
+            # cached_services: BleakGATTServiceCollection | None = None,
+            # ble_device_callback:Callable[[], BLEDevice] | None = None,
+            use_services_cache=True,
+        )
+
+    async def _async_start_notify(self, conn: BleakClient):
+        if not self._notifying:
+            await conn.start_notify(PROP_NTFY_UUID, self.on_notification)
+            self._notifying = True
+
+    async def _async_stop_notify(self, conn: BleakClient):
+        if self._notifying and not self._push_mode:
+            await conn.stop_notify(PROP_NTFY_UUID)
+            self._notifying = False
+
     async def on_notification(self, handle: BleakGATTCharacteristic, data: bytearray):
         """Handle Callback from a Bluetooth (GATT) request."""
         if PROP_NTFY_UUID == handle.uuid:
-            self._notify_event.set()
-            self._callback(data)
+            frame = bytes(data)
+            error = None
+            try:
+                self._callback(data)
+            except Exception as ex:
+                _LOGGER.error(
+                    "[%s] Failed handling %s: %s", self._name, frame.hex(), ex
+                )
+                error = ex
+            for matcher, future in self._pending_responses:
+                if not future.done() and matcher(frame):
+                    if error is None:
+                        future.set_result(frame)
+                    else:
+                        future.set_exception(error)
+                    return
+            _LOGGER.debug("[%s] Unsolicited notification", self._name)
         else:
             _LOGGER.error(
                 "[%s] wrong charasteristic: %s, %s",
@@ -125,39 +403,212 @@ class BleakConnection:
                 handle.uuid,
             )
 
-    async def async_make_request(self, value, retries=RETRIES):
-        """Write a GATT Command without callback - not utf-8."""
-        async with self._lock:  # only one concurrent request per thermostat
+    def _expect_response(self, matcher: Callable[[bytes], bool] | None):
+        """Returns a future for the first coming frame the matcher accepts."""
+        future = asyncio.get_event_loop().create_future()
+        self._pending_responses.append((matcher or (lambda frame: True), future))
+        return future
+
+    def _forget_response(self, future: asyncio.Future):
+        self._pending_responses = [
+            pending for pending in self._pending_responses if pending[1] is not future
+        ]
+        if future.done() and not future.cancelled():
+            future.exception()  # retrieved, silence asyncio
+
+    async def async_make_request(
+        self,
+        value,
+        priority=PRIORITY_INTERACTIVE,
+        expect: Callable[[bytes], bool] | None = None,
+    ) -> bytes | None:
+        """Write a GATT Command without callback - not utf-8.
+
+        Returns the first frame notified after writing that expect accepts
+        (any frame if not given), other frames only reach the callback.
+
+        value may also be a callable returning the command, it is then built once
+        the request is next in line. If it returns None, nothing is sent.
+
+        Failed attempts are retried as the retry policy says. The lock is only
+        held during an attempt, so other requests can go ahead while backing off.
+        Time spent waiting for a connection slot counts for the deadline.
+        Requests of higher priority (lower value) are served first.
+        :raises CircuitOpenException: If the device failed too often recently.
+        """
+
+        def prepare():
+            nonlocal value
+            if callable(value):
+                value = value()
+            return value is not None
+
+        async def attempt(conn: BleakClient):
+            if value == "ONLY CONNECT":
+                return None
+            return await self._async_send(conn, value, expect)
+
+        return await self._async_with_retries(attempt, priority, prepare)
+
+    async def async_make_requests(
+        self, requests: list, priority=PRIORITY_INTERACTIVE
+    ) -> list:
+        """Send several commands back to back over one connection and one
+        notification subscription.
+
+        requests are (value, expect) pairs like the arguments of
+        async_make_request, a callable value is built right before it is sent
+        and skipped if it builds None.
+        Returns the response frame or the exception of each command: a failed
+        command is retried from where it broke as long as the retry policy
+        allows, after that the remaining commands fail with its exception.
+        """
+        results: list = []
+
+        async def attempt(conn: BleakClient):
+            while len(results) < len(requests):
+                value, expect = requests[len(results)]
+                if callable(value):
+                    try:
+                        value = value()
+                    except Exception as ex:  # only this command fails
+                        results.append(ex)
+                        continue
+                if value is None:
+                    results.append(None)  # nothing left to send
+                    continue
+                results.append(await self._async_send(conn, value, expect))
+
+        try:
+            await self._async_with_retries(attempt, priority)
+        except Exception as ex:
+            results.extend(ex for _ in range(len(requests) - len(results)))
+        return results
+
+    async def async_make_pipelined_requests(
+        self, requests: list, priority=PRIORITY_INTERACTIVE, window=PIPELINE_WINDOW
+    ) -> list[bytes]:
+        """Send several queries over one connection without waiting for each
+        response before sending the next one, up to window at once.
+
+        requests are (value, expect) pairs like the arguments of
+        async_make_request, expect must only accept the response of its own
+        query since responses are matched in any order. A failed attempt is
+        retried with the queries that have no response yet.
+        Returns the response frames in the order of requests.
+        """
+        responses: list = [None] * len(requests)
+
+        async def send(conn: BleakClient, index: int, in_flight, writing):
+            value, expect = requests[index]
+            async with in_flight:
+                response = self._expect_response(expect)
+                try:
+                    async with writing:
+                        await conn.write_gatt_char(PROP_WRITE_UUID, value)
+                    responses[index] = await asyncio.wait_for(
+                        asyncio.shield(response), self._retry_policy.request_timeout
+                    )
+                finally:
+                    self._forget_response(response)
+
+        async def attempt(conn: BleakClient):
+            await self._async_start_notify(conn)
+            in_flight = asyncio.Semaphore(window)
+            writing = asyncio.Lock()  # one write to the characteristic at a time
+            tasks = [
+                asyncio.ensure_future(send(conn, index, in_flight, writing))
+                for index, response in enumerate(responses)
+                if response is None
+            ]
             try:
-                await self._async_make_request_try(value, retries)
+                await asyncio.gather(*tasks)
             finally:
-                self.retries = 0
-                self._on_connection_event()
+                for task in tasks:
+                    task.cancel()
 
-    async def _async_make_request_try(self, value, retries):
-        self.retries = 0
-        while True:
-            self.retries += 1
+        await self._async_with_retries(attempt, priority)
+        return responses
+
+    async def _async_with_retries(self, attempt, priority, prepare=None):
+        """Run attempt(connection) as the retry policy says and return its result.
+        prepare is called before the first attempt, once the request is next in
+        line; if it returns False nothing is done."""
+        trial = self._circuit_breaker.check()
+        policy = self._retry_policy
+        started = monotonic()
+        deadline = started + policy.deadline
+        attempts = 0
+        prepared = prepare is None
+        try:
+            while True:
+                # the slot is waited for before the thermostat, so that requests
+                # are served by priority across the fleet, not only per device
+                await self._async_acquire_slot(priority, deadline - monotonic())
+                # only one concurrent request per thermostat
+                async with self._lock.hold(priority):
+                    if not prepared:
+                        if not prepare():
+                            if self._conn is None:
+                                self._release_slot()  # taken for nothing
+                            return None
+                        prepared = True
+                    if self._scheduler is not None and self._slot is None:
+                        continue  # the slot was given back while waiting
+                    attempts += 1
+                    self._cancel_idle_timer()
+                    self.retries = attempts
+                    self._on_connection_event()
+                    try:
+                        response = await asyncio.wait_for(
+                            self._async_attempt(attempt),
+                            max(deadline - monotonic(), 0),
+                        )
+                        self._circuit_breaker.record_success()
+                        self.latency[priority].record(monotonic() - started)
+                        return response
+                    except Exception as ex:
+                        self.throw_if_terminating()
+                        # don't reuse a connection that just failed us
+                        await self.async_disconnect()
+                        _LOGGER.warning(
+                            "[%s] Broken connection [retry %s/%s]: %s",
+                            self._name,
+                            attempts,
+                            policy.max_attempts,
+                            ex,
+                        )
+                        back_off = policy.back_off_for(attempts)
+                        if (
+                            attempts >= policy.max_attempts
+                            or monotonic() + back_off >= deadline
+                        ):
+                            self._circuit_breaker.record_failure()
+                            raise ex
+                    finally:
+                        self._start_idle_timer()
+                await asyncio.sleep(back_off)
+        finally:
+            if trial:
+                self._circuit_breaker.end_trial()  # no-op once recorded
+            self.retries = 0
             self._on_connection_event()
-            try:
-                self.throw_if_terminating()
-                conn = await self.async_get_connection()
-                self._notify_event.clear()
-                if value != "ONLY CONNECT":
-                    await conn.start_notify(PROP_NTFY_UUID, self.on_notification)
-                    await conn.write_gatt_char(PROP_WRITE_UUID, value)
-                    await asyncio.wait_for(self._notify_event.wait(), REQUEST_TIMEOUT)
-                    await conn.stop_notify(PROP_NTFY_UUID)
-                return
-            except Exception as ex:
-                self.throw_if_terminating()
-                _LOGGER.warning(
-                    "[%s] Broken connection [retry %s/%s]: %s",
-                    self._name,
-                    self.retries,
-                    retries,
-                    ex,
-                )
-                if self.retries >= retries:
-                    raise ex
-                await asyncio.sleep(RETRY_BACK_OFF)
+
+    async def _async_attempt(self, attempt):
+        self.throw_if_terminating()
+        conn = await self.async_get_connection()
+        result = await attempt(conn)
+        await self._async_stop_notify(conn)
+        return result
+
+    async def _async_send(self, conn: BleakClient, value, expect) -> bytes:
+        """Write one command and wait for its response."""
+        await self._async_start_notify(conn)
+        response = self._expect_response(expect)
+        try:
+            await conn.write_gatt_char(PROP_WRITE_UUID, value)
+            return await asyncio.wait_for(
+                asyncio.shield(response), self._retry_policy.request_timeout
+            )
+        finally:
+            self._forget_response(response)
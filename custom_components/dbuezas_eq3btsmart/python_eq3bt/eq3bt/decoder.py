@@ -0,0 +1,243 @@
+"""
+Fast decoders of the frames sent by the thermostat.
+
+The construct structures in structures.py build nested Containers through
+several adapters on every frame. These decoders read the fixed layouts with
+precompiled struct formats and lookup tables instead, and fall back to the
+construct structures for any frame they don't handle, so results are always
+the same as Status.parse, Schedule.parse and DeviceId.parse.
+"""
+import struct
+from datetime import time, timedelta
+
+from construct import Bytes, EnumIntegerString
+
+from .structures import (
+    HOUR_24_PLACEHOLDER,
+    NAME_TO_CMD,
+    NAME_TO_DAY,
+    PROP_ID_RETURN,
+    PROP_INFO_RETURN,
+    PROP_SCHEDULE_RETURN,
+    AwayDataAdapter,
+    DeviceId,
+    Schedule,
+    Status,
+)
+
+_HEADER = struct.Struct("BBBBBB")  # cmd, 1, mode, valve, 4, target
+_AWAY = struct.Struct("4B")
+_PRESETS = struct.Struct("5B")
+_PAIR = struct.Struct("BB")
+_DEVICE_ID = struct.Struct("BB2x10s")
+
+# values of every possible byte, so decoding allocates nothing for them
+_TEMPERATURES = tuple(float(i / 2.0) for i in range(256))
+_WINDOW_OPEN_TIMES = tuple(timedelta(minutes=float(i * 5.0)) for i in range(256))
+_OFFSETS = tuple(float((i - 7) / 2.0) for i in range(256))
+
+
+def _schedule_time(value: int):
+    hours, minutes = divmod(value * 10, 60)
+    if hours == 24:
+        return HOUR_24_PLACEHOLDER
+    if hours > 24:
+        return None  # invalid, ends the schedule like in construct
+    return time(hour=hours, minute=minutes)
+
+
+_SCHEDULE_TIMES = tuple(_schedule_time(i) for i in range(256))
+_SCHEDULE_CMDS = {
+    value: EnumIntegerString.new(value, name) for name, value in NAME_TO_CMD.items()
+}
+_DAYS = {
+    value: EnumIntegerString.new(value, name) for name, value in NAME_TO_DAY.items()
+}
+_away_adapter = AwayDataAdapter(Bytes(4))
+
+
+_FLAG_NAMES = (
+    "MANUAL",
+    "AWAY",
+    "BOOST",
+    "DST",
+    "WINDOW",
+    "LOCKED",
+    "UNKNOWN",
+    "LOW_BATTERY",
+)
+
+
+class _ModeBits(int):
+    """Mode byte of the status, flags read like the construct FlagsEnum."""
+
+    __slots__ = ()
+
+    AUTO = property(lambda self: True)
+    MANUAL = property(lambda self: bool(self & 0x01))
+    AWAY = property(lambda self: bool(self & 0x02))
+    BOOST = property(lambda self: bool(self & 0x04))
+    DST = property(lambda self: bool(self & 0x08))
+    WINDOW = property(lambda self: bool(self & 0x10))
+    LOCKED = property(lambda self: bool(self & 0x20))
+    UNKNOWN = property(lambda self: bool(self & 0x40))
+    LOW_BATTERY = property(lambda self: bool(self & 0x80))
+
+    def __repr__(self):
+        return "_ModeBits(%s)" % "|".join(
+            name for bit, name in enumerate(_FLAG_NAMES) if self & 1 << bit
+        )
+
+
+_MODE_FLAGS = tuple(_ModeBits(i) for i in range(256))
+
+
+class Presets:
+    __slots__ = (
+        "window_open_temp",
+        "window_open_time",
+        "comfort_temp",
+        "eco_temp",
+        "offset",
+    )
+
+    def __init__(
+        self, window_open_temp, window_open_time, comfort_temp, eco_temp, offset
+    ):
+        self.window_open_temp = window_open_temp
+        self.window_open_time = window_open_time
+        self.comfort_temp = comfort_temp
+        self.eco_temp = eco_temp
+        self.offset = offset
+
+    def __repr__(self):
+        return "Presets(%s)" % ", ".join(
+            "%s=%s" % (name, getattr(self, name)) for name in self.__slots__
+        )
+
+
+class StatusFrame:
+    __slots__ = ("cmd", "mode", "valve", "target_temp", "away", "presets")
+
+    def __init__(self, mode, valve, target_temp, away, presets):
+        self.cmd = PROP_INFO_RETURN
+        self.mode = mode
+        self.valve = valve
+        self.target_temp = target_temp
+        self.away = away
+        self.presets = presets
+
+    def __repr__(self):
+        return "Status(%s)" % ", ".join(
+            "%s=%r" % (name, getattr(self, name)) for name in self.__slots__
+        )
+
+
+class ScheduleEntry:
+    __slots__ = ("target_temp", "next_change_at")
+
+    def __init__(self, target_temp, next_change_at):
+        self.target_temp = target_temp
+        self.next_change_at = next_change_at
+
+    def __repr__(self):
+        return "ScheduleEntry(%s, %s)" % (self.target_temp, self.next_change_at)
+
+
+class ScheduleFrame:
+    __slots__ = ("cmd", "day", "hours")
+
+    def __init__(self, cmd, day, hours):
+        self.cmd = cmd
+        self.day = day
+        self.hours = hours
+
+    def __repr__(self):
+        return "Schedule(%s, %s, %s)" % (self.cmd, self.day, self.hours)
+
+
+class DeviceIdFrame:
+    __slots__ = ("cmd", "version", "serial")
+
+    def __init__(self, version, serial):
+        self.cmd = PROP_ID_RETURN
+        self.version = version
+        self.serial = serial
+
+    def __repr__(self):
+        return "DeviceId(version=%s, serial=%s)" % (self.version, self.serial)
+
+
+def decode_status(frame: bytes | bytearray):
+    """Status.parse equivalent, None for frames that aren't a status (e.g. the
+    acknowledgement of a schedule write)."""
+    if len(frame) < 2 or frame[1] != 0x01:
+        return None
+    try:
+        cmd, _, mode, valve, const, target = _HEADER.unpack_from(frame)
+        if cmd != PROP_INFO_RETURN or const != 0x04:
+            raise ValueError("Unexpected status layout")
+        flags = _MODE_FLAGS[mode]
+        away = None
+        if len(frame) >= 10:
+            if flags & 0x02:
+                away = _away_adapter._decode(_AWAY.unpack_from(frame, 6), None, None)
+            else:
+                away = bytes(frame[6:10])
+        elif flags & 0x02:
+            raise ValueError("Away data missing")
+        presets = None
+        if len(frame) >= 15:
+            window_temp, window_time, comfort, eco, offset = _PRESETS.unpack_from(
+                frame, 10
+            )
+            presets = Presets(
+                _TEMPERATURES[window_temp],
+                _WINDOW_OPEN_TIMES[window_time],
+                _TEMPERATURES[comfort],
+                _TEMPERATURES[eco],
+                _OFFSETS[offset],
+            )
+        return StatusFrame(flags, valve, _TEMPERATURES[target], away, presets)
+    except Exception:
+        return Status.parse(frame)  # raises the same errors as before
+
+
+def decode_schedule(frame: bytes | bytearray):
+    """Schedule.parse equivalent."""
+    cmd = _SCHEDULE_CMDS.get(frame[0])
+    day = _DAYS.get(frame[1]) if len(frame) > 1 else None
+    if cmd is None or day is None:
+        return Schedule.parse(frame)
+    hours = []
+    for offset in range(2, len(frame) - 1, 2):
+        temperature, until = _PAIR.unpack_from(frame, offset)
+        next_change_at = _SCHEDULE_TIMES[until]
+        if next_change_at is None:
+            break
+        hours.append(ScheduleEntry(_TEMPERATURES[temperature], next_change_at))
+    return ScheduleFrame(cmd, day, hours)
+
+
+def decode_device_id(frame: bytes | bytearray):
+    """DeviceId.parse equivalent."""
+    try:
+        if len(frame) < 15 or frame[0] != PROP_ID_RETURN:
+            raise ValueError("Unexpected device id layout")
+        _, version, serial = _DEVICE_ID.unpack_from(frame)
+        return DeviceIdFrame(version, bytearray(n - 0x30 for n in serial).decode())
+    except Exception:
+        return DeviceId.parse(frame)
+
+
+DECODERS = {
+    PROP_INFO_RETURN: decode_status,
+    PROP_SCHEDULE_RETURN: decode_schedule,
+    PROP_ID_RETURN: decode_device_id,
+}
+
+
+def decode(frame: bytes | bytearray):
+    """Decode a frame sent by the thermostat, None if it has no decoder."""
+    decoder = DECODERS.get(frame[0]) if frame else None
+    return decoder(frame) if decoder else None
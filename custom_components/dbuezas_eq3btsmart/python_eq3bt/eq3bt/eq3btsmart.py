@@ -4,22 +4,35 @@ Support for eq3 Bluetooth Smart thermostats.
 All temperatures in Celsius.
 
 To get the current state, update() has to be called for powersaving reasons.
-Schedule needs to be requested with query_schedule() before accessing for similar reasons.
+Schedule needs to be requested with query_schedule() before accessing for similar reasons,
+or restored from an earlier schedule_snapshot() with restore_schedule().
 """
 
+import asyncio
 import codecs
 import logging
 import struct
 from datetime import datetime, timedelta
 from enum import IntEnum
+from math import inf
+from time import monotonic, time
+from typing import Any, Iterable
 
 from construct import Byte
 
 from homeassistant.core import HomeAssistant
-from .structures import AwayDataAdapter, DeviceId, ModeFlags, Schedule, Status
+from .decoder import DeviceIdFrame, decode, decode_schedule
+from .retrypolicy import RetryPolicy
+from .scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, ConnectionScheduler
+from .state import FIELD_DEVICE_ID, FIELD_SCHEDULE, ThermostatState
+from .structures import NAME_TO_DAY, AwayDataAdapter
+from .timers import DeviceTimers
+from .weekschedule import WeekSchedule, encode_program, periods_of
 
 _LOGGER = logging.getLogger(__name__)
 
+_DAY_NAMES = {day: name for name, day in NAME_TO_DAY.items()}
+
 PROP_ID_QUERY = 0
 PROP_ID_RETURN = 1
 PROP_INFO_QUERY = 3
@@ -27,6 +40,7 @@ PROP_INFO_RETURN = 2
 PROP_COMFORT_ECO_CONFIG = 0x11
 PROP_OFFSET = 0x13
 PROP_WINDOW_OPEN_CONFIG = 0x14
+PROP_SCHEDULE_SET = 0x10
 PROP_SCHEDULE_QUERY = 0x20
 PROP_SCHEDULE_RETURN = 0x21
 
@@ -37,6 +51,11 @@ PROP_ECO = 0x44
 PROP_BOOST = 0x45
 PROP_LOCK = 0x80
 
+# seconds after a scheduled change the status is polled, see poll_delay
+SCHEDULE_POLL_DELAY = 60
+# seconds after the predicted end of a device timer its end is confirmed
+CONFIRMATION_DELAY = 5
+
 EQ3BT_AWAY_TEMP = 12.0
 EQ3BT_MIN_TEMP = 5.0
 EQ3BT_MAX_TEMP = 29.5
@@ -62,6 +81,43 @@ class TemperatureException(Exception):
     pass
 
 
+def _program(frame: bytes | bytearray) -> bytes:
+    """Temperature and time pairs of a schedule frame, up to the one ending at
+    24:00, so that written and read back programs compare equal."""
+    for offset in range(3, len(frame), 2):
+        if frame[offset] >= 0x90:
+            return bytes(frame[2 : offset + 1])
+    return bytes(frame[2:])
+
+
+def _is_status(frame: bytes) -> bool:
+    """Status, sent in response to status queries and most writes."""
+    return frame[0] == PROP_INFO_RETURN and frame[1] == 1
+
+
+def _is_write_response(frame: bytes) -> bool:
+    """Status or the acknowledgement of a schedule write."""
+    return frame[0] == PROP_INFO_RETURN
+
+
+def _is_device_id(frame: bytes) -> bool:
+    return frame[0] == PROP_ID_RETURN
+
+
+def _is_schedule_of(day: int):
+    return lambda frame: frame[0] == PROP_SCHEDULE_RETURN and frame[1] == day
+
+
+class _PendingWrite:
+    """A queued write whose values may still be replaced by newer writes."""
+
+    __slots__ = ("values", "task")
+
+    def __init__(self, values: dict):
+        self.values = values
+        self.task: asyncio.Task  # set right after, before it is queued
+
+
 # pylint: disable=too-many-instance-attributes
 class Thermostat:
     """Representation of a EQ3 Bluetooth Smart thermostat."""
@@ -71,28 +127,132 @@ class Thermostat:
         _mac: str,
         name: str,
         _hass: HomeAssistant,
+        idle_timeout: float | None = None,
+        push_mode: bool = False,
+        retry_policy: RetryPolicy | None = None,
+        scheduler: ConnectionScheduler | None = None,
+        connection_cls=None,
+        min_event_interval: float = 0,
     ):
-        """Initialize the thermostat."""
+        """Initialize the thermostat.
+
+        :param connection_cls: Replaces BleakConnection, e.g. with the
+            simulator.SimulatedConnection.
+        :param min_event_interval: Minimum seconds between two connection state
+            pushes, see BleakConnection.register_connection_callback.
+        """
 
         self.name = name
-        self._status = None
-        self._presets = None
-        self._device_data = None
+        self._state: ThermostatState | None = None
+        self._device_data: DeviceIdFrame | None = None
+        self._device_data_received_at: float | None = None  # wall clock time
         self._schedule = {}
+        # eq3 day -> (program, wall clock time it was received), see _program
+        self._schedule_programs: dict[int, tuple[bytes, float]] = {}
+        self._week_schedule = WeekSchedule()
         self.default_away_days: float = 30
         self.default_away_temp: float = 12
 
-        from .bleakconnection import BleakConnection
-
-        self._on_update_callbacks = []
-        self._conn = BleakConnection(_mac, name, _hass, self.handle_notification)
+        from .bleakconnection import IDLE_TIMEOUT, BleakConnection
+
+        # (callback, field groups it wants or None for any)
+        self._on_update_callbacks: list[tuple] = []
+        # identical read requests that are queued or running, see _async_single_flight
+        self._in_flight: dict[tuple, asyncio.Task] = {}
+        self.collapsed_requests = 0
+        # writes of idempotent settings not sent yet, see _async_coalesced_write
+        self._pending_writes: dict[str, _PendingWrite] = {}
+        self.coalesced_writes = 0
+        self.skipped_polls = 0
+        self.regular_polls = 0
+        self.confirmation_polls = 0
+        self.predicted_transitions = 0
+        self.schedule_days_written = 0
+        self.schedule_days_skipped = 0
+        self._batches_running = 0
+        self._batch_changed: set[str] = set()
+        # boost, open window and away end by themselves, see _on_timer_end
+        self._timers = DeviceTimers()
+        self._timer_handle: asyncio.TimerHandle | None = None
+        self._confirmation: asyncio.Task | None = None
+        self.confirmation_delay: float = CONFIRMATION_DELAY
+        self._conn = (connection_cls or BleakConnection)(
+            _mac,
+            name,
+            _hass,
+            self.handle_notification,
+            idle_timeout=IDLE_TIMEOUT if idle_timeout is None else idle_timeout,
+            push_mode=push_mode,
+            retry_policy=retry_policy,
+            scheduler=scheduler,
+            min_event_interval=min_event_interval,
+        )
 
-    def register_update_callback(self, on_update):
-        self._on_update_callbacks.append(on_update)
+    def register_update_callback(self, on_update, *fields: str):
+        """Call on_update when any of the field groups changed, e.g.
+        state.FIELD_VALVE, or when anything changed if no fields are given."""
+        self._on_update_callbacks.append((on_update, frozenset(fields) or None))
 
     def shutdown(self):
+        if self._timer_handle is not None:
+            self._timer_handle.cancel()
+        if self._confirmation is not None:
+            self._confirmation.cancel()
         self._conn.shutdown()
 
+    @property
+    def diagnostics(self) -> dict:
+        """Request counters, used by the integration diagnostics."""
+        return {
+            "collapsed_requests": self.collapsed_requests,
+            "coalesced_writes": self.coalesced_writes,
+            "skipped_polls": self.skipped_polls,
+            "regular_polls": self.regular_polls,
+            "confirmation_polls": self.confirmation_polls,
+            "predicted_transitions": self.predicted_transitions,
+            "schedule_days_written": self.schedule_days_written,
+            "schedule_days_skipped": self.schedule_days_skipped,
+            "state_version": self._state and self._state.version,
+            "status_restored": self.status_restored,
+            "schedule_ages": {
+                day: round(time() - received_at)
+                for day, (_, received_at) in self._schedule_programs.items()
+            },
+            "in_flight": [" ".join(map(str, key)) for key in self._in_flight],
+            "connection": self._conn.diagnostics,
+        }
+
+    def batch(self) -> "ThermostatBatch":
+        """Collect commands to send back to back over a single connection, e.g.
+        to apply a whole room profile:
+
+            async with thermostat.batch() as batch:
+                batch.set_temperature_presets(comfort=21, eco=17)
+                batch.set_schedule(day, hours)
+                batch.set_mode(Mode.Auto)
+        """
+        return ThermostatBatch(self)
+
+    async def _async_single_flight(self, key: tuple, request):
+        """Run a read request once for all callers asking the same while it is
+        queued or running; later callers await the result of the first one."""
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.collapsed_requests += 1
+            _LOGGER.debug("[%s] Joining in flight request %s", self.name, key)
+            return await asyncio.shield(task)
+
+        task = asyncio.get_event_loop().create_task(request())
+        self._in_flight[key] = task
+
+        def done(task: asyncio.Task):
+            self._in_flight.pop(key, None)
+            if not task.cancelled():
+                task.exception()  # retrieved by the callers, silence asyncio
+
+        task.add_done_callback(done)
+        return await asyncio.shield(task)
+
     def _verify_temperature(self, temp):
         """Verifies that the temperature is valid.
         :raises TemperatureException: On invalid temperature.
@@ -106,7 +266,7 @@ class Thermostat:
 
     def parse_schedule(self, data):
         """Parses the device sent schedule."""
-        sched = Schedule.parse(data)
+        sched = decode_schedule(data)
         if sched == None:
             raise Exception("Parsed empty schedule data")
         _LOGGER.debug("[%s] Got schedule data for day '%s'", self.name, sched.day)
@@ -116,45 +276,199 @@ class Thermostat:
     def handle_notification(self, data: bytearray):
         """Handle Callback from a Bluetooth (GATT) request."""
         _LOGGER.debug("[%s] Received notification from the device.", self.name)
-        updated = True
-        if data[0] == PROP_INFO_RETURN and data[1] == 1:
-            _LOGGER.debug("[%s] Got status: %s", self.name, codecs.encode(data, "hex"))
-            self._status = Status.parse(data)
-            self._presets = self._status.presets
-            _LOGGER.debug("[%s] Parsed status: %s", self.name, self._status)
+        parsed = decode(data)
+        if parsed is None:
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug(
+                    "[%s] Unknown notification %s (%s)",
+                    self.name,
+                    data[0],
+                    codecs.encode(data, "hex"),
+                )
+            return
+
+        if data[0] == PROP_INFO_RETURN:
+            previous = self._state
+            self._state = ThermostatState.from_status(parsed, previous, monotonic())
+            _LOGGER.debug("[%s] Parsed status: %s", self.name, self._state)
+            self._timers.observe(self._state, previous)
+            self._plan_timer_end()
+            self._notify_update(self._state.changed_fields(previous))
 
         elif data[0] == PROP_SCHEDULE_RETURN:
-            parsed = self.parse_schedule(data)
-            self._schedule[parsed.day] = parsed
+            _LOGGER.debug("[%s] Got schedule data for day '%s'", self.name, parsed.day)
+            if self._store_schedule(parsed, _program(data)):
+                self._notify_update({FIELD_SCHEDULE})
 
         elif data[0] == PROP_ID_RETURN:
-            self._device_data = DeviceId.parse(data)
-            _LOGGER.debug("[%s] Parsed device data: %s", self.name, self._device_data)
-
-        else:
-            updated = False
-            _LOGGER.debug(
-                "[%s] Unknown notification %s (%s)",
-                self.name,
-                data[0],
-                codecs.encode(data, "hex"),
+            _LOGGER.debug("[%s] Parsed device data: %s", self.name, parsed)
+            previous_id = self._device_data
+            self._device_data = parsed
+            self._device_data_received_at = time()
+            if previous_id is None or (previous_id.version, previous_id.serial) != (
+                parsed.version,
+                parsed.serial,
+            ):
+                self._notify_update({FIELD_DEVICE_ID})
+
+    def _plan_timer_end(self):
+        if self._timer_handle is not None:
+            self._timer_handle.cancel()
+            self._timer_handle = None
+        end = self._timers.next_end()
+        if end is not None:
+            self._timer_handle = asyncio.get_event_loop().call_later(
+                max(end - monotonic(), 0), self._on_timer_end
+            )
+
+    def _on_timer_end(self):
+        """Show the end of a device timer when it is predicted, and poll once a
+        bit later to confirm it instead of polling until it shows."""
+        self._timer_handle = None
+        previous = self._state
+        if previous is None:
+            return
+        self._state = self._timers.expire(
+            previous, monotonic(), self.scheduled_temperature
+        )
+        self._plan_timer_end()
+        if self._state is previous:
+            return
+        _LOGGER.debug("[%s] Predicted status: %s", self.name, self._state)
+        self.predicted_transitions += 1
+        self._notify_update(self._state.changed_fields(previous))
+        if self._confirmation is None or self._confirmation.done():
+            self._confirmation = asyncio.get_event_loop().create_task(
+                self._async_confirm()
+            )
+
+    async def _async_confirm(self):
+        await asyncio.sleep(self.confirmation_delay)
+        try:
+            await self._async_single_flight(
+                ("status",), lambda: self._async_update(confirmation=True)
             )
-        if updated:
-            for callback in self._on_update_callbacks:
+        except Exception as ex:
+            _LOGGER.warning("[%s] Confirming poll failed: %s", self.name, ex)
+
+    def _store_schedule(
+        self, parsed, program: bytes, received_at: float | None = None
+    ) -> bool:
+        """Keep the program of a day, True if it differs from the known one."""
+        day = int(parsed.day)
+        previous = self._schedule_programs.get(day)
+        self._schedule[parsed.day] = parsed
+        if previous is None or previous[0] != program:
+            self._week_schedule.set_program(day, program)
+        self._schedule_programs[day] = (
+            program,
+            time() if received_at is None else received_at,
+        )
+        return previous is None or previous[0] != program
+
+    def _notify_update(self, changed: set[str]):
+        """Call the update callbacks subscribed to the changed field groups."""
+        if not changed:
+            return
+        if self._batches_running:
+            self._batch_changed |= changed  # notified once the batch is done
+            return
+        for callback, fields in self._on_update_callbacks:
+            if fields is None or not fields.isdisjoint(changed):
                 callback()
 
+    async def _async_coalesced_write(self, key: str, encode, **values):
+        """Queue a write of an idempotent setting.
+
+        Until the frame is sent, newer writes of the same setting are merged into
+        it (None values keep the queued ones), so a burst of changes ends up as a
+        single write of the final state. encode builds the frame from the merged
+        values right before sending."""
+        values = {name: value for name, value in values.items() if value is not None}
+        pending = self._pending_writes.get(key)
+        if pending is not None:
+            self.coalesced_writes += 1
+            pending.values.update(values)
+            _LOGGER.debug("[%s] Merged %s into queued write", self.name, key)
+            return await asyncio.shield(pending.task)
+
+        pending = _PendingWrite(values)
+
+        def build():
+            if self._pending_writes.get(key) is pending:
+                del self._pending_writes[key]  # later writes need a new frame
+            return encode(**pending.values)
+
+        def done(task: asyncio.Task):
+            if self._pending_writes.get(key) is pending:
+                del self._pending_writes[key]
+            if not task.cancelled():
+                task.exception()  # retrieved by the callers, silence asyncio
+
+        task = asyncio.get_event_loop().create_task(
+            self._conn.async_make_request(
+                build, PRIORITY_INTERACTIVE, expect=_is_write_response
+            )
+        )
+        task.add_done_callback(done)
+        pending.task = task
+        self._pending_writes[key] = pending
+        return await asyncio.shield(task)
+
+    async def _async_write(self, value):
+        """Send a write that must keep its place relative to the queued ones."""
+        # queued writes must not absorb changes made after this one
+        self._pending_writes.clear()
+        await self._conn.async_make_request(
+            value, PRIORITY_INTERACTIVE, expect=_is_write_response
+        )
+
     async def async_query_id(self):
-        """Query device identification information, e.g. the serial number."""
+        """Query device identification information, e.g. the serial number.
+        :return: The parsed DeviceId."""
+        return await self._async_single_flight(("id",), self._async_query_id)
+
+    async def _async_query_id(self):
         _LOGGER.debug("[%s] Querying id..", self.name)
         value = struct.pack("B", PROP_ID_QUERY)
-        await self._conn.async_make_request(value)
+        await self._conn.async_make_request(
+            value, PRIORITY_BACKGROUND, expect=_is_device_id
+        )
         _LOGGER.debug("[%s] Finished Querying id..", self.name)
+        # the response was handled by handle_notification before returning
+        return self._device_data
 
     async def async_update(self):
-        """Update the data from the thermostat. Always sets the current time."""
+        """Update the data from the thermostat. Always sets the current time.
+        :return: The ThermostatState."""
+        return await self._async_single_flight(("status",), self._async_update)
+
+    async def _async_update(self, confirmation: bool = False):
         _LOGGER.debug("[%s] Querying the device..", self.name)
+        queued_at = monotonic()
+
+        def build():
+            if self._state is not None and self._state.received_at > queued_at:
+                # a write answered with the status while this poll was queued
+                _LOGGER.debug("[%s] Skipping poll, status is fresh", self.name)
+                self.skipped_polls += 1
+                return None
+            # only the polls sent are counted, not the ones collapsed or skipped
+            if confirmation:
+                self.confirmation_polls += 1
+            else:
+                self.regular_polls += 1
+            return self._encode_status_query()
+
+        await self._conn.async_make_request(
+            build, PRIORITY_BACKGROUND, expect=_is_status
+        )
+        return self._state
+
+    def _encode_status_query(self) -> bytes:
+        """Status query, also sets the current time."""
         time = datetime.now()
-        value = struct.pack(
+        return struct.pack(
             "BBBBBBB",
             PROP_INFO_QUERY,
             time.year % 100,
@@ -165,9 +479,14 @@ class Thermostat:
             time.second,
         )
 
-        await self._conn.async_make_request(value)
-
     async def async_query_schedule(self, day):
+        """Query the schedule of a day.
+        :return: The parsed Schedule of the day."""
+        return await self._async_single_flight(
+            ("schedule", day), lambda: self._async_query_schedule(day)
+        )
+
+    async def _async_query_schedule(self, day):
         _LOGGER.debug("[%s] Querying schedule..", self.name)
 
         if day < 0 or day > 6:
@@ -175,7 +494,57 @@ class Thermostat:
 
         value = struct.pack("BB", PROP_SCHEDULE_QUERY, day)
 
-        await self._conn.async_make_request(value)
+        frame = await self._conn.async_make_request(
+            value, PRIORITY_BACKGROUND, expect=_is_schedule_of(day)
+        )
+        return self.parse_schedule(frame)
+
+    async def async_query_full_schedule(self, days: Iterable[int] = range(7)) -> dict:
+        """Query the programs of several days, the whole week by default, over
+        one connection with up to PIPELINE_WINDOW queries in flight.
+        :return: The parsed Schedule of each day, by eq3 day number."""
+        days = tuple(days)
+        # own key space, ("schedule", day) is a single day's Schedule
+        return await self._async_single_flight(
+            ("week",) + days, lambda: self._async_query_full_schedule(days)
+        )
+
+    async def _async_query_full_schedule(self, days: tuple) -> dict:
+        _LOGGER.debug("[%s] Querying schedule of days %s", self.name, days)
+        for day in days:
+            if day < 0 or day > 6:
+                raise ValueError("Invalid day: %s" % day)
+        frames = await self._conn.async_make_pipelined_requests(
+            [
+                (struct.pack("BB", PROP_SCHEDULE_QUERY, day), _is_schedule_of(day))
+                for day in days
+            ],
+            PRIORITY_BACKGROUND,
+        )
+        return {day: self.parse_schedule(frame) for day, frame in zip(days, frames)}
+
+    @property
+    def push_mode(self) -> bool:
+        """Returns True if the device status is pushed over a kept open connection."""
+        return self._conn.push_mode
+
+    @property
+    def pushing(self) -> bool:
+        """Returns True while the status is pushed, push mode connections are
+        closed when another thermostat needs their connection slot."""
+        return self._conn.pushing
+
+    @property
+    def state(self) -> ThermostatState | None:
+        """What the thermostat reported in its last status, None if never."""
+        return self._state
+
+    @property
+    def status_age(self) -> float | None:
+        """Seconds since the last status was received, None if never."""
+        if self._state is None:
+            return None
+        return monotonic() - self._state.received_at
 
     @property
     def schedule(self):
@@ -184,53 +553,231 @@ class Thermostat:
         """
         return self._schedule
 
+    def poll_delay(
+        self, floor: float, ceiling: float, now: datetime | None = None
+    ) -> float:
+        """Seconds until the status is worth polling again: shortly after the
+        next scheduled change while the thermostat follows its schedule, else
+        ceiling, but never less than floor."""
+        delay = ceiling
+        if self.mode == Mode.Auto and not (self.boost or self.window_open):
+            now = now or datetime.now()
+            change = self._week_schedule.next_change(now)
+            if change is not None:
+                until = (change[0] - now).total_seconds()
+                delay = min(delay, until + SCHEDULE_POLL_DELAY)
+        return max(floor, delay)
+
+    @property
+    def week_schedule(self) -> WeekSchedule:
+        """The known day programs, for lookups without querying the device."""
+        return self._week_schedule
+
+    @property
+    def scheduled_temperature(self) -> float | None:
+        """Target temperature the schedule has for now, None if not known."""
+        return self._week_schedule.target_at(datetime.now())
+
+    @property
+    def next_schedule_change(self) -> tuple[datetime, float] | None:
+        """When and to which temperature the schedule changes next."""
+        return self._week_schedule.next_change(datetime.now())
+
+    def schedule_snapshot(self) -> list[dict]:
+        """The known day programs with the time they were received, JSON
+        serializable for restore_schedule."""
+        return [
+            {"day": day, "program": program.hex(), "received_at": received_at}
+            for day, (program, received_at) in sorted(self._schedule_programs.items())
+        ]
+
+    def restore_schedule(self, snapshot: list[dict]):
+        """Restore day programs of an earlier schedule_snapshot, without
+        contacting the thermostat. Days already known are kept."""
+        changed = False
+        for entry in snapshot:
+            day = entry["day"]
+            if day in self._schedule_programs:
+                continue
+            program = bytes.fromhex(entry["program"])
+            try:
+                parsed = self.parse_schedule(
+                    bytes([PROP_SCHEDULE_RETURN, day]) + program
+                )
+            except Exception as ex:
+                _LOGGER.warning("[%s] Ignoring stored schedule: %s", self.name, ex)
+                continue
+            changed |= self._store_schedule(parsed, program, entry["received_at"])
+        if changed:
+            self._notify_update({FIELD_SCHEDULE})
+
+    def status_snapshot(self) -> dict | None:
+        """The last status with the wall clock time it was received, JSON
+        serializable for restore_status. None if never received."""
+        status_age = self.status_age
+        if self._state is None or status_age is None:
+            return None
+        return {
+            "state": self._state.snapshot(),
+            "received_at": time() - status_age,
+        }
+
+    def restore_status(self, snapshot: dict | None):
+        """Restore the status of an earlier status_snapshot, without contacting
+        the thermostat. It is marked restored until the first status is
+        received, and a known status is kept."""
+        if snapshot is None or self._state is not None:
+            return
+        age = max(0.0, time() - snapshot["received_at"])
+        try:
+            state = ThermostatState.restore(snapshot["state"], monotonic() - age)
+        except (TypeError, ValueError) as ex:
+            _LOGGER.warning("[%s] Ignoring stored status: %s", self.name, ex)
+            return
+        self._state = state
+        self._notify_update(state.changed_fields(None))
+
+    @property
+    def status_restored(self) -> bool:
+        """True while the status is the one restored, see restore_status."""
+        return self._state is not None and self._state.restored
+
+    def device_id_snapshot(self) -> dict | None:
+        """The firmware version and serial with the time they were received,
+        JSON serializable for restore_device_id. None if never queried."""
+        if self._device_data is None:
+            return None
+        return {
+            "version": self._device_data.version,
+            "serial": self._device_data.serial,
+            "received_at": self._device_data_received_at,
+        }
+
+    def restore_device_id(self, snapshot: dict | None):
+        """Restore the device id of an earlier device_id_snapshot, without
+        contacting the thermostat. A known device id is kept."""
+        if snapshot is None or self._device_data is not None:
+            return
+        self._device_data = DeviceIdFrame(snapshot["version"], snapshot["serial"])
+        self._device_data_received_at = snapshot["received_at"]
+        self._notify_update({FIELD_DEVICE_ID})
+
+    @property
+    def device_id_age(self) -> float | None:
+        """Seconds since the device id was received, None if never."""
+        if self._device_data_received_at is None:
+            return None
+        return time() - self._device_data_received_at
+
+    def stale_schedule_days(self, max_age: float) -> list[int]:
+        """Days whose program is unknown or older than max_age seconds."""
+        oldest = time() - max_age
+        return [
+            day
+            for day in range(7)
+            if day not in self._schedule_programs
+            or self._schedule_programs[day][1] < oldest
+        ]
+
+    async def async_refresh_schedule(self, max_age: float) -> list[int]:
+        """Query the programs of the days that are unknown or older than max_age
+        seconds.
+        :return: The refreshed days."""
+        days = self.stale_schedule_days(max_age)
+        if days:
+            await self.async_query_full_schedule(days)
+        return days
+
     async def async_set_schedule(self, day, hours):
         _LOGGER.debug(
             "[%s] Setting schedule day=[%s], hours=[%s]", self.name, day, hours
         )
 
         """Sets the schedule for the given day."""
-        data = Schedule.build(
-            {
-                "cmd": "write",
-                "day": day,
-                "hours": hours,
-            }
-        )
-        await self._conn.async_make_request(data)
-
-        parsed = self.parse_schedule(data)
-        self._schedule[parsed.day] = parsed
-        for callback in self._on_update_callbacks:
-            callback()
+        data = self._encode_schedule(day, hours)
+        await self._async_write(data)
+        self._on_schedule_written(data)
+
+    async def async_set_schedule_days(
+        self, days: Iterable, hours, max_age: float | None = None
+    ) -> dict[str, list]:
+        """Set the same program for several days, skipping the days that already
+        have it. Programs not known, or older than max_age seconds, are read
+        first; the changed days are written over one connection.
+        :return: The "written" and "skipped" days.
+        """
+        frames = {}
+        for day in days:
+            data = self._encode_schedule(day, hours)
+            frames[data[1]] = data
+        stale = self.stale_schedule_days(inf if max_age is None else max_age)
+        unknown = [day for day in stale if day in frames]
+        if unknown:
+            await self.async_query_full_schedule(unknown)
+        changed = {
+            day: data
+            for day, data in frames.items()
+            if self._schedule_programs[day][0] != _program(data)
+        }
+        if changed:
+            async with self.batch() as batch:
+                for data in changed.values():
+                    batch.set_schedule(data[1], hours)
+        self.schedule_days_written += len(changed)
+        self.schedule_days_skipped += len(frames) - len(changed)
+        return {
+            "written": [_DAY_NAMES[day] for day in frames if day in changed],
+            "skipped": [_DAY_NAMES[day] for day in frames if day not in changed],
+        }
+
+    def _encode_schedule(self, day, hours) -> bytes:
+        """Schedule write of a day (number or name) with hours as (temperature,
+        end minute) periods, or as dicts like Schedule.build takes them."""
+        day = NAME_TO_DAY[day] if isinstance(day, str) else int(day)
+        if not 0 <= day <= 6:
+            raise ValueError("Invalid day: %s" % day)
+        periods = [
+            period if isinstance(period, tuple) else periods_of([period])[0]
+            for period in hours
+        ]
+        return bytes([PROP_SCHEDULE_SET, day]) + encode_program(periods)
+
+    def _on_schedule_written(self, data: bytes):
+        if self._store_schedule(self.parse_schedule(data), _program(data)):
+            self._notify_update({FIELD_SCHEDULE})
 
     @property
-    def target_temperature(self):
+    def target_temperature(self) -> float:
         """Return the temperature we try to reach."""
-        return self._status.target_temp if self._status else -1
+        return self._state.target_temperature if self._state else -1
 
     async def async_set_target_temperature(self, temperature):
         """Set new target temperature."""
+        if temperature != EQ3BT_OFF_TEMP and temperature != EQ3BT_ON_TEMP:
+            self._verify_temperature(temperature)
+        await self._async_coalesced_write(
+            "target_temperature",
+            self._encode_target_temperature,
+            temperature=temperature,
+        )
+
+    def _encode_target_temperature(self, temperature) -> bytes:
         dev_temp = int(temperature * 2)
         if temperature == EQ3BT_OFF_TEMP or temperature == EQ3BT_ON_TEMP:
             dev_temp |= 0x40
-            value = struct.pack("BB", PROP_MODE_WRITE, dev_temp)
-        else:
-            self._verify_temperature(temperature)
-            value = struct.pack("BB", PROP_TEMPERATURE_WRITE, dev_temp)
-
-        await self._conn.async_make_request(value)
+            return struct.pack("BB", PROP_MODE_WRITE, dev_temp)
+        return struct.pack("BB", PROP_TEMPERATURE_WRITE, dev_temp)
 
     @property
     def mode(self):
         """Return the current operation mode"""
-        if self._status == None:
+        if self._state is None:
             return Mode.Unknown
         if self.target_temperature == EQ3BT_OFF_TEMP:
             return Mode.Off
         if self.target_temperature == EQ3BT_ON_TEMP:
             return Mode.On
-        if self._status.mode.MANUAL:
+        if self._state.manual:
             return Mode.Manual
         return Mode.Auto
 
@@ -242,28 +789,42 @@ class Thermostat:
             return await self.async_set_target_temperature(EQ3BT_OFF_TEMP)
         if mode == Mode.On:
             return await self.async_set_target_temperature(EQ3BT_ON_TEMP)
-        if mode == Mode.Auto:
-            return await self._async_set_mode(0)
+        if mode == Mode.Manual and (
+            self.target_temperature is None or self.status_restored
+        ):
+            await self.async_update()  # to know the temperature to keep
+        await self._async_write(self._encode_mode(mode))
+
+    def _encode_mode(self, mode) -> bytes:
+        if mode == Mode.Off:
+            return self._encode_target_temperature(EQ3BT_OFF_TEMP)
+        if mode == Mode.On:
+            return self._encode_target_temperature(EQ3BT_ON_TEMP)
         if mode == Mode.Manual:
             temperature = max(
                 min(self.target_temperature, EQ3BT_MAX_TEMP), EQ3BT_MIN_TEMP
             )
-            return await self._async_set_mode(0x40 | int(temperature * 2))
+            return struct.pack("BB", PROP_MODE_WRITE, 0x40 | int(temperature * 2))
+        return struct.pack("BB", PROP_MODE_WRITE, 0)  # auto
 
     @property
-    def away(self):
-        """Returns True if the thermostat is in boost mode."""
-        return self._status and self._status.mode.AWAY
+    def away(self) -> bool | None:
+        """Returns True if the thermostat is in away mode."""
+        return None if self._state is None else self._state.away
 
     @property
-    def away_end(self):
-        return self._status and self._status.away
+    def away_end(self) -> datetime | None:
+        """End of the away mode, None if not away."""
+        return None if self._state is None else self._state.away_end
 
     async def async_set_away(self, away: bool):
         """Sets away mode with default temperature."""
+        await self._async_write(self._encode_away(away))
+
+    def _encode_away(self, away: bool) -> bytes:
         if not away:
             _LOGGER.debug("[%s] Disabling away, going to auto mode.", self.name)
-            return await self._async_set_mode(0x00)
+            return struct.pack("BB", PROP_MODE_WRITE, 0x00)
 
         away_end = datetime.now() + timedelta(days=self.default_away_days)
         temperature = self.default_away_temp
@@ -273,123 +834,154 @@ class Thermostat:
         adapter = AwayDataAdapter(Byte[4])  # type: ignore
         packed = adapter.build(away_end)
 
-        await self._async_set_mode(0x80 | int(temperature * 2), packed)
-
-    async def _async_set_mode(self, mode, payload=None):
-        value = struct.pack("BB", PROP_MODE_WRITE, mode)
-        if payload:
-            value += payload
-        await self._conn.async_make_request(value)
+        return struct.pack("BB", PROP_MODE_WRITE, 0x80 | int(temperature * 2)) + packed
 
     @property
-    def boost(self):
+    def boost(self) -> bool | None:
         """Returns True if the thermostat is in boost mode."""
-        return self._status and self._status.mode.BOOST
+        return None if self._state is None else self._state.boost
 
     async def async_set_boost(self, boost):
         """Sets boost mode."""
         _LOGGER.debug("[%s] Setting boost mode: %s", self.name, boost)
         value = struct.pack("BB", PROP_BOOST, bool(boost))
-        await self._conn.async_make_request(value)
+        await self._async_write(value)
 
     @property
-    def valve_state(self):
+    def valve_state(self) -> int | None:
         """Returns the valve state. Probably reported as percent open."""
-        return self._status and self._status.valve
+        return None if self._state is None else self._state.valve
 
     @property
-    def window_open(self):
+    def window_open(self) -> bool | None:
         """Returns True if the thermostat reports a open window
         (detected by sudden drop of temperature)"""
-        return self._status and self._status.mode.WINDOW
+        return None if self._state is None else self._state.window_open
 
-    async def async_window_open_config(self, temperature, duration):
+    async def async_window_open_config(
+        self, temperature: float | None, duration: timedelta | None
+    ):
         """Configures the window open behavior. The duration is specified in
-        5 minute increments."""
+        5 minute increments. None keeps the current value."""
         _LOGGER.debug(
             "[%s] Window open config, temperature: %s duration: %s",
             self.name,
             temperature,
             duration,
         )
-        self._verify_temperature(temperature)
-        if duration.seconds < 0 and duration.seconds > 3600:
+        if temperature is not None:
+            self._verify_temperature(temperature)
+        if duration is not None and duration.seconds < 0 and duration.seconds > 3600:
             raise ValueError
+        if None in (temperature, duration) and (
+            self.window_open_time is None or self.status_restored
+        ):
+            await self.async_update()  # to know the value to keep
+        await self._async_coalesced_write(
+            "window_open_config",
+            self._encode_window_open_config,
+            temperature=temperature,
+            duration=duration,
+        )
 
-        value = struct.pack(
+    def _encode_window_open_config(self, temperature=None, duration=None) -> bytes:
+        """None values are filled in from the current config."""
+        if temperature is None:
+            temperature = self.window_open_temperature
+        if duration is None:
+            duration = self.window_open_time
+        if temperature is None or duration is None:
+            raise TemperatureException("Unknown current window open config")
+        return struct.pack(
             "BBB",
             PROP_WINDOW_OPEN_CONFIG,
             int(temperature * 2),
             int(duration.seconds / 300),
         )
-        await self._conn.async_make_request(value)
 
     @property
-    def window_open_temperature(self):
+    def window_open_temperature(self) -> float | None:
         """The temperature to set when an open window is detected."""
-        return self._presets and self._presets.window_open_temp
+        return None if self._state is None else self._state.window_open_temperature
 
     @property
     def window_open_time(self) -> timedelta | None:
         """Timeout to reset the thermostat after an open window is detected."""
-        return self._presets and self._presets.window_open_time  # type: ignore
+        return None if self._state is None else self._state.window_open_time
 
     @property
-    def unknown(self):
+    def unknown(self) -> bool | None:
         """Returns True if the thermostat is in unknown state."""
-        return self._status and self._status.mode.UNKNOWN
+        return None if self._state is None else self._state.unknown
 
     @property
-    def dst(self):
+    def dst(self) -> bool | None:
         """Returns True if the thermostat is in Daylight Saving Time."""
-        return self._status and self._status.mode.DST
+        return None if self._state is None else self._state.dst
 
     @property
-    def locked(self):
+    def locked(self) -> bool | None:
         """Returns True if the thermostat is locked."""
-        return self._status and self._status.mode.LOCKED
+        return None if self._state is None else self._state.locked
 
     async def async_set_locked(self, lock):
         """Locks or unlocks the thermostat."""
         _LOGGER.debug("[%s] Setting the lock: %s", self.name, lock)
         value = struct.pack("BB", PROP_LOCK, bool(lock))
-        await self._conn.async_make_request(value)
+        await self._async_write(value)
 
     @property
-    def low_battery(self):
+    def low_battery(self) -> bool | None:
         """Returns True if the thermostat reports a low battery."""
-        return self._status and self._status.mode.LOW_BATTERY
+        return None if self._state is None else self._state.low_battery
 
-    async def async_temperature_presets(self, comfort, eco):
+    async def async_temperature_presets(self, comfort: float | None, eco: float | None):
         """Set the thermostats preset temperatures comfort (sun) and
-        eco (moon)."""
+        eco (moon). None keeps the current value."""
         _LOGGER.debug(
             "[%s] Setting temperature presets, comfort: %s eco: %s",
             self.name,
             comfort,
             eco,
         )
-        self._verify_temperature(comfort)
-        self._verify_temperature(eco)
-        value = struct.pack(
+        if comfort is not None:
+            self._verify_temperature(comfort)
+        if eco is not None:
+            self._verify_temperature(eco)
+        if None in (comfort, eco) and (
+            self.comfort_temperature is None or self.status_restored
+        ):
+            await self.async_update()  # to know the value to keep
+        await self._async_coalesced_write(
+            "presets", self._encode_presets, comfort=comfort, eco=eco
+        )
+
+    def _encode_presets(self, comfort=None, eco=None) -> bytes:
+        """None values are filled in from the current presets."""
+        if comfort is None:
+            comfort = self.comfort_temperature
+        if eco is None:
+            eco = self.eco_temperature
+        if comfort is None or eco is None:
+            raise TemperatureException("Unknown current preset temperatures")
+        return struct.pack(
             "BBB", PROP_COMFORT_ECO_CONFIG, int(comfort * 2), int(eco * 2)
         )
-        await self._conn.async_make_request(value)
 
     @property
-    def comfort_temperature(self):
+    def comfort_temperature(self) -> float | None:
         """Returns the comfort temperature preset of the thermostat."""
-        return self._presets and self._presets.comfort_temp
+        return None if self._state is None else self._state.comfort_temperature
 
     @property
-    def eco_temperature(self):
+    def eco_temperature(self) -> float | None:
         """Returns the eco temperature preset of the thermostat."""
-        return self._presets and self._presets.eco_temp
+        return None if self._state is None else self._state.eco_temperature
 
     @property
-    def temperature_offset(self):
+    def temperature_offset(self) -> float | None:
         """Returns the thermostat's temperature offset."""
-        return self._presets and self._presets.offset
+        return None if self._state is None else self._state.temperature_offset
 
     async def async_set_temperature_offset(self, offset):
         """Sets the thermostat's temperature offset."""
@@ -398,25 +990,26 @@ class Thermostat:
         # [00   .. 07 .. 0e ]
         if offset < EQ3BT_MIN_OFFSET or offset > EQ3BT_MAX_OFFSET:
             raise TemperatureException("Invalid value: %s" % offset)
+        await self._async_coalesced_write("offset", self._encode_offset, offset=offset)
 
+    def _encode_offset(self, offset) -> bytes:
         current = -3.5
         values = {}
         for i in range(15):
             values[current] = i
             current += 0.5
 
-        value = struct.pack("BB", PROP_OFFSET, values[offset])
-        await self._conn.async_make_request(value)
+        return struct.pack("BB", PROP_OFFSET, values[offset])
 
     async def async_activate_comfort(self):
         """Activates the comfort temperature."""
         value = struct.pack("B", PROP_COMFORT)
-        await self._conn.async_make_request(value)
+        await self._async_write(value)
 
     async def async_activate_eco(self):
         """Activates the comfort temperature."""
         value = struct.pack("B", PROP_ECO)
-        await self._conn.async_make_request(value)
+        await self._async_write(value)
 
     @property
     def firmware_version(self) -> str | None:
@@ -432,3 +1025,161 @@ class Thermostat:
     def mac(self):
         """Return the mac address."""
         return self._conn._mac
+
+
+class ThermostatBatch:
+    """Commands of a Thermostat run back to back over one connection and one
+    notification subscription, see Thermostat.batch().
+
+    Frames are built right before they are sent, so settings left as None
+    keep the values reported by the status earlier in the batch. Update
+    callbacks are called once, when the batch is done."""
+
+    def __init__(self, thermostat: Thermostat):
+        self._thermostat = thermostat
+        # (frame or frame builder, response matcher, response parser)
+        self._commands: list = []
+        self._needs_status = False
+        self.results: list = []
+
+    def __len__(self):
+        return len(self._commands)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            return
+        await self.async_execute()
+        for result in self.results:
+            if isinstance(result, Exception):
+                raise result
+
+    def _add(self, value, expect, parse=None):
+        self._commands.append((value, expect, parse))
+        return self
+
+    def update(self):
+        """Query the status, also sets the current time."""
+        return self._add(
+            self._thermostat._encode_status_query,
+            _is_status,
+            lambda frame: self._thermostat._state,
+        )
+
+    def query_id(self):
+        return self._add(
+            struct.pack("B", PROP_ID_QUERY),
+            _is_device_id,
+            lambda frame: self._thermostat._device_data,
+        )
+
+    def query_schedule(self, day: int):
+        return self._add(
+            struct.pack("BB", PROP_SCHEDULE_QUERY, day),
+            _is_schedule_of(day),
+            self._thermostat.parse_schedule,
+        )
+
+    def set_schedule(self, day, hours):
+        data = self._thermostat._encode_schedule(day, hours)
+        return self._add(
+            data,
+            _is_write_response,
+            lambda frame: self._thermostat._on_schedule_written(data),
+        )
+
+    def set_target_temperature(self, temperature: float):
+        if temperature != EQ3BT_OFF_TEMP and temperature != EQ3BT_ON_TEMP:
+            self._thermostat._verify_temperature(temperature)
+        return self._add(
+            self._thermostat._encode_target_temperature(temperature),
+            _is_write_response,
+        )
+
+    def set_mode(self, mode: int):
+        if mode == Mode.Manual:
+            self._needs_status = True  # keeps the target temperature
+        return self._add(
+            lambda: self._thermostat._encode_mode(mode), _is_write_response
+        )
+
+    def set_away(self, away: bool):
+        return self._add(
+            lambda: self._thermostat._encode_away(away), _is_write_response
+        )
+
+    def set_temperature_presets(self, comfort=None, eco=None):
+        if None in (comfort, eco):
+            self._needs_status = True
+        return self._add(
+            lambda: self._thermostat._encode_presets(comfort, eco),
+            _is_write_response,
+        )
+
+    def set_window_open_config(self, temperature=None, duration=None):
+        if None in (temperature, duration):
+            self._needs_status = True
+        return self._add(
+            lambda: self._thermostat._encode_window_open_config(temperature, duration),
+            _is_write_response,
+        )
+
+    def set_temperature_offset(self, offset: float):
+        if offset < EQ3BT_MIN_OFFSET or offset > EQ3BT_MAX_OFFSET:
+            raise TemperatureException("Invalid value: %s" % offset)
+        return self._add(self._thermostat._encode_offset(offset), _is_write_response)
+
+    def activate_comfort(self):
+        return self._add(struct.pack("B", PROP_COMFORT), _is_write_response)
+
+    def activate_eco(self):
+        return self._add(struct.pack("B", PROP_ECO), _is_write_response)
+
+    async def async_execute(self) -> list:
+        """Send all commands, in the order they were added.
+
+        :return: Per command, the parsed response of queries (ThermostatState, DeviceId
+            or Schedule), None for writes, or the exception it failed with.
+        """
+        thermostat = self._thermostat
+        commands = list(self._commands)
+        if self._needs_status and (
+            thermostat.comfort_temperature is None or thermostat.status_restored
+        ):
+            # to know the current values of settings the batch keeps
+            commands.insert(0, (thermostat._encode_status_query, _is_status, None))
+        # queued writes must not absorb changes made by the batch
+        thermostat._pending_writes.clear()
+        thermostat._batches_running += 1
+        try:
+            responses = await thermostat._conn.async_make_requests(
+                [(value, expect) for value, expect, _ in commands],
+                PRIORITY_INTERACTIVE,
+            )
+            results: list[Any] = []
+            for (_, _, parse), response in zip(commands, responses):
+                if isinstance(response, Exception):
+                    results.append(response)
+                elif parse is None:
+                    results.append(None)
+                else:
+                    try:
+                        results.append(parse(response))
+                    except Exception as ex:
+                        results.append(ex)
+        finally:
+            thermostat._batches_running -= 1
+            if not thermostat._batches_running:
+                changed = thermostat._batch_changed
+                thermostat._batch_changed = set()
+                thermostat._notify_update(changed)
+        self.results = results[len(results) - len(self._commands) :]
+        _LOGGER.debug(
+            "[%s] Batch of %s commands done, %s failed",
+            thermostat.name,
+            len(self.results),
+            sum(isinstance(result, Exception) for result in self.results),
+        )
+        return self.results
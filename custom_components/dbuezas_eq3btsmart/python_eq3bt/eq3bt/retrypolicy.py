@@ -0,0 +1,145 @@
+"""
+Retry policy and circuit breaker for requests to a thermostat.
+
+A request is retried with exponential backoff until it succeeds, runs out of
+attempts or passes its deadline. Devices failing repeated requests are skipped
+for a cool down period, so an unreachable valve doesn't keep the adapter busy.
+"""
+import random
+from time import monotonic
+
+from . import BackendException
+
+REQUEST_TIMEOUT = 1
+REQUEST_DEADLINE = 90
+RETRIES = 14
+RETRY_BACK_OFF = 1
+RETRY_MAX_BACK_OFF = 16
+RETRY_JITTER = 0.25
+FAILURE_THRESHOLD = 3
+COOLDOWN = 300
+
+
+class CircuitOpenException(BackendException):
+    """Request refused because the device failed too often recently."""
+
+
+class RetryPolicy:
+    """When and how often a failed request is retried."""
+
+    def __init__(
+        self,
+        deadline: float = REQUEST_DEADLINE,
+        max_attempts: int = RETRIES,
+        request_timeout: float = REQUEST_TIMEOUT,
+        back_off: float = RETRY_BACK_OFF,
+        max_back_off: float = RETRY_MAX_BACK_OFF,
+        jitter: float = RETRY_JITTER,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        cooldown: float = COOLDOWN,
+    ):
+        """
+        :param deadline: seconds a request may take including all its retries.
+        :param max_attempts: attempts per request.
+        :param request_timeout: seconds to wait for the response to a command.
+        :param back_off: seconds to wait after the first failed attempt, doubled
+            after each further one up to max_back_off.
+        :param jitter: randomizes each back off by up to this fraction.
+        :param failure_threshold: failed requests in a row that open the circuit,
+            0 disables the circuit breaker.
+        :param cooldown: seconds requests fail fast once the circuit is open.
+        """
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.request_timeout = request_timeout
+        self.back_off = back_off
+        self.max_back_off = max_back_off
+        self.jitter = jitter
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+    def back_off_for(self, attempt: int) -> float:
+        """Seconds to wait after the given failed attempt (starting at 1)."""
+        delay = min(self.max_back_off, self.back_off * 2 ** (attempt - 1))
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def as_dict(self) -> dict:
+        return {
+            "deadline": self.deadline,
+            "max_attempts": self.max_attempts,
+            "request_timeout": self.request_timeout,
+            "back_off": self.back_off,
+            "max_back_off": self.max_back_off,
+            "jitter": self.jitter,
+            "failure_threshold": self.failure_threshold,
+            "cooldown": self.cooldown,
+        }
+
+
+class CircuitBreaker:
+    """Fails requests fast for a cool down period after repeated failures.
+
+    Once the cool down is over, the next request is let through as a trial: if
+    it fails the circuit opens again right away, if it succeeds it closes. The
+    other requests are refused until the trial is over."""
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, cooldown=COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.rejected = 0
+        self._trial = False  # a request is let through while half open
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def check(self) -> bool:
+        """Returns True if the request is the trial, it must be followed by
+        record_success, record_failure or end_trial.
+        :raises CircuitOpenException: While the circuit is open, or half open
+            and the trial is still running."""
+        state = self.state
+        if state == "open":
+            self.rejected += 1
+            raise CircuitOpenException(
+                "Failed %s requests in a row, retrying in %ss"
+                % (self.failures, round(self.cooldown - monotonic() + self.opened_at))
+            )
+        if state == "half_open":
+            if self._trial:
+                self.rejected += 1
+                raise CircuitOpenException(
+                    "Failed %s requests in a row, trying again" % self.failures
+                )
+            self._trial = True
+            return True
+        return False
+
+    def end_trial(self):
+        """The trial ended without telling whether the device works, e.g. it
+        was cancelled, the next request is the trial."""
+        self._trial = False
+
+    def record_success(self):
+        self._trial = False
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self._trial = False
+        self.failures += 1
+        if self.failure_threshold and self.failures >= self.failure_threshold:
+            self.opened_at = monotonic()
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
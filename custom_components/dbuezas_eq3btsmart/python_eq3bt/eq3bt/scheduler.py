@@ -0,0 +1,185 @@
+"""
+Fleet wide scheduling of connections.
+
+Adapters and bluetooth proxies can only keep a few connections at once
+(ESPHome proxies have 3 slots). All thermostats share one ConnectionScheduler
+that grants a slot per source before connecting and queues the rest in order,
+instead of letting dozens of connection attempts starve each other.
+
+Requests have a priority: interactive ones (writes made by the user) are
+served before background ones (polls, schedule and id reads), both when
+waiting for a thermostat and for a connection slot.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from time import monotonic
+
+from .stats import TimingStats
+
+CONNECTION_SLOTS = 3
+SOURCE_UNKNOWN = "unknown"
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BACKGROUND: "background",
+}
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PriorityLock:
+    """Lock handed to the waiter with the lowest priority value first, in order
+    of arrival within the same priority."""
+
+    def __init__(self):
+        self._locked = False
+        self._waiters: list = []  # heap of (priority, arrival, future)
+        self._arrival = itertools.count()
+
+    def locked(self) -> bool:
+        return self._locked
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        if not self._locked and not self._waiters:
+            self._locked = True
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrival), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # it was handed to us already
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # stays locked, handed over
+                return
+        self._locked = False
+
+    @asynccontextmanager
+    async def hold(self, priority: int = PRIORITY_INTERACTIVE):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class ConnectionSlot:
+    """Permission to hold a connection through an adapter or proxy."""
+
+    __slots__ = ("source", "owner", "idle_callback")
+
+    def __init__(self, source: str, owner: str):
+        self.source = source
+        self.owner = owner
+        # set while the connection is open but unused, called to ask for it back
+        self.idle_callback = None
+
+
+class ConnectionScheduler:
+    """Grants connection slots per source, waiting connections are queued."""
+
+    def __init__(self, slots_per_source: int = CONNECTION_SLOTS):
+        self.slots_per_source = slots_per_source
+        self._slots: dict[str, list[ConnectionSlot]] = {}
+        # heaps of (priority, arrival, future, owner, queued at) per source
+        self._waiters: dict[str, list] = {}
+        self._arrival = itertools.count()
+        self.wait_times = TimingStats()
+
+    async def async_acquire(
+        self, source: str, owner: str, priority: int = PRIORITY_INTERACTIVE
+    ) -> ConnectionSlot:
+        """Wait until a slot of the source is free and take it."""
+        slots = self._slots.setdefault(source, [])
+        waiters = self._waiters.setdefault(source, [])
+        queued_at = monotonic()
+        if len(slots) < self.slots_per_source and not waiters:
+            return self._grant(source, owner, queued_at)
+
+        future = asyncio.get_event_loop().create_future()
+        entry = (priority, next(self._arrival), future, owner, queued_at)
+        heapq.heappush(waiters, entry)
+        _LOGGER.debug(
+            "[%s] Waiting for a connection slot of %s (%s queued)",
+            owner,
+            source,
+            len(waiters),
+        )
+        self._reclaim_idle(source)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(future.result())
+            elif entry in waiters:
+                waiters.remove(entry)  # gave up waiting
+                heapq.heapify(waiters)
+            raise
+
+    def release(self, slot: ConnectionSlot):
+        """Give a slot back and hand it to the next one waiting."""
+        slots = self._slots.get(slot.source, [])
+        if slot not in slots:
+            return
+        slots.remove(slot)
+        slot.idle_callback = None
+        waiters = self._waiters.get(slot.source)
+        while waiters and len(slots) < self.slots_per_source:
+            _, _, future, owner, queued_at = heapq.heappop(waiters)
+            if not future.done():
+                future.set_result(self._grant(slot.source, owner, queued_at))
+
+    def mark_idle(self, slot: ConnectionSlot, release_callback):
+        """The connection is kept open but unused, it may be asked to close.
+        Push mode connections are marked idle too, they'd hold their slot for
+        good otherwise."""
+        slot.idle_callback = release_callback
+        self._reclaim_idle(slot.source)
+
+    def mark_busy(self, slot: ConnectionSlot):
+        slot.idle_callback = None
+
+    def _grant(self, source: str, owner: str, queued_at: float) -> ConnectionSlot:
+        slot = ConnectionSlot(source, owner)
+        self._slots[source].append(slot)
+        self.wait_times.record(monotonic() - queued_at)
+        return slot
+
+    def _reclaim_idle(self, source: str):
+        """Ask idle connections to close while others wait for their slots."""
+        waiting = sum(not w[2].done() for w in self._waiters.get(source, ()))
+        for slot in self._slots.get(source, []):
+            if waiting <= 0:
+                break
+            if slot.idle_callback is not None:
+                _LOGGER.debug("[%s] Releasing idle connection slot", slot.owner)
+                callback = slot.idle_callback
+                slot.idle_callback = None
+                callback()
+                waiting -= 1
+
+    @property
+    def diagnostics(self) -> dict:
+        return {
+            "slots_per_source": self.slots_per_source,
+            "sources": {
+                source: {
+                    "connected": [slot.owner for slot in slots],
+                    "idle": sum(slot.idle_callback is not None for slot in slots),
+                    "waiting": len(self._waiters.get(source, ())),
+                }
+                for source, slots in self._slots.items()
+            },
+            "wait_time": self.wait_times.as_dict(),
+        }
@@ -0,0 +1,460 @@
+"""
+In process simulator of the eQ-3 CC-RT-BLE-EQ protocol.
+
+SimulatedDevice answers command frames the way a thermostat does, including
+its own timers (boost, away, window open and the auto mode schedule).
+SimulatedConnection is a BleakConnection that talks to such a device over a
+simulated link with latency, packet loss, disconnects and slow pairing, so the
+request path can be tested and benchmarked without hardware:
+
+    device = SimulatedDevice(latency=0.05, loss=0.1)
+    thermostat = simulated_thermostat(device)
+    await thermostat.async_update()
+"""
+import asyncio
+import random
+from datetime import datetime, timedelta
+from functools import partial
+from time import monotonic
+
+from bleak.exc import BleakError
+from construct import Byte
+
+from .bleakconnection import PROP_NTFY_UUID, BleakConnection
+from .eq3btsmart import (
+    PROP_BOOST,
+    PROP_COMFORT,
+    PROP_COMFORT_ECO_CONFIG,
+    PROP_ECO,
+    PROP_ID_QUERY,
+    PROP_ID_RETURN,
+    PROP_INFO_QUERY,
+    PROP_INFO_RETURN,
+    PROP_LOCK,
+    PROP_MODE_WRITE,
+    PROP_OFFSET,
+    PROP_SCHEDULE_QUERY,
+    PROP_SCHEDULE_RETURN,
+    PROP_TEMPERATURE_WRITE,
+    PROP_WINDOW_OPEN_CONFIG,
+    Thermostat,
+)
+from .structures import PROP_SCHEDULE_SET, AwayDataAdapter
+from .timers import BOOST_DURATION
+
+SCHEDULE_PAIRS = 7  # (temperature, until) pairs per day
+DEFAULT_SCHEDULE = bytes([34, 36, 42, 138, 34, 144])  # 17° to 6:00, 21° to 23:00
+DEFAULT_MAC = "00:1A:22:00:00:01"
+DEFAULT_SERIAL = "PEQ2130075"
+DEFAULT_VERSION = 120
+
+_AWAY = AwayDataAdapter(Byte[4])  # type: ignore
+
+
+class _Characteristic:
+    """What bleak passes to notification callbacks."""
+
+    __slots__ = ("uuid", "handle")
+
+    def __init__(self, uuid: str, handle: int):
+        self.uuid = uuid
+        self.handle = handle
+
+
+_NOTIFY_CHARACTERISTIC = _Characteristic(PROP_NTFY_UUID, 0x421)
+
+
+class SimulatedDevice:
+    """State and firmware behaviour of one thermostat, plus the radio link
+    conditions to reach it."""
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(
+        self,
+        mac: str = DEFAULT_MAC,
+        latency: float = 0,
+        jitter: float = 0,
+        loss: float = 0,
+        disconnect_rate: float = 0,
+        connect_time: float = 0,
+        connect_failure_rate: float = 0,
+        pairing_time: float = 0,
+        rssi: int = -60,
+        source: str = "simulator",
+        seed: int | None = None,
+        clock=monotonic,
+    ):
+        """
+        :param latency: seconds a frame takes in each direction.
+        :param jitter: up to this many seconds are added to each latency.
+        :param loss: probability that a command or a response frame is lost.
+        :param disconnect_rate: probability that the link drops during a write.
+        :param connect_time: seconds establishing a connection takes.
+        :param connect_failure_rate: probability that a connection attempt fails.
+        :param pairing_time: seconds pairing takes after connecting.
+        :param source: name of the adapter or proxy that reaches the device.
+        :param seed: makes the random link behaviour repeatable.
+        :param clock: monotonic seconds driving the device timers.
+        """
+        self.mac = mac
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.disconnect_rate = disconnect_rate
+        self.connect_time = connect_time
+        self.connect_failure_rate = connect_failure_rate
+        self.pairing_time = pairing_time
+        self.rssi = rssi
+        self.source = source
+        self.reachable = True
+        self._random = random.Random(seed)
+        self._clock = clock
+
+        self.version = DEFAULT_VERSION
+        self.serial = DEFAULT_SERIAL
+        self.target_temperature = 20.0
+        self.manual = False
+        self.valve = 0
+        self.locked = False
+        self.low_battery = False
+        self.dst = False
+        self.away_end: datetime | None = None
+        self.comfort_temperature = 21.0
+        self.eco_temperature = 17.0
+        self.window_open_temperature = 12.0
+        self.window_open_time = timedelta(minutes=15)
+        self.temperature_offset = 0.0
+        # raw (temperature, until) pairs per day, eq3 day numbers (0 = saturday)
+        self.schedule = {day: DEFAULT_SCHEDULE for day in range(7)}
+        self._time = datetime.now()
+        self._time_set_at = clock()
+        self._boost_until: float | None = None
+        self._window_until: float | None = None
+        self._temperature_before_window: float | None = None
+        # a temperature set in auto mode lasts until the next switch point
+        self._override_until: datetime | None = None
+
+        self._clients: list[SimulatedClient] = []
+        self.connects = 0
+        self.commands = 0
+        self.frames: list[bytes] = []  # command frames received, in order
+        self.lost_frames = 0
+        self.disconnects = 0
+        self._update_auto_temperature()
+
+    # device clock and timers
+
+    def now(self) -> datetime:
+        """Device time, set by every status query."""
+        return self._time + timedelta(seconds=self._clock() - self._time_set_at)
+
+    def set_time(self, time: datetime):
+        self._time = time
+        self._time_set_at = self._clock()
+
+    @property
+    def boost(self) -> bool:
+        self._advance()
+        return self._boost_until is not None
+
+    @property
+    def window_open(self) -> bool:
+        self._advance()
+        return self._window_until is not None
+
+    def scheduled_temperature(self, at: datetime | None = None) -> float:
+        """Target temperature of the schedule at the given device time."""
+        at = at or self.now()
+        pairs = self.schedule[(at.weekday() + 2) % 7]
+        minutes = at.hour * 60 + at.minute
+        for i in range(0, len(pairs), 2):
+            if minutes < pairs[i + 1] * 10:
+                return pairs[i] / 2
+        return pairs[-2] / 2
+
+    def next_switch_point(self, at: datetime | None = None) -> datetime:
+        """Device time of the next schedule change after the given one."""
+        at = at or self.now()
+        midnight = at.replace(hour=0, minute=0, second=0, microsecond=0)
+        pairs = self.schedule[(at.weekday() + 2) % 7]
+        for i in range(1, len(pairs), 2):
+            switch = midnight + timedelta(minutes=pairs[i] * 10)
+            if switch > at:
+                return switch
+        return midnight + timedelta(days=1)
+
+    def _advance(self):
+        """Apply the timers that ran out since the last look."""
+        now = self._clock()
+        if self._boost_until is not None and now >= self._boost_until:
+            self._boost_until = None
+        if self._window_until is not None and now >= self._window_until:
+            self._window_until = None
+            self.target_temperature = self._temperature_before_window
+        if self.away_end is not None and self.now() >= self.away_end:
+            self.away_end = None
+            self.manual = False
+        self._update_auto_temperature()
+
+    def _update_auto_temperature(self):
+        if self.manual or self.away_end is not None or self._window_until is not None:
+            return
+        if self._override_until is not None and self.now() < self._override_until:
+            return
+        self._override_until = None
+        self.target_temperature = self.scheduled_temperature()
+
+    def _set_temperature(self, temperature: float):
+        self.target_temperature = temperature
+        if not self.manual and self.away_end is None:
+            self._override_until = self.next_switch_point()
+
+    # things done on the device itself
+
+    def turn_knob(self, temperature: float):
+        """Change the target temperature on the device, pushed to subscribers."""
+        self._advance()
+        self._set_temperature(temperature)
+        self._push(self.status_frame())
+
+    def open_window(self):
+        """Trigger the window open detection, pushed to subscribers."""
+        self._advance()
+        if self._window_until is None:
+            self._temperature_before_window = self.target_temperature
+        self.target_temperature = self.window_open_temperature
+        self._window_until = self._clock() + self.window_open_time.total_seconds()
+        self._push(self.status_frame())
+
+    def _push(self, frame: bytes):
+        for client in list(self._clients):
+            client.notify(frame)
+
+    # protocol
+
+    def status_frame(self) -> bytes:
+        self._advance()
+        mode = 0x01 if self.manual else 0x00
+        if self.away_end is not None:
+            mode |= 0x02
+        if self._boost_until is not None:
+            mode |= 0x04
+        if self.dst:
+            mode |= 0x08
+        if self._window_until is not None:
+            mode |= 0x10
+        if self.locked:
+            mode |= 0x20
+        if self.low_battery:
+            mode |= 0x80
+        valve = 80 if self._boost_until is not None else self.valve
+        away = bytes(4) if self.away_end is None else _AWAY.build(self.away_end)
+        return (
+            bytes(
+                [
+                    PROP_INFO_RETURN,
+                    0x01,
+                    mode,
+                    valve,
+                    0x04,
+                    int(self.target_temperature * 2),
+                ]
+            )
+            + away
+            + bytes(
+                [
+                    int(self.window_open_temperature * 2),
+                    int(self.window_open_time.total_seconds() / 300),
+                    int(self.comfort_temperature * 2),
+                    int(self.eco_temperature * 2),
+                    int(self.temperature_offset * 2) + 7,
+                ]
+            )
+        )
+
+    def id_frame(self) -> bytes:
+        serial = bytes(ord(char) + 0x30 for char in self.serial)
+        return bytes([PROP_ID_RETURN, self.version, 0, 0]) + serial + bytes(1)
+
+    def schedule_frame(self, day: int) -> bytes:
+        pairs = self.schedule[day].ljust(SCHEDULE_PAIRS * 2, b"\x00")
+        return bytes([PROP_SCHEDULE_RETURN, day]) + pairs
+
+    def handle(self, frame: bytes) -> bytes | None:
+        """Apply a command frame, returns the response frame if there is one."""
+        self.commands += 1
+        self.frames.append(bytes(frame))
+        self._advance()
+        cmd = frame[0]
+        if cmd == PROP_ID_QUERY:
+            return self.id_frame()
+        if cmd == PROP_INFO_QUERY:
+            year, month, day, hour, minute, second = frame[1:7]
+            self.set_time(datetime(2000 + year, month, day, hour, minute, second))
+            self._update_auto_temperature()
+        elif cmd == PROP_SCHEDULE_QUERY:
+            return self.schedule_frame(frame[1])
+        elif cmd == PROP_SCHEDULE_SET:
+            self.schedule[frame[1]] = bytes(frame[2:])
+            self._update_auto_temperature()
+            return bytes([PROP_INFO_RETURN, 0x02, frame[1]])
+        elif cmd == PROP_MODE_WRITE:
+            self._override_until = None
+            temperature = (frame[1] & 0x3F) / 2
+            if frame[1] & 0x80:
+                self.manual = False
+                self.away_end = _AWAY.parse(frame[2:6])
+                self.target_temperature = temperature
+            elif frame[1] & 0x40:
+                self.manual = True
+                self.away_end = None
+                self.target_temperature = temperature
+            else:
+                self.manual = False
+                self.away_end = None
+                self._update_auto_temperature()
+        elif cmd == PROP_TEMPERATURE_WRITE:
+            self._set_temperature(frame[1] / 2)
+        elif cmd == PROP_COMFORT:
+            self._set_temperature(self.comfort_temperature)
+        elif cmd == PROP_ECO:
+            self._set_temperature(self.eco_temperature)
+        elif cmd == PROP_BOOST:
+            self._boost_until = self._clock() + BOOST_DURATION if frame[1] else None
+        elif cmd == PROP_LOCK:
+            self.locked = bool(frame[1])
+        elif cmd == PROP_COMFORT_ECO_CONFIG:
+            self.comfort_temperature = frame[1] / 2
+            self.eco_temperature = frame[2] / 2
+        elif cmd == PROP_OFFSET:
+            self.temperature_offset = (frame[1] - 7) / 2
+        elif cmd == PROP_WINDOW_OPEN_CONFIG:
+            self.window_open_temperature = frame[1] / 2
+            self.window_open_time = timedelta(minutes=frame[2] * 5)
+        else:
+            return None  # the firmware ignores unknown commands
+        return self.status_frame()
+
+    # radio link
+
+    def delay(self) -> float:
+        """Seconds a frame takes to get through."""
+        return self.latency + self._random.uniform(0, self.jitter)
+
+    def chance(self, probability: float) -> bool:
+        return probability > 0 and self._random.random() < probability
+
+    async def async_connect(self, disconnected_callback) -> "SimulatedClient":
+        await asyncio.sleep(self.connect_time)
+        if not self.reachable or self.chance(self.connect_failure_rate):
+            raise BleakError("Device %s not reachable" % self.mac)
+        self.connects += 1
+        client = SimulatedClient(self, disconnected_callback)
+        self._clients.append(client)
+        return client
+
+    def disconnect_all(self):
+        """Drop all connections, e.g. to simulate going out of range."""
+        for client in list(self._clients):
+            client.drop()
+
+    def as_dict(self) -> dict:
+        return {
+            "connects": self.connects,
+            "commands": self.commands,
+            "lost_frames": self.lost_frames,
+            "disconnects": self.disconnects,
+        }
+
+
+class SimulatedClient:
+    """Stands in for the BleakClient of a connection to a SimulatedDevice."""
+
+    def __init__(self, device: SimulatedDevice, disconnected_callback):
+        self._device = device
+        self._disconnected_callback = disconnected_callback
+        self._notify_callback = None
+        self.is_connected = True
+
+    async def pair(self, *args, **kwargs) -> bool:
+        await asyncio.sleep(self._device.pairing_time)
+        return True
+
+    async def start_notify(self, uuid: str, callback):
+        self._notify_callback = callback
+
+    async def stop_notify(self, uuid: str):
+        self._notify_callback = None
+
+    async def write_gatt_char(self, uuid: str, data, response: bool = False):
+        device = self._device
+        if not self.is_connected:
+            raise BleakError("Not connected")
+        await asyncio.sleep(device.delay())
+        if device.chance(device.disconnect_rate):
+            self.drop()
+        if not self.is_connected:
+            raise BleakError("Disconnected during write")
+        if device.chance(device.loss):
+            device.lost_frames += 1
+            return
+        frame = device.handle(bytes(data))
+        if frame is None:
+            return
+        if device.chance(device.loss):
+            device.lost_frames += 1
+            return
+        asyncio.get_event_loop().call_later(device.delay(), self.notify, frame)
+
+    def notify(self, frame: bytes):
+        if not self.is_connected or self._notify_callback is None:
+            return
+        result = self._notify_callback(_NOTIFY_CHARACTERISTIC, bytearray(frame))
+        if asyncio.iscoroutine(result):
+            asyncio.get_event_loop().create_task(result)
+
+    async def disconnect(self):
+        self.drop()
+
+    def drop(self):
+        if not self.is_connected:
+            return
+        self.is_connected = False
+        self._notify_callback = None
+        self._device.disconnects += 1
+        self._device._clients.remove(self)
+        self._disconnected_callback(self)
+
+
+class SimulatedConnection(BleakConnection):
+    """BleakConnection to a SimulatedDevice instead of a bluetooth device."""
+
+    def __init__(self, mac, name, hass, callback, device: SimulatedDevice, **kwargs):
+        super().__init__(mac, name, hass, callback, **kwargs)
+        self.device = device
+
+    def _connection_source(self) -> str:
+        return self.device.source
+
+    # SimulatedClient has the part of the BleakClient interface the connection
+    # uses, without being one
+    async def _async_connect(self) -> SimulatedClient:  # type: ignore[override]
+        self.rssi = self.device.rssi
+        self._on_connection_event()
+        return await self.device.async_connect(self._on_disconnected)
+
+
+def simulated_thermostat(
+    device: SimulatedDevice | None = None, name: str = "simulated", **kwargs
+) -> Thermostat:
+    """A Thermostat talking to the given or a new SimulatedDevice.
+
+    kwargs are passed on to Thermostat, e.g. retry_policy or scheduler."""
+    device = device or SimulatedDevice()
+    return Thermostat(
+        device.mac,
+        name,
+        None,  # type: ignore
+        connection_cls=partial(SimulatedConnection, device=device),
+        **kwargs,
+    )
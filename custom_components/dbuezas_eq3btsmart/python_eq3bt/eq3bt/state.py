@@ -0,0 +1,137 @@
+"""Snapshot of what a thermostat reported in its last status frame."""
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+
+# groups of fields update callbacks can subscribe to
+FIELD_VALVE = "valve"
+FIELD_TARGET_TEMPERATURE = "target_temperature"
+FIELD_MODE = "mode"  # mode flags and the away end
+FIELD_PRESETS = "presets"  # comfort/eco, window open config and offset
+FIELD_SCHEDULE = "schedule"
+FIELD_DEVICE_ID = "device_id"
+
+_STATE_FIELD_GROUPS = {
+    "target_temperature": FIELD_TARGET_TEMPERATURE,
+    "valve": FIELD_VALVE,
+    "manual": FIELD_MODE,
+    "away": FIELD_MODE,
+    "boost": FIELD_MODE,
+    "dst": FIELD_MODE,
+    "window_open": FIELD_MODE,
+    "locked": FIELD_MODE,
+    "low_battery": FIELD_MODE,
+    "unknown": FIELD_MODE,
+    "away_end": FIELD_MODE,
+    "window_open_temperature": FIELD_PRESETS,
+    "window_open_time": FIELD_PRESETS,
+    "comfort_temperature": FIELD_PRESETS,
+    "eco_temperature": FIELD_PRESETS,
+    "temperature_offset": FIELD_PRESETS,
+}
+
+
+@dataclass(frozen=True, slots=True)
+class ThermostatState:
+    """Immutable state built once per status frame.
+
+    States compare equal when the thermostat reported the same values. The
+    version only increases when they changed, so comparing versions tells
+    whether anything changed since an earlier state. A restored state was
+    stored before a restart and is replaced by the first status received.
+    """
+
+    target_temperature: float
+    valve: int
+    manual: bool
+    away: bool
+    boost: bool
+    dst: bool
+    window_open: bool
+    locked: bool
+    low_battery: bool
+    unknown: bool
+    away_end: datetime | None = None
+    # None when the firmware doesn't report presets in the status
+    window_open_temperature: float | None = None
+    window_open_time: timedelta | None = None
+    comfort_temperature: float | None = None
+    eco_temperature: float | None = None
+    temperature_offset: float | None = None
+    version: int = field(default=0, compare=False)
+    received_at: float = field(default=0.0, compare=False)  # monotonic seconds
+    restored: bool = field(default=False, compare=False)
+
+    @classmethod
+    def from_status(
+        cls, status, previous: "ThermostatState | None", received_at: float
+    ) -> "ThermostatState":
+        """Build the state of a decoded status frame, see decoder.decode_status."""
+        mode = status.mode
+        presets = status.presets
+        if presets is None:
+            window_temperature = window_time = comfort = eco = offset = None
+        else:
+            window_temperature = presets.window_open_temp
+            window_time = presets.window_open_time
+            comfort = presets.comfort_temp
+            eco = presets.eco_temp
+            offset = presets.offset
+        version = previous.version if previous is not None else 0
+        state = cls(
+            target_temperature=status.target_temp,
+            valve=status.valve,
+            manual=bool(mode.MANUAL),
+            away=bool(mode.AWAY),
+            boost=bool(mode.BOOST),
+            dst=bool(mode.DST),
+            window_open=bool(mode.WINDOW),
+            locked=bool(mode.LOCKED),
+            low_battery=bool(mode.LOW_BATTERY),
+            unknown=bool(mode.UNKNOWN),
+            away_end=status.away if mode.AWAY else None,
+            window_open_temperature=window_temperature,
+            window_open_time=window_time,
+            comfort_temperature=comfort,
+            eco_temperature=eco,
+            temperature_offset=offset,
+            version=version,
+            received_at=received_at,
+        )
+        if state != previous:
+            state = replace(state, version=version + 1)
+        return state
+
+    def snapshot(self) -> dict:
+        """The reported values, JSON serializable for restore."""
+        values = {name: getattr(self, name) for name in _STATE_FIELD_GROUPS}
+        if self.away_end is not None:
+            values["away_end"] = self.away_end.isoformat()
+        if self.window_open_time is not None:
+            values["window_open_time"] = self.window_open_time.total_seconds()
+        return values
+
+    @classmethod
+    def restore(cls, values: dict, received_at: float) -> "ThermostatState":
+        """The restored state of a snapshot.
+        :raises: TypeError or ValueError if the snapshot is incomplete"""
+        values = {
+            name: value for name, value in values.items() if name in _STATE_FIELD_GROUPS
+        }
+        if values.get("away_end") is not None:
+            values["away_end"] = datetime.fromisoformat(values["away_end"])
+        if values.get("window_open_time") is not None:
+            values["window_open_time"] = timedelta(seconds=values["window_open_time"])
+        return cls(**values, version=1, received_at=received_at, restored=True)
+
+    def changed_fields(self, previous: "ThermostatState | None") -> set[str]:
+        """Groups of the fields that differ from the previous state, all of them
+        when replacing a restored state."""
+        if previous is None or (previous.restored and not self.restored):
+            return set(_STATE_FIELD_GROUPS.values())
+        if previous.version == self.version:
+            return set()
+        return {
+            group
+            for name, group in _STATE_FIELD_GROUPS.items()
+            if getattr(self, name) != getattr(previous, name)
+        }
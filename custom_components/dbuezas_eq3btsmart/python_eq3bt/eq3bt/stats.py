@@ -0,0 +1,41 @@
+"""Small helpers to keep timing statistics for diagnostics."""
+from collections import deque
+
+SAMPLES = 200
+
+
+def percentile(samples, fraction: float) -> float | None:
+    """Nearest rank percentile of the samples, None if there are none."""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class TimingStats:
+    """Count of all recorded durations and percentiles of the recent ones."""
+
+    def __init__(self, samples: int = SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples: deque[float] = deque(maxlen=samples)
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self._samples.append(seconds)
+
+    def as_dict(self) -> dict:
+        def rounded(value):
+            return None if value is None else round(value, 3)
+
+        return {
+            "count": self.count,
+            "mean": rounded(self.total / self.count if self.count else None),
+            "p50": rounded(percentile(self._samples, 0.5)),
+            "p95": rounded(percentile(self._samples, 0.95)),
+            "max": rounded(self.max),
+        }
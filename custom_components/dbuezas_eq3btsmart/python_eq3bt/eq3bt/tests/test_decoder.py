@@ -0,0 +1,139 @@
+import random
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from eq3bt.decoder import decode, decode_device_id, decode_schedule, decode_status
+from eq3bt.simulator import SimulatedDevice
+from eq3bt.structures import DeviceId, Schedule, Status
+
+FLAGS: tuple[str, ...]
+FLAGS = ("AUTO", "MANUAL", "AWAY", "BOOST", "DST", "WINDOW", "LOCKED", "UNKNOWN")
+FLAGS += ("LOW_BATTERY",)
+PRESETS: tuple[str, ...]
+PRESETS = ("window_open_temp", "window_open_time", "comfort_temp", "eco_temp")
+PRESETS += ("offset",)
+
+
+def plain(value, fields):
+    """The fields of a parsed frame, comparable between both parsers."""
+    if value is None:
+        return None
+    return {field: getattr(value, field) for field in fields}
+
+
+def plain_status(status):
+    result = plain(status, ("cmd", "valve", "target_temp", "away"))
+    result["mode"] = plain(status.mode, FLAGS)
+    result["presets"] = plain(status.presets, PRESETS)
+    return result
+
+
+def plain_schedule(schedule):
+    result = plain(schedule, ("cmd", "day"))
+    result["types"] = (type(schedule.cmd), type(schedule.day))
+    result["hours"] = [
+        plain(entry, ("target_temp", "next_change_at")) for entry in schedule.hours
+    ]
+    return result
+
+
+def outcome(parse, frame, convert):
+    try:
+        return convert(parse(frame))
+    except Exception as ex:
+        return type(ex)
+
+
+class TestDecoder(TestCase):
+    def assertSameStatus(self, frame):
+        self.assertEqual(
+            plain_status(decode_status(frame)), plain_status(Status.parse(frame))
+        )
+
+    def test_status(self):
+        for frame in (
+            "020100000428",
+            "020101000428",
+            "020110000428",
+            "0201020004231d132e03",
+            "020104000428",
+            "020180000428",
+            "020100160428",
+            "020100000422000000001803282207",
+            "0201fd3204220000000018032822ff",
+        ):
+            self.assertSameStatus(bytes.fromhex(frame))
+
+    def test_simulated_states(self):
+        device = SimulatedDevice()
+        rng = random.Random(7)
+        for _ in range(100):
+            device.manual = not device.manual
+            device.locked = rng.random() < 0.5
+            device.low_battery = rng.random() < 0.5
+            device.valve = rng.randrange(101)
+            device.target_temperature = rng.randrange(9, 61) / 2
+            device.temperature_offset = rng.randrange(-7, 8) / 2
+            device.window_open_time = timedelta(minutes=rng.randrange(13) * 5)
+            device.away_end = rng.choice(
+                [None, datetime(2030, 12, 24, 18, 30), datetime(2024, 1, 1, 0)]
+            )
+            self.assertSameStatus(device.status_frame())
+            day = rng.randrange(7)
+            frame = device.schedule_frame(day)
+            self.assertEqual(
+                plain_schedule(decode_schedule(frame)),
+                plain_schedule(Schedule.parse(frame)),
+            )
+
+    def test_schedule(self):
+        for frame in (
+            "2102223622902a8e1e90000000000000",
+            "1003222c2a90",
+            "21002290ff",  # odd trailing byte
+            "2106229022",
+            "210022ff2290",  # invalid time ends the schedule
+        ):
+            frame = bytes.fromhex(frame)
+            self.assertEqual(
+                plain_schedule(decode_schedule(frame)),
+                plain_schedule(Schedule.parse(frame)),
+            )
+
+    def test_device_id(self):
+        frame = bytes.fromhex("01780000807581626163606067659e")
+        parsed = decode_device_id(frame)
+        self.assertEqual(parsed.version, 120)
+        self.assertEqual(parsed.serial, "PEQ2130075")
+        expected = DeviceId.parse(frame)
+        self.assertEqual(
+            plain(parsed, ("version", "serial")), plain(expected, ("version", "serial"))
+        )
+
+    def test_random_frames(self):
+        """Any frame decodes to the same result or fails the same way."""
+        rng = random.Random(12)
+        cases = (
+            (0x02, decode_status, Status.parse, plain_status),
+            (0x21, decode_schedule, Schedule.parse, plain_schedule),
+            (0x01, decode_device_id, DeviceId.parse, lambda d: plain(d, ("serial",))),
+        )
+        for _ in range(2000):
+            cmd, fast, slow, convert = rng.choice(cases)
+            size = rng.randrange(1, 18)
+            frame = bytes([cmd] + [rng.randrange(256) for _ in range(size)])
+            if fast is decode_status:
+                frame = frame[:1] + b"\x01" + frame[2:]
+                if rng.random() < 0.8:
+                    frame = frame[:4] + b"\x04" + frame[5:]
+            self.assertEqual(
+                outcome(fast, frame, convert),
+                outcome(slow, frame, convert),
+                frame.hex(),
+            )
+
+    def test_dispatch(self):
+        self.assertIsNone(decode(bytes.fromhex("020203")))  # schedule write ack
+        self.assertIsNone(decode(bytes.fromhex("ff00")))
+        self.assertEqual(decode(bytes.fromhex("020100000428")).target_temp, 20.0)
+        self.assertEqual(decode(bytes.fromhex("2102223622902a")).day, "mon")
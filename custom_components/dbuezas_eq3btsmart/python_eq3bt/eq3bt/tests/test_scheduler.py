@@ -0,0 +1,105 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from eq3bt.scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    ConnectionScheduler,
+)
+
+
+class TestConnectionScheduler(IsolatedAsyncioTestCase):
+    async def test_slots_per_source(self):
+        scheduler = ConnectionScheduler(slots_per_source=2)
+        first = await scheduler.async_acquire("proxy", "a")
+        await scheduler.async_acquire("proxy", "b")
+        waiting = asyncio.ensure_future(scheduler.async_acquire("proxy", "c"))
+        await asyncio.sleep(0)
+        self.assertFalse(waiting.done())
+        # other sources have their own slots
+        await scheduler.async_acquire("adapter", "d")
+
+        scheduler.release(first)
+        slot = await waiting
+        self.assertEqual(slot.owner, "c")
+        sources = scheduler.diagnostics["sources"]
+        self.assertEqual(sources["proxy"]["connected"], ["b", "c"])
+        self.assertEqual(sources["proxy"]["waiting"], 0)
+        self.assertEqual(sources["adapter"]["connected"], ["d"])
+
+    async def test_handed_over_by_priority_then_arrival(self):
+        scheduler = ConnectionScheduler(slots_per_source=1)
+        slot = await scheduler.async_acquire("proxy", "busy")
+        served = []
+
+        async def wait(owner, priority):
+            served.append(await scheduler.async_acquire("proxy", owner, priority))
+
+        waiting = [
+            asyncio.ensure_future(wait(owner, priority))
+            for owner, priority in (
+                ("poll 1", PRIORITY_BACKGROUND),
+                ("write 1", PRIORITY_INTERACTIVE),
+                ("poll 2", PRIORITY_BACKGROUND),
+                ("write 2", PRIORITY_INTERACTIVE),
+            )
+        ]
+        await asyncio.sleep(0)
+        for _ in waiting:
+            scheduler.release(slot)
+            await asyncio.sleep(0)
+            slot = served[-1]
+        self.assertEqual(
+            [slot.owner for slot in served], ["write 1", "write 2", "poll 1", "poll 2"]
+        )
+
+    async def test_cancelled_waiter_is_skipped(self):
+        scheduler = ConnectionScheduler(slots_per_source=1)
+        slot = await scheduler.async_acquire("proxy", "busy")
+        cancelled = asyncio.ensure_future(scheduler.async_acquire("proxy", "a"))
+        waiting = asyncio.ensure_future(scheduler.async_acquire("proxy", "b"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.diagnostics["sources"]["proxy"]["waiting"], 1)
+        scheduler.release(slot)
+        self.assertEqual((await waiting).owner, "b")
+
+    async def test_idle_connections_are_reclaimed(self):
+        scheduler = ConnectionScheduler(slots_per_source=1)
+        slot = await scheduler.async_acquire("proxy", "idle")
+        reclaimed = []
+
+        def close():
+            reclaimed.append(slot.owner)
+            scheduler.release(slot)
+
+        scheduler.mark_idle(slot, close)
+        self.assertEqual(reclaimed, [])  # kept open while nobody waits
+        self.assertEqual(scheduler.diagnostics["sources"]["proxy"]["idle"], 1)
+
+        waiting = scheduler.async_acquire("proxy", "waiting")
+        self.assertEqual((await waiting).owner, "waiting")
+        self.assertEqual(reclaimed, ["idle"])
+
+    async def test_busy_connections_are_not_reclaimed(self):
+        scheduler = ConnectionScheduler(slots_per_source=1)
+        slot = await scheduler.async_acquire("proxy", "busy")
+        scheduler.mark_idle(slot, self.fail)
+        scheduler.mark_busy(slot)
+        waiting = asyncio.ensure_future(scheduler.async_acquire("proxy", "waiting"))
+        await asyncio.sleep(0)
+        self.assertFalse(waiting.done())
+        scheduler.release(slot)
+        await waiting
+
+    async def test_wait_times(self):
+        scheduler = ConnectionScheduler(slots_per_source=1)
+        slot = await scheduler.async_acquire("proxy", "a")
+        waiting = asyncio.ensure_future(scheduler.async_acquire("proxy", "b"))
+        await asyncio.sleep(0.02)
+        scheduler.release(slot)
+        await waiting
+        self.assertEqual(scheduler.wait_times.count, 2)  # every grant
+        self.assertGreaterEqual(scheduler.wait_times.max, 0.02)
+        self.assertEqual(scheduler.diagnostics["wait_time"]["count"], 2)
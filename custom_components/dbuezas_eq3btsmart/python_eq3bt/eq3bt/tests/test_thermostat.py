@@ -1,58 +1,41 @@
-import codecs
-from datetime import datetime, timedelta
-from unittest import TestCase
-
-import pytest
-
-from eq3bt import TemperatureException, Thermostat
-from eq3bt.eq3btsmart import PROP_ID_QUERY, PROP_INFO_QUERY, PROP_NTFY_HANDLE, Mode
-
-ID_RESPONSE = b"01780000807581626163606067659e"
-STATUS_RESPONSES = {
-    "auto": b"020100000428",
-    "manual": b"020101000428",
-    "window": b"020110000428",
-    "away": b"0201020004231d132e03",
-    "boost": b"020104000428",
-    "low_batt": b"020180000428",
-    "valve_at_22": b"020100160428",
-    "presets": b"020100000422000000001803282207",
-}
-
-
-class FakeConnection:
-    def __init__(self, _iface, mac):
-        self._callbacks = {}
-        self._res = "auto"
-
-    def set_callback(self, handle, cb):
-        self._callbacks[handle] = cb
-
-    def set_status(self, key):
-        if key in STATUS_RESPONSES:
-            self._res = key
-        else:
-            raise ValueError("Invalid key for status test response.")
-
-    def make_request(self, handle, value, timeout=1, with_response=True):
-        """Write a GATT Command without callback - not utf-8."""
-        if with_response:
-            cb = self._callbacks.get(PROP_NTFY_HANDLE)
-
-            if value[0] == PROP_ID_QUERY:
-                data = ID_RESPONSE
-            elif value[0] == PROP_INFO_QUERY:
-                data = STATUS_RESPONSES[self._res]
-            else:
-                return
-            cb(codecs.decode(data, "hex"))
-
-
-class TestThermostat(TestCase):
+import asyncio
+from datetime import datetime, time, timedelta
+from unittest import IsolatedAsyncioTestCase
+
+from eq3bt.bleakconnection import FIELD_BUSY, FIELD_RSSI
+from eq3bt.eq3btsmart import (
+    PROP_COMFORT_ECO_CONFIG,
+    PROP_TEMPERATURE_WRITE,
+    Mode,
+    TemperatureException,
+)
+from eq3bt import BackendException
+from eq3bt.retrypolicy import CircuitOpenException, RetryPolicy
+from eq3bt.scheduler import ConnectionScheduler
+from eq3bt.simulator import SimulatedDevice, simulated_thermostat
+from eq3bt.state import FIELD_MODE, FIELD_SCHEDULE, FIELD_VALVE
+from eq3bt.structures import HOUR_24_PLACEHOLDER
+from eq3bt.timers import BOOST_DURATION
+
+FAST_RETRIES = RetryPolicy(request_timeout=0.05, back_off=0.001, max_back_off=0.01)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestThermostat(IsolatedAsyncioTestCase):
     def setUp(self):
-        self.thermostat = Thermostat(
-            _mac=None, _iface=None, connection_cls=FakeConnection
-        )
+        self.clock = FakeClock()
+        self.device = SimulatedDevice(clock=self.clock)
+        self.thermostat = simulated_thermostat(self.device, idle_timeout=0)
+
+    def tearDown(self):
+        self.thermostat.shutdown()
 
     def test__verify_temperature(self):
         with self.assertRaises(TemperatureException):
@@ -63,136 +46,668 @@ class TestThermostat(TestCase):
         self.thermostat._verify_temperature(8)
         self.thermostat._verify_temperature(25)
 
-    @pytest.mark.skip()
-    def test_parse_schedule(self):
-        self.fail()
-
-    @pytest.mark.skip()
-    def test_handle_notification(self):
-        self.fail()
-
-    def test_query_id(self):
-        self.thermostat.query_id()
+    async def test_query_id(self):
+        await self.thermostat.async_query_id()
         self.assertEqual(self.thermostat.firmware_version, 120)
         self.assertEqual(self.thermostat.device_serial, "PEQ2130075")
 
-    def test_update(self):
+    async def test_update(self):
         th = self.thermostat
-
-        th._conn.set_status("auto")
-        th.update()
-        self.assertEqual(th.valve_state, 0)
+        self.device.valve = 22
+        status = await th.async_update()
+        self.assertIs(status, th.state)
+        self.assertEqual(th.valve_state, 22)
         self.assertEqual(th.mode, Mode.Auto)
-        self.assertEqual(th.target_temperature, 20.0)
         self.assertFalse(th.locked)
         self.assertFalse(th.low_battery)
         self.assertFalse(th.boost)
         self.assertFalse(th.window_open)
 
-        th._conn.set_status("manual")
-        th.update()
-        self.assertTrue(th.mode, Mode.Manual)
+    async def test_state(self):
+        th = self.thermostat
+        self.assertIsNone(th.state)
+        self.assertIsNone(th.boost)
+        first = await th.async_update()
+        self.assertIs(th.boost, False)
+        self.assertIs(th.locked, False)
+
+        self.clock.now += 1
+        second = await th.async_update()
+        self.assertEqual(second, first)
+        self.assertEqual(second.version, first.version)
+        self.assertGreater(second.received_at, first.received_at)
+
+        await th.async_set_locked(True)
+        self.assertIs(th.locked, True)
+        self.assertEqual(th.state.version, first.version + 1)
+        with self.assertRaises(AttributeError):
+            th.state.locked = False
+
+    async def test_field_callbacks(self):
+        th = self.thermostat
+        calls = {"valve": 0, "mode": 0, "schedule": 0}
 
-        th._conn.set_status("away")
-        th.update()
-        self.assertEqual(th.mode, Mode.Away)
-        self.assertEqual(th.target_temperature, 17.5)
-        self.assertEqual(th.away_end, datetime(2019, 3, 29, 23, 00))
+        def counter(name):
+            def count():
+                calls[name] += 1
 
-        th._conn.set_status("boost")
-        th.update()
-        self.assertTrue(th.boost)
-        self.assertEqual(th.mode, Mode.Boost)
+            return count
+
+        th.register_update_callback(counter("valve"), FIELD_VALVE)
+        th.register_update_callback(counter("mode"), FIELD_MODE)
+        th.register_update_callback(counter("schedule"), FIELD_SCHEDULE)
+        await th.async_update()
+        self.assertEqual(calls, {"valve": 1, "mode": 1, "schedule": 0})
+
+        await th.async_update()  # nothing changed
+        await th.async_set_locked(True)
+        self.assertEqual(calls, {"valve": 1, "mode": 2, "schedule": 0})
 
-    def test_presets(self):
+        await th.async_query_schedule(2)
+        await th.async_query_schedule(2)
+        self.assertEqual(calls, {"valve": 1, "mode": 2, "schedule": 1})
+
+    async def test_update_sets_device_time(self):
+        self.device.set_time(datetime(2020, 1, 1))
+        await self.thermostat.async_update()
+        self.assertLess(abs(self.device.now() - datetime.now()), timedelta(seconds=2))
+
+    async def test_presets(self):
         th = self.thermostat
-        self.thermostat._conn.set_status("presets")
-        self.thermostat.update()
+        await th.async_update()
         self.assertEqual(th.window_open_temperature, 12.0)
         self.assertEqual(th.window_open_time, timedelta(minutes=15.0))
-        self.assertEqual(th.comfort_temperature, 20.0)
+        self.assertEqual(th.comfort_temperature, 21.0)
         self.assertEqual(th.eco_temperature, 17.0)
         self.assertEqual(th.temperature_offset, 0)
 
-    @pytest.mark.skip()
-    def test_query_schedule(self):
-        self.fail()
-
-    @pytest.mark.skip()
-    def test_schedule(self):
-        self.fail()
-
-    @pytest.mark.skip()
-    def test_set_schedule(self):
-        self.fail()
+    async def test_temperature_presets(self):
+        th = self.thermostat
+        await th.async_temperature_presets(comfort=22.5, eco=None)
+        self.assertEqual(self.device.comfort_temperature, 22.5)
+        self.assertEqual(self.device.eco_temperature, 17.0)
+        self.assertEqual(th.comfort_temperature, 22.5)
+
+    async def test_query_schedule(self):
+        schedule = await self.thermostat.async_query_schedule(2)
+        self.assertEqual(schedule.day, "mon")
+        self.assertEqual(schedule.hours[0].target_temp, 17.0)
+        self.assertEqual(schedule.hours[0].next_change_at, time(6, 0))
+        self.assertEqual(schedule.hours[2].next_change_at, HOUR_24_PLACEHOLDER)
+        self.assertIn("mon", self.thermostat.schedule)
+
+    async def test_query_full_schedule(self):
+        self.device.schedule[6] = bytes([42, 144])
+        week = await self.thermostat.async_query_full_schedule()
+        self.assertEqual(sorted(week), list(range(7)))
+        self.assertEqual(week[6].day, "fri")
+        self.assertEqual(week[6].hours[0].target_temp, 21.0)
+        self.assertEqual(len(self.thermostat.schedule), 7)
+        self.assertEqual(self.device.connects, 1)
+        friday_noon = datetime(2024, 1, 5, 12)
+        self.assertEqual(self.thermostat.week_schedule.target_at(friday_noon), 21.0)
+        self.assertIsNotNone(self.thermostat.scheduled_temperature)
+
+    async def test_full_schedule_with_concurrent_day_query(self):
+        th = self.thermostat
+        day, week = await asyncio.gather(
+            th.async_query_schedule(3), th.async_query_full_schedule([3])
+        )
+        self.assertEqual(day.day, "tue")
+        self.assertEqual(list(week), [3])
+        self.assertEqual(week[3].day, "tue")
 
-    @pytest.mark.skip()
-    def test_target_temperature(self):
-        self.fail()
+    async def test_concurrent_reads_are_collapsed(self):
+        th = self.thermostat
+        results = await asyncio.gather(
+            th.async_update(),
+            th.async_update(),
+            th.async_query_id(),
+            th.async_query_id(),
+            th.async_query_schedule(3),
+            th.async_query_schedule(3),
+        )
+        self.assertIs(results[0], results[1])
+        self.assertIs(results[2], results[3])
+        self.assertIs(results[4], results[5])
+        self.assertEqual(self.device.commands, 3)  # one round trip each
+        self.assertEqual(th.collapsed_requests, 3)
+        self.assertEqual(th.regular_polls, 1)  # the one sent
+
+    async def test_poll_delay(self):
+        th = self.thermostat
+        morning = datetime(2024, 1, 1, 5, 50)  # 17° until 6:00, then 21°
+        self.assertEqual(th.poll_delay(60, 900, morning), 900)  # unknown schedule
+        await th.async_query_full_schedule()
+        await th.async_update()
+        self.assertEqual(th.poll_delay(60, 3600, morning), 600 + 60)
+        self.assertEqual(th.poll_delay(60, 300, morning), 300)
+        self.assertEqual(th.poll_delay(900, 3600, morning), 900)
+        await th.async_set_mode(Mode.Manual)
+        self.assertEqual(th.poll_delay(60, 3600, morning), 3600)
+
+    async def test_set_schedule(self):
+        hours = [
+            {"target_temp": 19.5, "next_change_at": time(7, 30)},
+            {"target_temp": 16.0, "next_change_at": HOUR_24_PLACEHOLDER},
+        ]
+        await self.thermostat.async_set_schedule(day="tue", hours=hours)
+        self.assertEqual(self.device.schedule[3], bytes([39, 45, 32, 144]))
+        await self.thermostat.async_set_schedule(3, [(19.5, 450), (16.0, 1440)])
+        self.assertEqual(self.device.schedule[3], bytes([39, 45, 32, 144]))
+        self.assertEqual(self.thermostat.week_schedule.program(3)[0], (19.5, 450))
+        schedule = await self.thermostat.async_query_schedule(3)
+        self.assertEqual(schedule.hours[0].target_temp, 19.5)
+        self.assertEqual(schedule.hours[1].next_change_at, HOUR_24_PLACEHOLDER)
+
+    async def test_schedule_snapshot(self):
+        th = self.thermostat
+        await th.async_query_schedule(2)
+        await th.async_set_schedule(
+            day="tue",
+            hours=[{"target_temp": 16.0, "next_change_at": HOUR_24_PLACEHOLDER}],
+        )
+        snapshot = th.schedule_snapshot()
+        self.assertEqual([entry["day"] for entry in snapshot], [2, 3])
+        self.assertEqual(th.stale_schedule_days(3600), [0, 1, 4, 5, 6])
+
+        snapshot[0]["received_at"] -= 7200  # monday is old
+        restored = simulated_thermostat(self.device, idle_timeout=0)
+        updates = []
+        restored.register_update_callback(lambda: updates.append(True))
+        restored.restore_schedule(snapshot)
+        self.assertEqual(restored.schedule["tue"].hours[0].target_temp, 16.0)
+        self.assertEqual(self.device.connects, 2)
+        self.assertEqual(restored.stale_schedule_days(3600), [0, 1, 2, 4, 5, 6])
+
+        await restored.async_query_schedule(3)  # same program, no update
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            await restored.async_refresh_schedule(3600), [0, 1, 2, 4, 5, 6]
+        )
+        self.assertEqual(restored.stale_schedule_days(3600), [])
+        restored.shutdown()
 
-    @pytest.mark.skip()
-    def test_mode(self):
-        self.fail()
+    async def test_status_snapshot(self):
+        th = self.thermostat
+        self.assertIsNone(th.status_snapshot())
+        self.device.away_end = datetime(2030, 1, 1, 12, 30)
+        await th.async_update()
+        snapshot = th.status_snapshot()
+        self.assertFalse(th.status_restored)
+
+        snapshot["received_at"] -= 3600
+        restored = simulated_thermostat(self.device, idle_timeout=0)
+        updates = []
+        restored.register_update_callback(lambda: updates.append(True))
+        restored.restore_status(snapshot)
+        self.assertTrue(restored.status_restored)
+        self.assertEqual(restored.state, th.state)
+        self.assertIsNotNone(restored.away_end)
+        self.assertEqual(restored.away_end, th.away_end)
+        self.assertEqual(restored.window_open_time, th.window_open_time)
+        self.assertGreater(restored.status_age, 3500)
+        self.assertEqual(self.device.connects, 1)
+
+        restored.restore_status({"state": {"valve": 10}, "received_at": 0})
+        self.assertEqual(restored.state, th.state)  # a known status is kept
+
+        await restored.async_update()  # same values, still news
+        self.assertFalse(restored.status_restored)
+        self.assertEqual(len(updates), 2)
+        self.assertLess(restored.status_age, 60)
+        restored.shutdown()
+
+        broken = simulated_thermostat(self.device, idle_timeout=0)
+        broken.restore_status({"state": {"valve": 10}, "received_at": 0})
+        self.assertIsNone(broken.state)
+        broken.shutdown()
+
+    async def test_partial_writes_after_restore(self):
+        await self.thermostat.async_update()
+        snapshot = self.thermostat.status_snapshot()
+
+        def restored():
+            th = simulated_thermostat(self.device, idle_timeout=0)
+            th.restore_status(snapshot)
+            self.addCleanup(th.shutdown)
+            return th
+
+        # changed on the device while the restored status was stored, the
+        # values left out of a write must be polled, not taken from storage
+        self.device.eco_temperature = 18.0
+        self.device.window_open_time = timedelta(minutes=30)
+        self.device.turn_knob(23.5)
+
+        await restored().async_temperature_presets(22.0, None)
+        self.assertEqual(self.device.comfort_temperature, 22.0)
+        self.assertEqual(self.device.eco_temperature, 18.0)
+
+        await restored().async_window_open_config(15.0, None)
+        self.assertEqual(self.device.window_open_temperature, 15.0)
+        self.assertEqual(self.device.window_open_time, timedelta(minutes=30))
+
+        await restored().async_set_mode(Mode.Manual)
+        self.assertTrue(self.device.manual)
+        self.assertEqual(self.device.target_temperature, 23.5)
+
+        self.device.eco_temperature = 16.0
+        batch = restored().batch()
+        batch.set_temperature_presets(comfort=21.0)
+        await batch.async_execute()
+        self.assertEqual(self.device.comfort_temperature, 21.0)
+        self.assertEqual(self.device.eco_temperature, 16.0)
+
+    async def test_device_id_snapshot(self):
+        th = self.thermostat
+        self.assertIsNone(th.device_id_snapshot())
+        self.assertIsNone(th.device_id_age)
+        await th.async_query_id()
+        snapshot = th.device_id_snapshot()
+        self.assertLess(th.device_id_age, 60)
+
+        snapshot["received_at"] -= 7200
+        restored = simulated_thermostat(self.device, idle_timeout=0)
+        updates = []
+        restored.register_update_callback(lambda: updates.append(True))
+        restored.restore_device_id(snapshot)
+        self.assertEqual(restored.firmware_version, th.firmware_version)
+        self.assertEqual(restored.device_serial, th.device_serial)
+        self.assertGreater(restored.device_id_age, 7000)
+        self.assertEqual(self.device.connects, 1)
+
+        await restored.async_query_id()  # same id, no update
+        self.assertEqual(len(updates), 1)
+        self.assertLess(restored.device_id_age, 60)
+        restored.shutdown()
+
+    async def test_set_schedule_days(self):
+        th = self.thermostat
+        default = [
+            {"target_temp": 17.0, "next_change_at": time(6, 0)},
+            {"target_temp": 21.0, "next_change_at": time(23, 0)},
+            {"target_temp": 17.0, "next_change_at": HOUR_24_PLACEHOLDER},
+        ]
+        self.device.schedule[3] = bytes([36, 144])
+        result = await th.async_set_schedule_days(["mon", "tue"], default)
+        self.assertEqual(result, {"written": ["tue"], "skipped": ["mon"]})
+        self.assertEqual(self.device.schedule[3], self.device.schedule[2])
+
+        commands = self.device.commands
+        result = await th.async_set_schedule_days(["mon", "tue"], default)
+        self.assertEqual(result, {"written": [], "skipped": ["mon", "tue"]})
+        self.assertEqual(self.device.commands, commands)  # known, nothing sent
+        self.assertEqual(th.diagnostics["schedule_days_skipped"], 3)
+
+        result = await th.async_set_schedule_days(["mon", "tue"], default, max_age=0)
+        self.assertEqual(result, {"written": [], "skipped": ["mon", "tue"]})
+        self.assertEqual(self.device.commands, commands + 2)  # read again
+
+    async def test_target_temperature(self):
+        th = self.thermostat
+        await th.async_set_target_temperature(23.5)
+        self.assertEqual(self.device.target_temperature, 23.5)
+        self.assertEqual(th.target_temperature, 23.5)
+        with self.assertRaises(TemperatureException):
+            await th.async_set_target_temperature(40)
 
-    @pytest.mark.skip()
-    def test_mode_readable(self):
-        self.fail()
+    async def test_burst_of_writes_is_coalesced(self):
+        th = self.thermostat
+        await th.async_update()
+        sent = len(self.device.frames)
+        await asyncio.gather(
+            *(th.async_set_target_temperature(t) for t in (18.0, 19.0, 20.5))
+        )
+        # only the final value is sent
+        self.assertEqual(
+            self.device.frames[sent:], [bytes([PROP_TEMPERATURE_WRITE, 41])]
+        )
+        self.assertEqual(th.coalesced_writes, 2)
+        self.assertEqual(th.target_temperature, 20.5)
 
-    @pytest.mark.skip()
-    def test_boost(self):
-        self.fail()
+    async def test_preset_writes_are_merged(self):
+        th = self.thermostat
+        await th.async_update()
+        sent = len(self.device.frames)
+        await asyncio.gather(
+            th.async_temperature_presets(22.0, None),
+            th.async_temperature_presets(None, 16.0),
+        )
+        self.assertEqual(
+            self.device.frames[sent:], [bytes([PROP_COMFORT_ECO_CONFIG, 44, 32])]
+        )
+        sent = len(self.device.frames)
+        await asyncio.gather(
+            th.async_temperature_presets(23.0, 15.0),
+            th.async_temperature_presets(None, 14.0),  # keeps the queued 23
+        )
+        self.assertEqual(
+            self.device.frames[sent:], [bytes([PROP_COMFORT_ECO_CONFIG, 46, 28])]
+        )
+        self.assertEqual(th.coalesced_writes, 2)
+        self.assertEqual((th.comfort_temperature, th.eco_temperature), (23.0, 14.0))
 
-    def test_valve_state(self):
+    async def test_mode(self):
         th = self.thermostat
-        th._conn.set_status("valve_at_22")
-        th.update()
-        self.assertEqual(th.valve_state, 22)
+        await th.async_update()
+        await th.async_set_mode(Mode.Manual)
+        self.assertEqual(th.mode, Mode.Manual)
+        await th.async_set_mode(Mode.Off)
+        self.assertEqual(th.mode, Mode.Off)
+        self.assertEqual(self.device.target_temperature, 4.5)
+        await th.async_set_mode(Mode.On)
+        self.assertEqual(th.mode, Mode.On)
+        await th.async_set_mode(Mode.Auto)
+        self.assertEqual(th.mode, Mode.Auto)
+        self.assertEqual(th.target_temperature, self.device.scheduled_temperature())
 
-    def test_window_open(self):
+    async def test_away(self):
         th = self.thermostat
-        th._conn.set_status("window")
-        th.update()
-        self.assertTrue(th.window_open)
+        await th.async_set_away(True)
+        self.assertTrue(th.away)
+        self.assertEqual(th.target_temperature, th.default_away_temp)
+        self.assertEqual(th.away_end.date(), self.device.away_end.date())
+
+        await th.async_set_away(False)
+        self.assertFalse(th.away)
+        self.assertEqual(th.mode, Mode.Auto)
 
-    @pytest.mark.skip()
-    def test_window_open_config(self):
-        self.fail()
+    async def test_boost(self):
+        th = self.thermostat
+        await th.async_set_boost(True)
+        self.assertTrue(th.boost)
+        self.assertEqual(th.valve_state, 80)
 
-    @pytest.mark.skip()
-    def test_locked(self):
-        self.fail()
+        self.clock.now += BOOST_DURATION  # the device ends it by itself
+        await th.async_update()
+        self.assertFalse(th.boost)
 
-    @pytest.mark.skip()
-    def test_low_battery(self):
+    async def test_predicted_boost_end(self):
         th = self.thermostat
-        th._conn.set_status("low_batt")
-        th.update()
-        self.assertTrue(th.low_battery)
+        th._timers.boost_duration = 0.05
+        th.confirmation_delay = 0
+        updates = []
+        th.register_update_callback(lambda: updates.append(th.boost), FIELD_MODE)
+        await th.async_set_boost(True)
+        self.clock.now += BOOST_DURATION
+        await asyncio.sleep(0.1)
+        self.assertEqual(updates, [True, False])  # the confirmation changes nothing
+        self.assertEqual(th.diagnostics["predicted_transitions"], 1)
+        self.assertEqual(th.diagnostics["confirmation_polls"], 1)
+        self.assertEqual(th.diagnostics["regular_polls"], 0)
+        self.assertIsNone(th._timer_handle)
+
+    async def test_window_open(self):
+        th = self.thermostat
+        await th.async_update()
+        target = th.target_temperature
+        self.device.open_window()
+        await th.async_update()
+        self.assertTrue(th.window_open)
+        self.assertEqual(th.target_temperature, 12.0)
 
-    @pytest.mark.skip()
-    def test_temperature_offset(self):
-        self.fail()
+        self.clock.now += self.device.window_open_time.total_seconds()
+        await th.async_update()
+        self.assertFalse(th.window_open)
+        self.assertEqual(th.target_temperature, target)
 
-    @pytest.mark.skip()
-    def test_activate_comfort(self):
-        self.fail()
+    async def test_window_open_config(self):
+        th = self.thermostat
+        await th.async_window_open_config(temperature=10.0, duration=None)
+        self.assertEqual(th.window_open_temperature, 10.0)
+        self.assertEqual(th.window_open_time, timedelta(minutes=15))
+        await th.async_window_open_config(temperature=None, duration=timedelta(hours=1))
+        self.assertEqual(self.device.window_open_temperature, 10.0)
+        self.assertEqual(self.device.window_open_time, timedelta(hours=1))
+
+    async def test_locked(self):
+        th = self.thermostat
+        await th.async_set_locked(True)
+        self.assertTrue(th.locked)
+        await th.async_set_locked(False)
+        self.assertFalse(th.locked)
 
-    @pytest.mark.skip()
-    def test_activate_eco(self):
-        self.fail()
+    async def test_low_battery(self):
+        self.device.low_battery = True
+        await self.thermostat.async_update()
+        self.assertTrue(self.thermostat.low_battery)
 
-    @pytest.mark.skip()
-    def test_min_temp(self):
-        self.fail()
+    async def test_temperature_offset(self):
+        th = self.thermostat
+        await th.async_set_temperature_offset(-1.5)
+        self.assertEqual(self.device.temperature_offset, -1.5)
+        self.assertEqual(th.temperature_offset, -1.5)
+        with self.assertRaises(TemperatureException):
+            await th.async_set_temperature_offset(4)
 
-    @pytest.mark.skip()
-    def test_max_temp(self):
-        self.fail()
+    async def test_activate_comfort_and_eco(self):
+        th = self.thermostat
+        await th.async_activate_comfort()
+        self.assertEqual(th.target_temperature, 21.0)
+        await th.async_activate_eco()
+        self.assertEqual(th.target_temperature, 17.0)
 
-    @pytest.mark.skip()
-    def test_away_end(self):
-        self.fail()
+    async def test_batch(self):
+        th = self.thermostat
+        updates = []
+        th.register_update_callback(lambda: updates.append(True))
+        async with th.batch() as batch:
+            batch.set_temperature_presets(comfort=22.0, eco=None)
+            batch.set_temperature_offset(1.0)
+            batch.set_schedule(
+                "wed", [{"target_temp": 18.0, "next_change_at": HOUR_24_PLACEHOLDER}]
+            )
+            batch.query_schedule(4)
+            batch.set_mode(Mode.Manual)
+        self.assertEqual(self.device.connects, 1)
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(batch.results[3].hours[0].target_temp, 18.0)
+        self.assertEqual(th.comfort_temperature, 22.0)
+        self.assertEqual(th.temperature_offset, 1.0)
+        self.assertEqual(th.mode, Mode.Manual)
+
+
+class TestLink(IsolatedAsyncioTestCase):
+    """Requests over an unreliable link."""
+
+    async def test_retries_lost_frames(self):
+        device = SimulatedDevice(loss=0.3, disconnect_rate=0.1, seed=3)
+        th = simulated_thermostat(device, retry_policy=FAST_RETRIES)
+        for temperature in (18.0, 19.0, 20.0, 21.0):
+            await th.async_set_target_temperature(temperature)
+            self.assertEqual(device.target_temperature, temperature)
+        self.assertGreater(device.lost_frames + device.disconnects, 0)
+        th.shutdown()
+
+    async def test_full_schedule_over_lossy_link(self):
+        device = SimulatedDevice(loss=0.2, seed=5)
+        th = simulated_thermostat(device, retry_policy=FAST_RETRIES)
+        week = await th.async_query_full_schedule()
+        self.assertEqual(
+            [week[day].day for day in range(7)],
+            ["sat", "sun", "mon", "tue", "wed", "thu", "fri"],
+        )
+        self.assertGreater(device.lost_frames, 0)
+        th.shutdown()
+
+    async def test_unreachable(self):
+        device = SimulatedDevice()
+        device.reachable = False
+        policy = RetryPolicy(deadline=0.2, back_off=0.01, failure_threshold=1)
+        th = simulated_thermostat(device, retry_policy=policy)
+        with self.assertRaises(Exception):
+            await th.async_update()
+        self.assertEqual(
+            th.diagnostics["connection"]["circuit_breaker"]["state"], "open"
+        )
+        th.shutdown()
 
-    @pytest.mark.skip()
-    def test_decode_mode(self):
-        self.fail()
+    async def test_half_open_lets_one_trial_through(self):
+        device = SimulatedDevice(latency=0.01)
+        device.reachable = False
+        policy = RetryPolicy(
+            deadline=0.2, back_off=0.01, failure_threshold=1, cooldown=0.05
+        )
+        th = simulated_thermostat(device, retry_policy=policy)
+        with self.assertRaises(Exception):
+            await th.async_update()
+        device.reachable = True
+        await asyncio.sleep(0.05)
+        breaker = th._conn._circuit_breaker
+        self.assertEqual(breaker.state, "half_open")
+        trial = asyncio.ensure_future(th.async_update())
+        await asyncio.sleep(0)
+        with self.assertRaises(CircuitOpenException):
+            await th.async_query_id()  # until the trial is over
+        await trial
+        self.assertEqual(breaker.state, "closed")
+        await th.async_query_id()
+        th.shutdown()
+
+    async def test_connection_is_reused(self):
+        device = SimulatedDevice(pairing_time=0.05)
+        th = simulated_thermostat(device, idle_timeout=10)
+        await th.async_update()
+        await th.async_set_target_temperature(19.0)
+        await th.async_query_id()
+        self.assertEqual(device.connects, 1)
+        th.shutdown()
+
+    async def test_push_mode(self):
+        device = SimulatedDevice()
+        th = simulated_thermostat(device, push_mode=True)
+        await th.async_update()
+        device.turn_knob(24.0)
+        await asyncio.sleep(0.01)
+        self.assertEqual(th.target_temperature, 24.0)
+        th.shutdown()
+
+    async def test_slot_wait_counts_for_the_deadline(self):
+        scheduler = ConnectionScheduler(slots_per_source=1)
+        taken = await scheduler.async_acquire("simulator", "other")
+        policy = RetryPolicy(deadline=0.1, failure_threshold=1)
+        th = simulated_thermostat(retry_policy=policy, scheduler=scheduler)
+        with self.assertRaises(BackendException):
+            await asyncio.wait_for(th.async_update(), 1)
+        # the thermostat didn't fail, and nothing is left waiting
+        connection = th.diagnostics["connection"]
+        self.assertEqual(connection["circuit_breaker"]["state"], "closed")
+        self.assertEqual(scheduler.diagnostics["sources"]["simulator"]["waiting"], 0)
+        scheduler.release(taken)
+        await th.async_update()
+        th.shutdown()
+
+    async def test_write_overtakes_queued_poll(self):
+        scheduler = ConnectionScheduler(slots_per_source=1)
+        busy, written, other = [
+            simulated_thermostat(
+                SimulatedDevice(mac=f"00:1A:22:00:00:0{index}", latency=0.01),
+                f"thermostat {index}",
+                idle_timeout=0,
+                scheduler=scheduler,
+            )
+            for index in range(3)
+        ]
+        done = []
+
+        async def run(name, request):
+            await request
+            done.append(name)
+
+        requests = [asyncio.ensure_future(run("busy", busy.async_update()))]
+        await asyncio.sleep(0.005)  # holds the only slot
+        # polls queued for the slot, then a write to the first polled thermostat
+        requests.append(asyncio.ensure_future(run("poll", written.async_update())))
+        await asyncio.sleep(0)
+        requests.append(asyncio.ensure_future(run("other poll", other.async_update())))
+        await asyncio.sleep(0)
+        requests.append(
+            asyncio.ensure_future(
+                run("write", written.async_set_target_temperature(23.0))
+            )
+        )
+        await asyncio.gather(*requests)
+        self.assertEqual(done, ["busy", "write", "poll", "other poll"])
+        # the queued poll got the status from the write's response
+        self.assertEqual(written.skipped_polls, 1)
+        for th in (busy, written, other):
+            th.shutdown()
+
+    async def test_queued_poll_skipped_after_write(self):
+        device = SimulatedDevice(latency=0.01)
+        th = simulated_thermostat(device, idle_timeout=10)
+        await th.async_update()
+        commands = device.commands
+        write = asyncio.ensure_future(th.async_set_target_temperature(23.0))
+        await asyncio.sleep(0)
+        await th.async_update()  # queued behind the write
+        await write
+        # the write was answered with the status, the poll wasn't sent
+        self.assertEqual(th.skipped_polls, 1)
+        self.assertEqual(th.regular_polls, 1)  # the first one
+        self.assertEqual(device.commands, commands + 1)
+        self.assertEqual(th.target_temperature, 23.0)
+        th.shutdown()
+
+    async def test_push_mode_gives_its_slot_back(self):
+        scheduler = ConnectionScheduler(slots_per_source=1)
+        pushed = simulated_thermostat(push_mode=True, scheduler=scheduler)
+        polled = simulated_thermostat(
+            SimulatedDevice(mac="00:1A:22:00:00:01"),
+            idle_timeout=0,
+            scheduler=scheduler,
+        )
+        await pushed.async_update()
+        self.assertTrue(pushed.pushing)
+        await asyncio.wait_for(polled.async_update(), 1)
+        # polled like the others until its next request reconnects
+        self.assertFalse(pushed.pushing)
+        self.assertEqual(pushed.diagnostics["connection"]["push_reclaims"], 1)
+        await pushed.async_update()
+        self.assertTrue(pushed.pushing)
+        pushed.shutdown()
+        polled.shutdown()
+
+    async def test_connection_events_are_coalesced(self):
+        device = SimulatedDevice()
+        th = simulated_thermostat(device, idle_timeout=10)
+        conn = th._conn
+        pushes = {"any": 0, "rssi": 0, "busy": 0}
+        conn.register_connection_callback(lambda: pushes.update(any=pushes["any"] + 1))
+        conn.register_connection_callback(
+            lambda: pushes.update(rssi=pushes["rssi"] + 1), FIELD_RSSI
+        )
+        conn.register_connection_callback(
+            lambda: pushes.update(busy=pushes["busy"] + 1), FIELD_BUSY
+        )
+        await th.async_update()
+        await th.async_update()
+        await asyncio.sleep(0)
+        self.assertEqual(pushes["rssi"], 1)
+        self.assertEqual(pushes["busy"], 4)  # taken and released per request
+        self.assertFalse(conn.connection_state["busy"])
+
+        pushed = conn.connection_pushes
+        for rssi in (-80, -70, -75):  # one push per loop tick
+            conn.rssi = rssi
+            conn._on_connection_event()
+        conn._on_connection_event()
+        await asyncio.sleep(0)
+        self.assertEqual(conn.connection_pushes, pushed + 1)
+        self.assertEqual(pushes["rssi"], 2)
+        conn._on_connection_event()  # nothing changed
+        await asyncio.sleep(0)
+        self.assertEqual(conn.connection_pushes, pushed + 1)
+        th.shutdown()
+
+    async def test_connection_events_min_interval(self):
+        th = simulated_thermostat(idle_timeout=10, min_event_interval=60)
+        conn = th._conn
+        pushes = []
+        conn.register_connection_callback(lambda: pushes.append(conn.connection_state))
+        await th.async_update()
+        await asyncio.sleep(0)
+        await th.async_update()
+        await asyncio.sleep(0)
+        self.assertEqual(len(pushes), 1)  # the rest waits for the interval
+        th.shutdown()
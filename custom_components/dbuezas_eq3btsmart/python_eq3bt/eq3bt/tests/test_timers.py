@@ -0,0 +1,71 @@
+from dataclasses import replace
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from eq3bt.state import ThermostatState
+from eq3bt.timers import DeviceTimers
+
+IDLE = ThermostatState(
+    target_temperature=21.0,
+    valve=0,
+    manual=False,
+    away=False,
+    boost=False,
+    dst=False,
+    window_open=False,
+    locked=False,
+    low_battery=False,
+    unknown=False,
+    window_open_temperature=12.0,
+    window_open_time=timedelta(minutes=15),
+)
+
+
+def at(state, received_at, **changes):
+    return replace(state, received_at=received_at, **changes)
+
+
+class TestDeviceTimers(TestCase):
+    def test_boost(self):
+        timers = DeviceTimers(boost_duration=300)
+        boosting = at(IDLE, 100, boost=True)
+        timers.observe(boosting, at(IDLE, 50))
+        timers.observe(at(boosting, 200), boosting)  # still the same boost
+        self.assertEqual(timers.next_end(), 400)
+        self.assertIs(timers.expire(boosting, 399, None), boosting)
+        ended = timers.expire(boosting, 400, None)
+        self.assertFalse(ended.boost)
+        self.assertEqual(ended.version, boosting.version + 1)
+        self.assertIsNone(timers.next_end())
+
+    def test_window_restores_temperature(self):
+        timers = DeviceTimers()
+        opened = at(IDLE, 100, window_open=True, target_temperature=12.0)
+        timers.observe(opened, at(IDLE, 50))
+        self.assertEqual(timers.next_end(), 100 + 15 * 60)
+        closed = timers.expire(opened, 100 + 15 * 60, None)
+        self.assertFalse(closed.window_open)
+        self.assertEqual(closed.target_temperature, 21.0)
+
+    def test_away_returns_to_schedule(self):
+        timers = DeviceTimers()
+        away = at(
+            IDLE,
+            100,
+            away=True,
+            manual=True,
+            away_end=datetime.now() + timedelta(hours=1),
+            target_temperature=12.0,
+        )
+        timers.observe(away, None)
+        self.assertAlmostEqual(timers.next_end(), 100 + 3600, delta=5)
+        back = timers.expire(away, 100 + 3600, 19.5)
+        self.assertEqual((back.away, back.manual, back.away_end), (False, False, None))
+        self.assertEqual(back.target_temperature, 19.5)
+
+    def test_stopped_on_device(self):
+        timers = DeviceTimers()
+        boosting = at(IDLE, 100, boost=True)
+        timers.observe(boosting, None)
+        timers.observe(at(IDLE, 150), boosting)
+        self.assertIsNone(timers.next_end())
@@ -0,0 +1,70 @@
+import random
+from datetime import datetime, time, timedelta
+from unittest import TestCase
+
+from eq3bt.simulator import SimulatedDevice
+from eq3bt.structures import HOUR_24_PLACEHOLDER, Schedule
+from eq3bt.weekschedule import DAY_END, WeekSchedule, encode_program, periods_of
+
+
+def random_program(rng: random.Random) -> bytes:
+    ends = sorted(rng.sample(range(1, 144), rng.randrange(0, 6))) + [144]
+    return bytes(byte for end in ends for byte in (rng.randrange(9, 60), end))
+
+
+class TestWeekSchedule(TestCase):
+    def test_lookup(self):
+        week = WeekSchedule()
+        self.assertIsNone(week.target_at(datetime(2024, 1, 1, 12)))
+        for day in range(7):
+            week.set_program(day, bytes([34, 36, 42, 138, 34, 144]))
+        monday = datetime(2024, 1, 1)
+        self.assertEqual(week.target_at(monday + timedelta(hours=5, minutes=59)), 17)
+        self.assertEqual(week.target_at(monday + timedelta(hours=6)), 21)
+        self.assertEqual(week.target_at(monday + timedelta(hours=23, minutes=59)), 17)
+        self.assertEqual(
+            week.next_change(monday + timedelta(hours=7)),
+            (monday + timedelta(hours=23), 17),
+        )
+        # the evening period goes on into the night of the next day
+        self.assertEqual(
+            week.next_change(monday + timedelta(hours=23)),
+            (monday + timedelta(days=1, hours=6), 21),
+        )
+        self.assertEqual(week.program(2), [(17, 360), (21, 1380), (17, DAY_END)])
+
+    def test_same_as_simulated_device(self):
+        rng = random.Random(7)
+        device = SimulatedDevice()
+        week = WeekSchedule()
+        for day in range(7):
+            device.schedule[day] = random_program(rng)
+            week.set_program(day, device.schedule[day])
+        for _ in range(2000):
+            at = datetime(2024, 1, 1) + timedelta(minutes=rng.randrange(7 * 1440))
+            self.assertEqual(week.target_at(at), device.scheduled_temperature(at))
+            when, temperature = week.next_change(at)
+            self.assertGreater(when, at)
+            self.assertEqual(week.target_at(when), temperature)
+            self.assertNotEqual(temperature, week.target_at(at))
+            self.assertEqual(
+                week.target_at(when - timedelta(minutes=1)), week.target_at(at)
+            )
+
+    def test_constant_week(self):
+        week = WeekSchedule()
+        for day in range(7):
+            week.set_program(day, bytes([40, 144]))
+        self.assertIsNone(week.next_change(datetime(2024, 1, 1, 12)))
+
+    def test_encode(self):
+        hours = [
+            {"target_temp": 19.5, "next_change_at": time(7, 30)},
+            {"target_temp": 16.0, "next_change_at": HOUR_24_PLACEHOLDER},
+        ]
+        periods = periods_of(hours)
+        self.assertEqual(periods, [(19.5, 450), (16.0, DAY_END)])
+        self.assertEqual(
+            bytes([0x10, 3]) + encode_program(periods),
+            Schedule.build({"cmd": "write", "day": 3, "hours": hours}),
+        )
@@ -0,0 +1,93 @@
+"""
+Local model of the timers the thermostat runs by itself.
+
+Boost ends after a fixed time, the open window mode after the configured
+window open time and away mode at its end. The thermostat doesn't tell when
+that happens, so the model predicts it from the status frames seen so far.
+"""
+from dataclasses import replace
+from datetime import datetime
+from typing import Any
+
+from .state import ThermostatState
+
+BOOST_DURATION = 300  # seconds, fixed by the firmware
+
+
+class DeviceTimers:
+    """Predicted ends of the running timers, in monotonic seconds."""
+
+    __slots__ = (
+        "boost_duration",
+        "boost_until",
+        "window_until",
+        "away_until",
+        "_temperature_before_window",
+    )
+
+    def __init__(self, boost_duration: float = BOOST_DURATION):
+        self.boost_duration = boost_duration
+        self.boost_until: float | None = None
+        self.window_until: float | None = None
+        self.away_until: float | None = None
+        self._temperature_before_window: float | None = None
+
+    def observe(self, state: ThermostatState, previous: ThermostatState | None):
+        """Start, keep or stop the timers for a new status.
+
+        A timer already running when first seen is assumed to have just
+        started, so its end is predicted late rather than early.
+        """
+        now = state.received_at
+        if not state.boost:
+            self.boost_until = None
+        elif self.boost_until is None or previous is None or not previous.boost:
+            self.boost_until = now + self.boost_duration
+
+        if not state.window_open or state.window_open_time is None:
+            self.window_until = None
+        elif self.window_until is None or previous is None or not previous.window_open:
+            self.window_until = now + state.window_open_time.total_seconds()
+            self._temperature_before_window = (
+                None if previous is None else previous.target_temperature
+            )
+
+        if not state.away or state.away_end is None:
+            self.away_until = None
+        else:
+            self.away_until = now + (state.away_end - datetime.now()).total_seconds()
+
+    def next_end(self) -> float | None:
+        """When the first running timer ends, None if none runs."""
+        ends = [
+            end
+            for end in (self.boost_until, self.window_until, self.away_until)
+            if end is not None
+        ]
+        return min(ends, default=None)
+
+    def expire(
+        self,
+        state: ThermostatState,
+        now: float,
+        scheduled_temperature: float | None,
+    ) -> ThermostatState:
+        """The state once the timers that ran out by now ended, like the
+        thermostat ends them, or the same state if none did."""
+        changes: dict[str, Any] = {}
+        if self.boost_until is not None and now >= self.boost_until:
+            self.boost_until = None
+            changes["boost"] = False
+        if self.window_until is not None and now >= self.window_until:
+            self.window_until = None
+            changes["window_open"] = False
+            if self._temperature_before_window is not None:
+                changes["target_temperature"] = self._temperature_before_window
+        if self.away_until is not None and now >= self.away_until:
+            self.away_until = None
+            changes.update(away=False, away_end=None, manual=False)
+            if scheduled_temperature is not None:
+                changes["target_temperature"] = scheduled_temperature
+        if not changes:
+            return state
+        return replace(state, version=state.version + 1, **changes)
@@ -0,0 +1,124 @@
+"""
+Day programs of the week, for looking up the scheduled target temperature.
+
+A day program is a list of (temperature, end) periods, end being the minute of
+the day the period ends at, 1440 (DAY_END) for the last one. That is also how
+the thermostat encodes them (temperature in half degrees, end in 10 minutes),
+so 24:00 needs no placeholder like the parsed Schedule structure uses.
+"""
+from array import array
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+from typing import Iterable
+
+from .structures import HOUR_24_PLACEHOLDER
+
+DAY_END = 24 * 60
+
+
+def eq3_day(weekday: int) -> int:
+    """The thermostat numbers days from saturday, datetime from monday."""
+    return (weekday + 2) % 7
+
+
+def encode_program(periods: Iterable[tuple[float, int]]) -> bytes:
+    """Pairs of a schedule frame of (temperature, end minute) periods."""
+    program = bytearray()
+    for temperature, end in periods:
+        program += bytes([int(temperature * 2), end // 10])
+        if end >= DAY_END:
+            break
+    return bytes(program)
+
+
+def periods_of(hours: Iterable[dict]) -> list[tuple[float, int]]:
+    """Periods of hours like Schedule.build takes them, next_change_at being a
+    time or HOUR_24_PLACEHOLDER."""
+    periods = []
+    for entry in hours:
+        until = entry["next_change_at"]
+        if until == HOUR_24_PLACEHOLDER:
+            end = DAY_END
+        else:
+            end = until.hour * 60 + until.minute
+        periods.append((entry["target_temp"], end))
+    return periods
+
+
+class WeekSchedule:
+    """Day programs of the week, by eq3 day.
+
+    Each day is kept as an array of the minutes its periods end at and the
+    half degree temperatures of the periods, lookups bisect the ends.
+    """
+
+    __slots__ = ("_ends", "_temperatures")
+
+    def __init__(self):
+        self._ends: list[array | None] = [None] * 7
+        self._temperatures: list[bytes | None] = [None] * 7
+
+    def set_program(self, day: int, program: bytes):
+        """Set a day from the pairs of a schedule frame."""
+        ends = array("H")
+        temperatures = bytearray()
+        for offset in range(0, len(program) - 1, 2):
+            temperatures.append(program[offset])
+            ends.append(min(program[offset + 1] * 10, DAY_END))
+            if ends[-1] == DAY_END:
+                break
+        if not ends:
+            self._ends[day] = self._temperatures[day] = None
+            return
+        ends[-1] = DAY_END  # the last period lasts until midnight
+        self._ends[day] = ends
+        self._temperatures[day] = bytes(temperatures)
+
+    def __contains__(self, day: int) -> bool:
+        return self._ends[day] is not None
+
+    def program(self, day: int) -> list[tuple[float, int]] | None:
+        """The (temperature, end minute) periods of a day, None if unknown."""
+        ends = self._ends[day]
+        temperatures = self._temperatures[day]
+        if ends is None or temperatures is None:
+            return None
+        return [(t / 2, end) for t, end in zip(temperatures, ends)]
+
+    def target_at(self, when: datetime) -> float | None:
+        """Scheduled target temperature at the given time, None if the day is
+        unknown."""
+        day = eq3_day(when.weekday())
+        ends = self._ends[day]
+        temperatures = self._temperatures[day]
+        if ends is None or temperatures is None:
+            return None
+        index = bisect_right(ends, when.hour * 60 + when.minute)
+        return temperatures[min(index, len(ends) - 1)] / 2
+
+    def next_change(self, when: datetime) -> tuple[datetime, float] | None:
+        """When the scheduled target temperature changes next after the given
+        time and to what, None if not known within the next week."""
+        weekday = when.weekday()
+        ends = self._ends[eq3_day(weekday)]
+        temperatures = self._temperatures[eq3_day(weekday)]
+        if ends is None or temperatures is None:
+            return None
+        index = bisect_right(ends, when.hour * 60 + when.minute)
+        current = temperatures[min(index, len(ends) - 1)]
+        midnight = datetime.combine(when.date(), time(), when.tzinfo)
+        for offset in range(8):
+            day = eq3_day(weekday + offset)
+            ends = self._ends[day]
+            temperatures = self._temperatures[day]
+            if ends is None or temperatures is None:
+                return None
+            first = index if offset == 0 else 0
+            for i in range(first, len(ends)):
+                if temperatures[i] != current:
+                    start = ends[i - 1] if i else 0
+                    return (
+                        midnight + timedelta(days=offset, minutes=start),
+                        temperatures[i] / 2,
+                    )
+        return None
@@ -1,16 +1,17 @@
-from .const import DOMAIN
-import asyncio
+from .const import DATA_COORDINATOR, DOMAIN
 import json
 import logging
 
 from homeassistant.helpers.device_registry import format_mac
+from .coordinator import CoordinatedEntity, ThermostatCoordinator
+from .python_eq3bt.eq3bt.bleakconnection import FIELD_RETRIES, FIELD_RSSI
 from .python_eq3bt.eq3bt.eq3btsmart import Thermostat
+from .python_eq3bt.eq3bt.state import FIELD_DEVICE_ID, FIELD_MODE, FIELD_VALVE
 from homeassistant.helpers.entity import DeviceInfo, EntityCategory
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
-from homeassistant.helpers import device_registry as dr
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -22,10 +23,11 @@ async def async_setup_entry(
 ) -> None:
     """Add sensors for passed config_entry in HA."""
     eq3 = hass.data[DOMAIN][config_entry.entry_id]
+    coordinator = hass.data[DOMAIN][DATA_COORDINATOR][config_entry.entry_id]
 
     new_devices = [
-        ValveSensor(eq3),
-        AwayEndSensor(eq3),
+        ValveSensor(eq3, coordinator),
+        AwayEndSensor(eq3, coordinator),
         RssiSensor(eq3),
         SerialNumberSensor(eq3),
         FirmwareVersionSensor(eq3),
@@ -52,10 +54,11 @@ class Base(SensorEntity):
         )
 
 
-class ValveSensor(Base):
-    def __init__(self, _thermostat: Thermostat):
+class ValveSensor(CoordinatedEntity, Base):
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
         super().__init__(_thermostat)
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+        self._coordinator = _coordinator
+        _thermostat.register_update_callback(self.schedule_update_ha_state, FIELD_VALVE)
         self._attr_name = "Valve"
         self._attr_native_unit_of_measurement = "%"
 
@@ -64,10 +67,11 @@ class ValveSensor(Base):
         return self._thermostat.valve_state
 
 
-class AwayEndSensor(Base):
-    def __init__(self, _thermostat: Thermostat):
+class AwayEndSensor(CoordinatedEntity, Base):
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
         super().__init__(_thermostat)
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+        self._coordinator = _coordinator
+        _thermostat.register_update_callback(self.schedule_update_ha_state, FIELD_MODE)
         self._attr_name = "Away until"
         self._attr_device_class = "date"
 
@@ -79,7 +83,9 @@ class AwayEndSensor(Base):
 class RssiSensor(Base):
     def __init__(self, _thermostat: Thermostat):
         super().__init__(_thermostat)
-        _thermostat._conn.register_connection_callback(self.schedule_update_ha_state)
+        _thermostat._conn.register_connection_callback(
+            self.schedule_update_ha_state, FIELD_RSSI
+        )
         self._attr_name = "Rssi"
         self._attr_native_unit_of_measurement = "dBm"
         self._attr_entity_category = EntityCategory.DIAGNOSTIC
@@ -92,7 +98,9 @@ class RssiSensor(Base):
 class SerialNumberSensor(Base):
     def __init__(self, _thermostat: Thermostat):
         super().__init__(_thermostat)
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+        _thermostat.register_update_callback(
+            self.schedule_update_ha_state, FIELD_DEVICE_ID
+        )
         self._attr_name = "Serial"
         self._attr_entity_category = EntityCategory.DIAGNOSTIC
 
@@ -104,32 +112,12 @@ class SerialNumberSensor(Base):
 class FirmwareVersionSensor(Base):
     def __init__(self, _thermostat: Thermostat):
         super().__init__(_thermostat)
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+        _thermostat.register_update_callback(
+            self.schedule_update_ha_state, FIELD_DEVICE_ID
+        )
         self._attr_name = "Firmware Version"
         self._attr_entity_category = EntityCategory.DIAGNOSTIC
 
-    async def async_added_to_hass(self) -> None:
-        _LOGGER.debug("[%s] adding", self._thermostat.name)
-        asyncio.get_event_loop().create_task(self.fetch_serial())
-
-    async def fetch_serial(self):
-        await self._thermostat.async_query_id()
-        device_registry = dr.async_get(self.hass)
-        device = device_registry.async_get_device(
-            identifiers={(DOMAIN, self._thermostat.mac)},
-        )
-        if device:
-            device_registry.async_update_device(
-                device_id=device.id, sw_version=self._thermostat.firmware_version
-            )
-
-        _LOGGER.debug(
-            "[%s] firmware: %s serial: %s",
-            self._thermostat.name,
-            self._thermostat.firmware_version,
-            self._thermostat.device_serial,
-        )
-
     @property
     def state(self):
         return self._thermostat.firmware_version
@@ -149,7 +137,9 @@ class MacSensor(Base):
 class RetriesSensor(Base):
     def __init__(self, _thermostat: Thermostat):
         super().__init__(_thermostat)
-        _thermostat._conn.register_connection_callback(self.schedule_update_ha_state)
+        _thermostat._conn.register_connection_callback(
+            self.schedule_update_ha_state, FIELD_RETRIES
+        )
         self._attr_name = "Retries"
         self._attr_entity_category = EntityCategory.DIAGNOSTIC
 
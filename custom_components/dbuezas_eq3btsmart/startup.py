@@ -0,0 +1,185 @@
+"""
+Staggered first contact with the thermostats after Home Assistant starts.
+
+Connecting to the whole fleet at once makes the connections starve each other
+and most thermostats end up unavailable for minutes. Instead, each thermostat
+is contacted at its own time within a window after start, the ones that
+answered reliably and with a strong signal first, and only a few of them at
+once.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from time import monotonic
+from typing import Awaitable, Callable
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+from .const import DOMAIN, STARTUP_CONNECTIONS
+from .coordinator import ThermostatCoordinator
+
+STARTUP_GRACE = 10  # seconds to wait for the other entries before planning
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def startup_rank(link: dict) -> tuple:
+    """Sort key of a thermostat by what is known of its link, best first and
+    the ones never seen last."""
+    success_rate = link.get("success_rate")
+    rssi = link.get("rssi")
+    return (
+        success_rate is None,
+        -round(success_rate or 0, 1),
+        rssi is None,
+        -(rssi or 0),
+    )
+
+
+@dataclass
+class PlannedStart:
+    """First contact with a thermostat."""
+
+    coordinator: ThermostatCoordinator
+    first_contact: Callable[[], Awaitable[None]]
+    window: float  # seconds after start it should be done by
+    link: dict  # last known rssi and success_rate, see ThermostatStorage
+    # what else to query, after the startup connection is given back
+    follow_up: Callable[[], Awaitable[None]] | None = None
+    delay: float | None = None  # seconds after planning, None until planned
+    handle: CALLBACK_TYPE | None = None
+    remove_listener: CALLBACK_TYPE | None = None
+
+
+class StartupPlanner:
+    """Plans the first contact of all thermostats, shared by the entries.
+
+    The entries set up at start are collected until all of them are there, or
+    for STARTUP_GRACE seconds, and then spread over their window in rank order,
+    each at a random time within its share. Entries set up later, e.g. when
+    reloaded, are contacted right away.
+    """
+
+    def __init__(self, hass: HomeAssistant, connections: int = STARTUP_CONNECTIONS):
+        self.hass = hass
+        self.started = monotonic()
+        self._connections = asyncio.Semaphore(connections)
+        self._starts: dict[str, PlannedStart] = {}
+        self._planned = False
+        self._grace_handle: CALLBACK_TYPE | None = None
+        # seconds after start until each entry was available, and all of them
+        self.available_after: dict[str, float] = {}
+        self.all_available_after: float | None = None
+
+    @callback
+    def async_add(
+        self,
+        entry_id: str,
+        coordinator: ThermostatCoordinator,
+        first_contact: Callable[[], Awaitable[None]],
+        window: float,
+        link: dict,
+        follow_up: Callable[[], Awaitable[None]] | None = None,
+    ):
+        """Plan the first contact of the thermostat of an entry.
+
+        first_contact is awaited while holding one of the startup connections,
+        follow_up right after giving it back, so the next thermostat isn't kept
+        waiting for more than the status. Both must handle their errors.
+        """
+        start = PlannedStart(coordinator, first_contact, window, link, follow_up)
+        self._starts[entry_id] = start
+        if entry_id not in self.available_after:
+            start.remove_listener = coordinator.async_add_listener(
+                lambda: self._on_coordinator_changed(entry_id)
+            )
+        if self._planned:
+            self._schedule(entry_id, 0)
+        elif len(self._starts) >= self._expected_entries():
+            self._plan()
+        elif self._grace_handle is None:
+            self._grace_handle = async_call_later(self.hass, STARTUP_GRACE, self._plan)
+
+    @callback
+    def async_remove(self, entry_id: str):
+        """Forget an unloaded entry."""
+        start = self._starts.pop(entry_id, None)
+        if start is None:
+            return
+        if start.handle is not None:
+            start.handle()
+        if start.remove_listener is not None:
+            start.remove_listener()
+
+    def _expected_entries(self) -> int:
+        return sum(
+            1
+            for entry in self.hass.config_entries.async_entries(DOMAIN)
+            if entry.disabled_by is None
+        )
+
+    @callback
+    def _plan(self, now=None):
+        if self._grace_handle is not None:
+            self._grace_handle()
+            self._grace_handle = None
+        self._planned = True
+        ranked = sorted(
+            self._starts, key=lambda entry: startup_rank(self._starts[entry].link)
+        )
+        for rank, entry_id in enumerate(ranked):
+            window = self._starts[entry_id].window
+            self._schedule(entry_id, window * (rank + random.random()) / len(ranked))
+
+    @callback
+    def _schedule(self, entry_id: str, delay: float):
+        start = self._starts[entry_id]
+        start.delay = delay
+        _LOGGER.debug(
+            "[%s] first contact in %ss", start.coordinator.thermostat.name, round(delay)
+        )
+
+        async def contact(now=None):
+            start.handle = None
+            async with self._connections:
+                if self._starts.get(entry_id) is not start:
+                    return
+                await start.first_contact()
+            if start.follow_up is not None and self._starts.get(entry_id) is start:
+                await start.follow_up()
+
+        start.handle = async_call_later(self.hass, delay, contact)
+
+    @callback
+    def _on_coordinator_changed(self, entry_id: str):
+        start = self._starts[entry_id]
+        if not start.coordinator.available or start.coordinator.restored:
+            return
+        start.remove_listener()
+        start.remove_listener = None
+        self.available_after[entry_id] = monotonic() - self.started
+        if self.all_available_after is None and all(
+            other in self.available_after for other in self._starts
+        ):
+            self.all_available_after = max(self.available_after.values())
+            _LOGGER.info(
+                "All %s thermostats available %ss after start",
+                len(self._starts),
+                round(self.all_available_after),
+            )
+
+    def diagnostics(self, entry_id: str) -> dict:
+        """Startup of an entry and the fleet, used by the integration
+        diagnostics."""
+        start = self._starts.get(entry_id)
+        return {
+            "window": start and start.window,
+            "delay": start and start.delay,
+            "link": start and start.link,
+            "available_after": self.available_after.get(entry_id),
+            "all_available_after": self.all_available_after,
+        }
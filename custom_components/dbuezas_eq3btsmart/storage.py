@@ -0,0 +1,101 @@
+"""Persists what each thermostat reported across restarts, keyed by its MAC."""
+from __future__ import annotations
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import CALLBACK_TYPE, Event, HomeAssistant, callback
+from homeassistant.helpers.device_registry import format_mac
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+from .coordinator import ThermostatCoordinator
+from .python_eq3bt.eq3bt.bleakconnection import FIELD_RSSI
+from .python_eq3bt.eq3bt.eq3btsmart import Thermostat
+from .python_eq3bt.eq3bt.state import (
+    FIELD_DEVICE_ID,
+    FIELD_MODE,
+    FIELD_PRESETS,
+    FIELD_SCHEDULE,
+    FIELD_TARGET_TEMPERATURE,
+    FIELD_VALVE,
+)
+
+STORAGE_VERSION = 1
+SAVE_DELAY = 10  # seconds, changes in between are saved together
+
+
+class ThermostatStorage:
+    """Storage of one thermostat, restored into it at setup and saved on changes."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        thermostat: Thermostat,
+        coordinator: ThermostatCoordinator,
+    ):
+        self.hass = hass
+        self._thermostat = thermostat
+        self._coordinator = coordinator
+        self._remove_stop_listener: CALLBACK_TYPE | None = None
+        # last known rssi and poll success rate, see startup.StartupPlanner
+        self.link: dict = {}
+        self._store = Store(
+            hass, STORAGE_VERSION, f"{DOMAIN}.{format_mac(thermostat.mac)}"
+        )
+
+    async def async_load(self) -> None:
+        """Restore the stored data into the thermostat and save its changes from
+        now on."""
+        data = await self._store.async_load() or {}
+        self._thermostat.restore_status(data.get("status"))
+        self._thermostat.restore_schedule(data.get("schedule", []))
+        self._thermostat.restore_device_id(data.get("device_id"))
+        self.link = data.get("link", {})
+        self._coordinator.success_rate = self.link.get("success_rate")
+        self._thermostat.register_update_callback(
+            self._on_changed,
+            FIELD_VALVE,
+            FIELD_TARGET_TEMPERATURE,
+            FIELD_MODE,
+            FIELD_PRESETS,
+            FIELD_SCHEDULE,
+            FIELD_DEVICE_ID,
+        )
+        self._thermostat._conn.register_connection_callback(
+            self._on_changed, FIELD_RSSI
+        )
+        # failed polls make it unavailable, so bad links are saved soon
+        self._coordinator.async_add_listener(self._on_changed)
+        # unchanged statuses aren't saved, but when the last one was received is
+        self._remove_stop_listener = self.hass.bus.async_listen_once(
+            EVENT_HOMEASSISTANT_STOP, self._on_stop
+        )
+
+    @callback
+    def _on_changed(self) -> None:
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _on_stop(self, event: Event) -> None:
+        self._remove_stop_listener = None
+        # written by the store before Home Assistant stops
+        self._store.async_delay_save(self._data_to_save, 0)
+
+    @callback
+    def _data_to_save(self) -> dict:
+        rssi = self._thermostat._conn.rssi
+        return {
+            "status": self._thermostat.status_snapshot(),
+            "schedule": self._thermostat.schedule_snapshot(),
+            "device_id": self._thermostat.device_id_snapshot(),
+            "link": {
+                "rssi": self.link.get("rssi") if rssi is None else rssi,
+                "success_rate": self._coordinator.success_rate,
+            },
+        }
+
+    async def async_unload(self) -> None:
+        """Save right away and stop saving, when the entry is unloaded."""
+        if self._remove_stop_listener is not None:
+            self._remove_stop_listener()
+            self._remove_stop_listener = None
+        await self._store.async_save(self._data_to_save())
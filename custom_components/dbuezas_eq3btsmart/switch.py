@@ -1,8 +1,11 @@
-from .const import DOMAIN
+from .const import DATA_COORDINATOR, DOMAIN
 import logging
 
 from homeassistant.helpers.device_registry import format_mac
+from .coordinator import CoordinatedEntity, ThermostatCoordinator
+from .python_eq3bt.eq3bt.bleakconnection import FIELD_CONNECTED
 from .python_eq3bt.eq3bt.eq3btsmart import Mode, Thermostat
+from .python_eq3bt.eq3bt.state import FIELD_MODE
 from homeassistant.helpers.entity import DeviceInfo, EntityCategory
 from homeassistant.components.switch import SwitchEntity
 from datetime import datetime, timedelta
@@ -19,8 +22,13 @@ async def async_setup_entry(
     async_add_entities: AddEntitiesCallback,
 ) -> None:
     eq3 = hass.data[DOMAIN][config_entry.entry_id]
+    coordinator = hass.data[DOMAIN][DATA_COORDINATOR][config_entry.entry_id]
 
-    new_devices = [LockedSwitch(eq3), AwaySwitch(eq3), ConnectionSwitch(eq3)]
+    new_devices = [
+        LockedSwitch(eq3, coordinator),
+        AwaySwitch(eq3, coordinator),
+        ConnectionSwitch(eq3),
+    ]
 
     async_add_entities(new_devices)
 
@@ -42,10 +50,11 @@ class Base(SwitchEntity):
         )
 
 
-class LockedSwitch(Base):
-    def __init__(self, _thermostat: Thermostat):
+class LockedSwitch(CoordinatedEntity, Base):
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
         super().__init__(_thermostat)
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+        self._coordinator = _coordinator
+        _thermostat.register_update_callback(self.schedule_update_ha_state, FIELD_MODE)
         self._attr_name = "Locked"
         self._attr_icon = "mdi:lock"
 
@@ -60,10 +69,11 @@ class LockedSwitch(Base):
         return self._thermostat.locked
 
 
-class AwaySwitch(Base):
-    def __init__(self, _thermostat: Thermostat):
+class AwaySwitch(CoordinatedEntity, Base):
+    def __init__(self, _thermostat: Thermostat, _coordinator: ThermostatCoordinator):
         super().__init__(_thermostat)
-        _thermostat.register_update_callback(self.schedule_update_ha_state)
+        self._coordinator = _coordinator
+        _thermostat.register_update_callback(self.schedule_update_ha_state, FIELD_MODE)
         self._attr_name = "Away"
         self._attr_icon = "mdi:lock"
 
@@ -81,7 +91,9 @@ class AwaySwitch(Base):
 class ConnectionSwitch(Base):
     def __init__(self, _thermostat: Thermostat):
         super().__init__(_thermostat)
-        _thermostat._conn.register_connection_callback(self.schedule_update_ha_state)
+        _thermostat._conn.register_connection_callback(
+            self.schedule_update_ha_state, FIELD_CONNECTED
+        )
         self._attr_name = "Connection"
         self._attr_icon = "mdi:bluetooth"
         self._attr_assumed_state = True
@@ -91,8 +103,7 @@ class ConnectionSwitch(Base):
         await self._thermostat._conn.async_make_request("ONLY CONNECT")
 
     async def async_turn_off(self):
-        if self._thermostat._conn._conn:
-            await self._thermostat._conn._conn.disconnect()
+        await self._thermostat._conn.async_disconnect()
 
     @property
     def is_on(self):